@@ -1,16 +1,47 @@
 import multiprocessing
+import os
+import shutil
 
 from gunicorn import glogging
+from uvicorn.workers import UvicornWorker
 
-bind = '0.0.0.0:8000'
-worker_class = 'uvicorn.workers.UvicornWorker'
-# workers = multiprocessing.cpu_count() * 2 + 1
-workers = 1
-reload = True
-preload = True
+# Workers write their metrics into this directory and /metrics aggregates them, it has to be set before the app import.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+
+class ConfiguredUvicornWorker(UvicornWorker):
+    # `auto` picks uvloop and httptools when they are installed, the env allows pinning the pure Python ones.
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "loop": os.getenv("UVICORN_LOOP", "auto"),
+        "http": os.getenv("UVICORN_HTTP", "auto"),
+    }
+
+
+bind = os.getenv("GUNICORN_BIND", '0.0.0.0:8000')
+worker_class = ConfiguredUvicornWorker
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+reload = bool(os.getenv("GUNICORN_RELOAD", ""))
+# The app isn't preloaded by default, so every worker imports it and builds its clients in its own lifespan
+# instead of inheriting anything created in the master process.
+preload_app = bool(os.getenv("GUNICORN_PRELOAD_APP", ""))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
 
 accesslog = '-'
 
 logging_format = '%(asctime)s [%(levelname)s] %(message)s'
 glogging.Logger.access_fmt = logging_format
 glogging.Logger.error_fmt = logging_format
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,22 +1,53 @@
-from typing import Annotated
+import json
+from typing import Annotated, Any, AsyncIterator, Callable
 
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
 
 from api.schemas import (
     CandidateInfoSchema, GeneratedQuestionsSchema, CandidateResponseSchema, ResponseEvaluationSchema,
-    ValidationResultSchema,
+    ValidationResultSchema, QuestionsCacheStatsSchema, BatchEvaluationRequestSchema, BatchEvaluationSchema,
+    BatchEvaluationItemSchema, BatchJobCreateSchema, BatchJobSchema, PersistenceQueueStatsSchema,
+    LLMSchedulerStatsSchema, ReadinessSchema, HTTPPoolStatsSchema, JobSchema,
 )
 from dependencies import Stub
-from services import GenerateQuestionsService, EvaluateResponsesService, ValidationService
+from dto import BatchJob, Job, SharedContextCandidateFullInfo, StreamEvent
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.jobs import get_job_body
+from infrastructure.llm_scheduler import LLMScheduler, LLMSchedulerOverloadedError
+from infrastructure.metrics import generate_metrics
+from infrastructure.persistence_queue import PersistenceQueue
+from infrastructure.questions_cache import QuestionsCache
+from infrastructure.prompts import PromptTooLongError
+from infrastructure.shared_context import SharedContextConflictError
+from infrastructure.structured_output import StructuredOutputError
+from services import (
+    GenerateQuestionsService, EvaluateResponsesService, ValidationService, BatchJobsService, JobsService,
+)
 
 router = APIRouter()
+metrics_router = APIRouter()
 
 
-@router.get("/generate_questions", response_model=GeneratedQuestionsSchema)
+@router.get("/generate_questions", response_model=GeneratedQuestionsSchema, responses={202: {"model": JobSchema}})
 async def generate_questions(
+        request: Request,
         candidate_info: CandidateInfoSchema,
+        prefer: Annotated[str | None, Header()] = None,
+        callback_url: Annotated[str | None, Header()] = None,
         generate_questions_service: GenerateQuestionsService = Depends(Stub(GenerateQuestionsService)),
+        jobs_service: JobsService = Depends(Stub(JobsService)),
 ):
+    if _is_respond_async_preferred(prefer):
+        job = await jobs_service.submit(
+            JobsService.QUESTIONS,
+            callback_url,
+            first_name=candidate_info.first_name,
+            second_name=candidate_info.second_name,
+            job_title=candidate_info.job_title,
+        )
+        return _get_job_accepted_response(request, job)
     generated_questions_result = await generate_questions_service.generate_questions(
         candidate_info.first_name, candidate_info.second_name, candidate_info.job_title,
     )
@@ -26,22 +57,209 @@ async def generate_questions(
     )
 
 
-@router.post("/evaluate_responses", response_model=ResponseEvaluationSchema)
+@router.post("/evaluate_responses", response_model=ResponseEvaluationSchema, responses={202: {"model": JobSchema}})
 async def evaluate_responses(
+        request: Request,
         response: CandidateResponseSchema,
         candidate_id: Annotated[str | None, Header()] = None,
+        prefer: Annotated[str | None, Header()] = None,
+        callback_url: Annotated[str | None, Header()] = None,
         response_evaluation_service: EvaluateResponsesService = Depends(Stub(EvaluateResponsesService)),
+        jobs_service: JobsService = Depends(Stub(JobsService)),
 ):
+    if _is_respond_async_preferred(prefer):
+        job = await jobs_service.submit(
+            JobsService.EVALUATION, callback_url, candidate_id=candidate_id, response=response.response,
+        )
+        return _get_job_accepted_response(request, job)
     result = await response_evaluation_service.evaluate_response(candidate_id, response.response)
     return ResponseEvaluationSchema(scores=result)
 
 
-@router.post("/validate_scores", response_model=ValidationResultSchema)
+@router.post("/evaluate_responses/batch", response_model=BatchEvaluationSchema)
+async def evaluate_responses_batch(
+        request: BatchEvaluationRequestSchema,
+        response_evaluation_service: EvaluateResponsesService = Depends(Stub(EvaluateResponsesService)),
+):
+    results = await response_evaluation_service.evaluate_responses_batch(request.candidate_ids)
+    return BatchEvaluationSchema(
+        results=[
+            BatchEvaluationItemSchema(
+                candidate_id=result.candidate_id,
+                success=result.error is None,
+                scores=result.scores,
+                error=result.error,
+            )
+            for result in results
+        ],
+    )
+
+
+@router.post("/validate_scores", response_model=ValidationResultSchema, responses={202: {"model": JobSchema}})
 async def validate_scores(
+        request: Request,
         candidate_id: Annotated[str | None, Header()] = None,
+        prefer: Annotated[str | None, Header()] = None,
+        callback_url: Annotated[str | None, Header()] = None,
         validation_service: ValidationService = Depends(Stub(ValidationService)),
+        jobs_service: JobsService = Depends(Stub(JobsService)),
 ):
+    if _is_respond_async_preferred(prefer):
+        job = await jobs_service.submit(JobsService.VALIDATION, callback_url, candidate_id=candidate_id)
+        return _get_job_accepted_response(request, job)
     result = await validation_service.validate(candidate_id)
+    return _get_validation_result_schema(result)
+
+
+@router.get("/generate_questions/stream")
+async def stream_generate_questions(
+        candidate_info: CandidateInfoSchema,
+        generate_questions_service: GenerateQuestionsService = Depends(Stub(GenerateQuestionsService)),
+):
+    events = generate_questions_service.stream_questions(
+        candidate_info.first_name, candidate_info.second_name, candidate_info.job_title,
+    )
+    server_sent_events = _to_server_sent_events(
+        events, lambda result: GeneratedQuestionsSchema(candidate_id=result.candidate_id, questions=result.questions),
+    )
+    return StreamingResponse(server_sent_events, media_type="text/event-stream")
+
+
+@router.post("/evaluate_responses/stream")
+async def stream_evaluate_responses(
+        response: CandidateResponseSchema,
+        candidate_id: Annotated[str | None, Header()] = None,
+        response_evaluation_service: EvaluateResponsesService = Depends(Stub(EvaluateResponsesService)),
+):
+    events = response_evaluation_service.stream_evaluation(candidate_id, response.response)
+    server_sent_events = _to_server_sent_events(events, lambda result: ResponseEvaluationSchema(scores=result))
+    return StreamingResponse(server_sent_events, media_type="text/event-stream")
+
+
+@router.post("/validate_scores/stream")
+async def stream_validate_scores(
+        candidate_id: Annotated[str | None, Header()] = None,
+        validation_service: ValidationService = Depends(Stub(ValidationService)),
+):
+    events = validation_service.stream_validation(candidate_id)
+    server_sent_events = _to_server_sent_events(events, _get_validation_result_schema)
+    return StreamingResponse(server_sent_events, media_type="text/event-stream")
+
+
+@router.get("/questions_cache/stats", response_model=QuestionsCacheStatsSchema)
+async def questions_cache_stats(questions_cache: QuestionsCache = Depends(Stub(QuestionsCache))):
+    stats = await questions_cache.get_stats()
+    return QuestionsCacheStatsSchema(hits=stats.hits, local_hits=stats.local_hits, misses=stats.misses)
+
+
+@router.get("/persistence_queue/stats", response_model=PersistenceQueueStatsSchema)
+async def persistence_queue_stats(persistence_queue: PersistenceQueue = Depends(Stub(PersistenceQueue))):
+    stats = await persistence_queue.get_stats()
+    return PersistenceQueueStatsSchema(
+        depth=stats.depth,
+        pending=stats.pending,
+        lag=stats.lag,
+        dead_letters=stats.dead_letters,
+        oldest_entry_age_seconds=stats.oldest_entry_age_seconds,
+    )
+
+
+@router.get("/llm_scheduler/stats", response_model=LLMSchedulerStatsSchema)
+async def llm_scheduler_stats(scheduler: LLMScheduler = Depends(Stub(LLMScheduler))):
+    stats = scheduler.get_stats()
+    return LLMSchedulerStatsSchema(
+        in_flight=stats.in_flight,
+        queued=stats.queued,
+        concurrency_limit=stats.concurrency_limit,
+        queue_wait_seconds=stats.queue_wait_seconds,
+        latency_seconds=stats.latency_seconds,
+        remaining_requests=stats.remaining_requests,
+        remaining_tokens=stats.remaining_tokens,
+        shed=stats.shed,
+        retries=stats.retries,
+        throttled=stats.throttled,
+    )
+
+
+@router.get("/http_pools/stats", response_model=list[HTTPPoolStatsSchema])
+async def http_pools_stats(connection_pools: ConnectionPools = Depends(Stub(ConnectionPools))):
+    return [
+        HTTPPoolStatsSchema(
+            name=stats.name,
+            max_connections=stats.max_connections,
+            in_flight=stats.in_flight,
+            peak_in_flight=stats.peak_in_flight,
+            queued=stats.queued,
+            requests=stats.requests,
+            connections_created=stats.connections_created,
+        )
+        for stats in connection_pools.get_http_pools_stats()
+    ]
+
+
+@router.post("/batch_jobs", response_model=BatchJobSchema)
+async def create_batch_job(
+        request: BatchJobCreateSchema,
+        batch_jobs_service: BatchJobsService = Depends(Stub(BatchJobsService)),
+):
+    job = await batch_jobs_service.create_job(request.kind, request.candidate_ids)
+    return _get_batch_job_schema(job)
+
+
+@router.get("/batch_jobs/{job_id}", response_model=BatchJobSchema)
+async def poll_batch_job(job_id: str, batch_jobs_service: BatchJobsService = Depends(Stub(BatchJobsService))):
+    job = await batch_jobs_service.poll_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return _get_batch_job_schema(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobSchema)
+async def get_job(job_id: str, jobs_service: JobsService = Depends(Stub(JobsService))):
+    job = await jobs_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobSchema(**get_job_body(job))
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    data, content_type = generate_metrics()
+    return Response(content=data, media_type=content_type)
+
+
+@metrics_router.get("/ready", response_model=ReadinessSchema, include_in_schema=False)
+async def ready(connection_pools: ConnectionPools = Depends(Stub(ConnectionPools))):
+    readiness = ReadinessSchema(ready=connection_pools.ready, connection_pools=connection_pools.get_status())
+    return JSONResponse(status_code=200 if readiness.ready else 503, content=readiness.model_dump())
+
+
+def _get_batch_job_schema(job: BatchJob) -> BatchJobSchema:
+    return BatchJobSchema(
+        job_id=job.job_id,
+        kind=job.kind,
+        status=job.status,
+        candidate_ids=job.candidate_ids,
+        failed_candidate_ids=job.failed_candidate_ids,
+    )
+
+
+def _is_respond_async_preferred(prefer: str | None) -> bool:
+    """Whether the `Prefer` header asks for an asynchronous job instead of waiting for the result, RFC 7240."""
+    if not prefer:
+        return False
+    return any(preference.split(";")[0].strip().lower() == "respond-async" for preference in prefer.split(","))
+
+
+def _get_job_accepted_response(request: Request, job: Job) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content=JobSchema(**get_job_body(job)).model_dump(),
+        headers={"Location": str(request.url_for("get_job", job_id=job.job_id)), "Preference-Applied": "respond-async"},
+    )
+
+
+def _get_validation_result_schema(result: SharedContextCandidateFullInfo) -> ValidationResultSchema:
     return ValidationResultSchema(
         questions=result.questions,
         response=result.candidate_response,
@@ -49,3 +267,23 @@ async def validate_scores(
         comments=result.response_comments,
         feedback=result.feedback,
     )
+
+
+async def _to_server_sent_events(
+        events: AsyncIterator[StreamEvent],
+        get_result_schema: Callable[[Any], BaseModel],
+) -> AsyncIterator[str]:
+    try:
+        async for event in events:
+            if event.event == "result":
+                data = get_result_schema(event.data).model_dump_json()
+            else:
+                data = json.dumps(event.data)
+            yield f"event: {event.event}\ndata: {data}\n\n"
+    except LLMSchedulerOverloadedError as e:
+        # The response status is already sent at this point, so overloading is reported as the last event.
+        yield f"event: error\ndata: {json.dumps({'detail': str(e), 'retry_after': e.retry_after})}\n\n"
+    except StructuredOutputError as e:
+        yield f"event: error\ndata: {json.dumps({'detail': f'Invalid LLM output: {e}'})}\n\n"
+    except (SharedContextConflictError, PromptTooLongError) as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
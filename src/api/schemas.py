@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
@@ -31,3 +33,83 @@ class ValidationResultSchema(ResponseEvaluationSchema):
     scores: list[int]
     comments: list[str]
     feedback: str
+
+
+class QuestionsCacheStatsSchema(BaseModel):
+    hits: int
+    local_hits: int
+    misses: int
+
+
+class PersistenceQueueStatsSchema(BaseModel):
+    depth: int
+    pending: int
+    lag: int
+    dead_letters: int
+    oldest_entry_age_seconds: float
+
+
+class LLMSchedulerStatsSchema(BaseModel):
+    in_flight: int
+    queued: int
+    concurrency_limit: float
+    queue_wait_seconds: float
+    latency_seconds: float
+    remaining_requests: int | None
+    remaining_tokens: int | None
+    shed: int
+    retries: int
+    throttled: int
+
+
+class HTTPPoolStatsSchema(BaseModel):
+    name: str
+    max_connections: int
+    in_flight: int
+    peak_in_flight: int
+    queued: int
+    requests: int
+    connections_created: int
+
+
+class BatchEvaluationRequestSchema(BaseModel):
+    candidate_ids: list[str]
+
+
+class BatchEvaluationItemSchema(BaseModel):
+    candidate_id: str
+    success: bool
+    scores: list[ScoreAndCommentSchema] | None = None
+    error: str | None = None
+
+
+class BatchEvaluationSchema(BaseModel):
+    results: list[BatchEvaluationItemSchema]
+
+
+class BatchJobCreateSchema(BaseModel):
+    kind: Literal["evaluation", "validation"]
+    candidate_ids: list[str]
+
+
+class BatchJobSchema(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    candidate_ids: list[str]
+    failed_candidate_ids: list[str]
+
+
+class JobSchema(BaseModel):
+    job_id: str
+    queue: str
+    status: str
+    result: dict | None
+    error: str | None
+    created_at: float
+    finished_at: float | None
+
+
+class ReadinessSchema(BaseModel):
+    ready: bool
+    connection_pools: dict[str, bool]
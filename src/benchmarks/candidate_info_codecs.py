@@ -0,0 +1,90 @@
+"""
+Compares bytes per session and encode/decode time of the shared context codecs against the legacy layout,
+where every field was a separate hash field and lists were stored as separate JSON strings.
+
+Run from the `src` directory: `python -m benchmarks.candidate_info_codecs`.
+"""
+import json
+import timeit
+
+from dto import SharedContextCandidateFullInfo
+from infrastructure.codecs import CODECS, decode_candidate_info, encode_candidate_info
+
+CANDIDATE_INFO = SharedContextCandidateFullInfo(
+    candidate_id="9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+    first_name="Jane",
+    second_name="Doe",
+    job_title="Backend Developer",
+    questions=[
+        "1. How would you design a rate limiter for a public REST API serving millions of requests per day?",
+        "2. Explain the differences between optimistic and pessimistic locking and when you would use each.",
+        "3. How do you find and fix a memory leak in a long running Python service?",
+    ],
+    candidate_response=(
+        "I would use a token bucket per API key stored in Redis with atomic Lua scripts. Optimistic locking uses "
+        "versions and retries on conflicts, it is better for rare conflicts, pessimistic locking holds row locks "
+        "and suits hot rows. For memory leaks I would take tracemalloc snapshots, compare them and look at the "
+        "biggest growing allocations, then check caches and global registries that never evict entries."
+    ),
+    scores=[4, 5, 3],
+    response_comments=[
+        "Good approach with a token bucket, but no mention of distributed clock issues.",
+        "Clear and accurate comparison with appropriate use cases.",
+        "Reasonable process, could mention objgraph or heap dumps for native leaks.",
+    ],
+    feedback="Good",
+)
+
+
+def encode_legacy(candidate_info: SharedContextCandidateFullInfo) -> dict[bytes, bytes]:
+    return {
+        b"first_name": candidate_info.first_name.encode(),
+        b"second_name": candidate_info.second_name.encode(),
+        b"job_title": candidate_info.job_title.encode(),
+        b"questions": json.dumps(candidate_info.questions).encode(),
+        b"candidate_response": candidate_info.candidate_response.encode(),
+        b"scores": json.dumps(candidate_info.scores).encode(),
+        b"response_comments": json.dumps(candidate_info.response_comments).encode(),
+        b"feedback": candidate_info.feedback.encode(),
+    }
+
+
+def decode_legacy(candidate_id: str, info: dict[bytes, bytes]) -> SharedContextCandidateFullInfo:
+    return SharedContextCandidateFullInfo(
+        candidate_id=candidate_id,
+        first_name=info[b"first_name"].decode(),
+        second_name=info[b"second_name"].decode(),
+        job_title=info[b"job_title"].decode(),
+        questions=json.loads(info[b"questions"]),
+        candidate_response=info[b"candidate_response"].decode(),
+        scores=json.loads(info[b"scores"]),
+        response_comments=json.loads(info[b"response_comments"]),
+        feedback=info[b"feedback"].decode(),
+    )
+
+
+def measure_us(func, iterations: int) -> float:
+    return min(timeit.repeat(func, number=iterations, repeat=5)) / iterations * 1_000_000
+
+
+def main(iterations: int = 20000):
+    legacy_info = encode_legacy(CANDIDATE_INFO)
+    legacy_bytes = sum(len(field) + len(value) for field, value in legacy_info.items())
+    print(f"{'layout':<14} {'bytes/session':>14} {'encode us':>10} {'decode us':>10}")
+    print(
+        f"{'legacy hash':<14} {legacy_bytes:>14} "
+        f"{measure_us(lambda: encode_legacy(CANDIDATE_INFO), iterations):>10.2f} "
+        f"{measure_us(lambda: decode_legacy(CANDIDATE_INFO.candidate_id, legacy_info), iterations):>10.2f}"
+    )
+    for codec in CODECS.values():
+        record = encode_candidate_info(CANDIDATE_INFO, codec)
+        assert decode_candidate_info(record) == CANDIDATE_INFO
+        print(
+            f"{codec.name:<14} {len(b'record') + len(record):>14} "
+            f"{measure_us(lambda: encode_candidate_info(CANDIDATE_INFO, codec), iterations):>10.2f} "
+            f"{measure_us(lambda: decode_candidate_info(record), iterations):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
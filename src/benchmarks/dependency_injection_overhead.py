@@ -0,0 +1,114 @@
+"""
+Measures the per-request dependency injection overhead of the handlers' dependencies.
+
+Endpoints returning right away depend on the same `Stub`s as the real handlers. They are served by two apps:
+- one with the `Stub`-based override map as it was before the container: FastAPI solves the whole chain on every
+  request, clients and infrastructure come from cached sync providers and services are built per request;
+- one with the container's overrides, which hand out instances resolved once.
+The overhead is the latency above an endpoint without dependencies.
+Run from the `src` directory: `python -m benchmarks.dependency_injection_overhead`.
+"""
+import argparse
+import asyncio
+import functools
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+
+from config import Config
+from dependencies import Container, DependenciesOverrides, Stub
+from infrastructure.batch_jobs import BatchJobsRegistry
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.session_reaper import SessionReaper
+from services import BatchJobsService, EvaluateResponsesService, GenerateQuestionsService, ValidationService
+
+PER_REQUEST_DEPENDENCIES = {
+    GenerateQuestionsService, EvaluateResponsesService, ValidationService, BatchJobsRegistry, BatchJobsService,
+    SessionReaper,
+}
+
+
+def create_benchmark_application(dependency_overrides: dict) -> FastAPI:
+    application = FastAPI()
+    application.dependency_overrides = dependency_overrides
+
+    @application.get("/baseline")
+    async def baseline():
+        return None
+
+    @application.get("/generate_questions")
+    async def generate_questions(service: GenerateQuestionsService = Depends(Stub(GenerateQuestionsService))):
+        return None
+
+    @application.get("/validate_scores")
+    async def validate_scores(service: ValidationService = Depends(Stub(ValidationService))):
+        return None
+
+    @application.get("/batch_jobs")
+    async def batch_jobs(service: BatchJobsService = Depends(Stub(BatchJobsService))):
+        return None
+
+    return application
+
+
+def get_stub_chain_overrides(providers: dict, container: Container) -> dict:
+    def get_cached_provider(provider, instance):
+        # Keeps the signature of the provider like `lru_cache` did, so FastAPI still solves its dependencies.
+        @functools.wraps(provider)
+        def cached_provider(*args, **kwargs):
+            return instance
+
+        return cached_provider
+
+    return {
+        dependency: (
+            provider if dependency in PER_REQUEST_DEPENDENCIES
+            else get_cached_provider(provider, container.resolve(dependency))
+        )
+        for dependency, provider in providers.items()
+    }
+
+
+async def measure(application: FastAPI, path: str, requests: int, concurrency: int) -> tuple[float, float]:
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        queue = iter(range(requests))
+
+        async def worker():
+            for _ in queue:
+                response = await client.get(path)
+                response.raise_for_status()
+
+        for _ in range(requests // 10):
+            await client.get(path)
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+    return requests / elapsed, elapsed / requests * 1_000_000
+
+
+async def main(requests: int, concurrency: int):
+    config = Config()
+    providers = DependenciesOverrides(config).override_dependencies()
+    container = Container(providers)
+    container.resolve_all()
+    applications = {
+        "stub chain": create_benchmark_application(get_stub_chain_overrides(providers, container)),
+        "container": create_benchmark_application(container.get_dependency_overrides()),
+    }
+    for name, application in applications.items():
+        print(name)
+        _, baseline_us = await measure(application, "/baseline", requests, concurrency)
+        for path in ("/baseline", "/generate_questions", "/validate_scores", "/batch_jobs"):
+            rps, us = await measure(application, path, requests, concurrency)
+            print(f"  {path:<22} {rps:>8.0f} requests/s {us:>8.1f} us/request {us - baseline_us:>8.1f} us DI overhead")
+    await container.resolve(ConnectionPools).close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,147 @@
+"""
+Load test of the OpenAI and MinIO HTTP connection pools against local stub servers.
+
+Fires `--concurrency` simultaneous chat completions and object uploads and reads through the clients built by
+the dependencies container, then prints latencies and pool stats. The pools hold up when every request succeeds and no
+more connections were opened than the pool allows, requests above the pool size wait for a connection instead.
+Pool sizes and timeouts are taken from the same env variables as in the application.
+Run from the `src` directory: `python -m benchmarks.http_pools_load`.
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+from openai import AsyncOpenAI
+
+from config import Config
+from dependencies import Container, DependenciesOverrides
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.files_storage import FilesStorage
+
+BUCKET_NAME = "benchmark"
+
+
+async def start_stub_servers(latency: float) -> tuple[web.AppRunner, int]:
+    objects = {}
+
+    async def chat_completion(request: web.Request) -> web.Response:
+        await request.read()
+        await asyncio.sleep(latency)
+        return web.json_response(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-3.5-turbo",
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": "[]"}, "finish_reason": "stop"},
+                ],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+            },
+        )
+
+    async def bucket(request: web.Request) -> web.Response:
+        # Like S3 the length is sent for HEAD too, without it the client can't keep the connection alive.
+        return web.Response(headers={"Content-Length": "0"})
+
+    async def storage_object(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        key = request.match_info["object_name"]
+        if request.method == "PUT":
+            objects[key] = await request.read()
+            return web.Response(headers={"ETag": '"stub"'})
+        return web.Response(body=objects[key], content_type="application/octet-stream")
+
+    application = web.Application()
+    application.router.add_post("/v1/chat/completions", chat_completion)
+    application.router.add_route("*", "/{bucket_name}", bucket)
+    application.router.add_route("*", "/{bucket_name}/{object_name}", storage_object)
+    runner = web.AppRunner(application, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0, backlog=4096)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+async def run_concurrently(name: str, call, concurrency: int):
+    latencies = []
+    errors = 0
+
+    async def timed_call(i: int):
+        nonlocal errors
+        started_at = time.perf_counter()
+        try:
+            await call(i)
+        except Exception:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(timed_call(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    print(f"{name:<24} {elapsed:>7.2f} s total {p50:>8.1f} ms p50 {p99:>8.1f} ms p99 {errors:>5} errors")
+    return errors
+
+
+async def main(concurrency: int, latency: float):
+    runner, port = await start_stub_servers(latency)
+    config = Config(
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{port}/v1",
+        MINIO_URL=f"127.0.0.1:{port}",
+        MINIO_SECURE=False,
+        MINIO_ACCESS_KEY="stub",
+        MINIO_SECRET_KEY="stub",
+    )
+    container = Container(DependenciesOverrides(config).override_dependencies())
+    openai_client = container.resolve(AsyncOpenAI)
+    minio_session = container.resolve(aiohttp.ClientSession)
+    files_storage = container.resolve(FilesStorage)
+    data = json.dumps({"benchmark": "x" * 1024}).encode()
+
+    errors = await run_concurrently(
+        "openai chat completion",
+        lambda i: openai_client.chat.completions.create(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": f"Request {i}"}],
+        ),
+        concurrency,
+    )
+    errors += await run_concurrently(
+        "minio put_object",
+        lambda i: files_storage.put_object(BUCKET_NAME, f"{i}.json", io.BytesIO(data), len(data), "application/json"),
+        concurrency,
+    )
+    errors += await run_concurrently(
+        "minio get_object", lambda i: files_storage.get_object(BUCKET_NAME, f"{i}.json"), concurrency,
+    )
+
+    print()
+    held_up = errors == 0
+    for stats in container.resolve(ConnectionPools).get_http_pools_stats():
+        held_up = held_up and stats.connections_created <= stats.max_connections
+        print(
+            f"{stats.name:<8} {stats.requests:>6} requests {stats.peak_in_flight:>5} peak in flight "
+            f"{stats.connections_created:>5} connections created of {stats.max_connections} allowed"
+        )
+    print(f"\nPools {'held up' if held_up else 'did not hold up'} at {concurrency} concurrent requests")
+
+    await openai_client.close()
+    await minio_session.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of the stub servers in seconds.")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.latency))
@@ -0,0 +1,424 @@
+"""
+End-to-end load and latency benchmark of the interview pipeline.
+
+For every `--workers` count the application built by `create_application` is started under gunicorn with the
+repository's config, with every agent on the fake LLM backend (latency injected from `--llm-latency-*`), the local
+Redis of `REDIS_HOST_URL` and an in-process S3 stand-in. For every `--concurrency` level as many virtual candidates
+replay `--sessions` sessions from the JSONL scenario file, every line of which is a candidate with the steps of its
+flow, e.g. `{"first_name": ..., "second_name": ..., "job_title": ..., "response": ..., "steps": ["generate_questions",
+"evaluate_responses", "validate_scores"]}`, with `/stream` suffixed steps for the streaming endpoints.
+
+Reported per endpoint are throughput and client-side p50/p95/p99 latencies, and per stage the p50/p95/p99 of the
+LLM calls, Redis and storage operations, estimated from the buckets of the application's Prometheus histograms.
+Results are written as JSON to `--output`, `--baseline` compares them with the results of another commit.
+The benchmark flushes Redis database `--redis-db` before every run, so it should not hold any other data.
+Run from the `src` directory: `python -m benchmarks.interview_pipeline_load --workers 1 2 --concurrency 10 50`.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import redis.asyncio as redis
+from aiohttp import web
+from prometheus_client.parser import text_string_to_metric_families
+
+from config import Config
+
+SCENARIOS_PATH = Path(__file__).resolve().parent / "scenarios" / "interview_pipeline.jsonl"
+STEPS = {
+    "generate_questions": ("GET", "/api/v1/generate_questions"),
+    "generate_questions/stream": ("GET", "/api/v1/generate_questions/stream"),
+    "evaluate_responses": ("POST", "/api/v1/evaluate_responses"),
+    "evaluate_responses/stream": ("POST", "/api/v1/evaluate_responses/stream"),
+    "validate_scores": ("POST", "/api/v1/validate_scores"),
+    "validate_scores/stream": ("POST", "/api/v1/validate_scores/stream"),
+}
+STAGE_HISTOGRAMS = {
+    "llm_call_duration_seconds": "llm",
+    "llm_scheduler_queue_wait_seconds": "llm_scheduler_queue_wait",
+    "shared_context_operation_duration_seconds": "shared_context",
+    "files_storage_operation_duration_seconds": "files_storage",
+}
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+class S3StandIn:
+    """Keeps objects in memory and answers the few S3 calls of the files storage, in a thread of its own."""
+
+    def __init__(self):
+        self.port = get_free_port()
+        self._objects = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _serve(self):
+        application = web.Application(client_max_size=64 * 1024 ** 2)
+        application.router.add_route("*", "/{bucket_name}", self._bucket)
+        application.router.add_route("*", "/{bucket_name}/{object_name:.+}", self._object)
+        self._runner = web.AppRunner(application, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port, backlog=4096).start()
+
+    async def _bucket(self, request: web.Request) -> web.Response:
+        # The length is sent for HEAD too, without it the client can't keep the connection alive.
+        return web.Response(headers={"Content-Length": "0"})
+
+    async def _object(self, request: web.Request) -> web.Response:
+        key = (request.match_info["bucket_name"], request.match_info["object_name"])
+        if request.method == "PUT":
+            self._objects[key] = await request.read()
+            return web.Response(headers={"ETag": '"stand-in"'})
+        if key not in self._objects:
+            return web.Response(status=404)
+        return web.Response(body=self._objects[key], content_type="application/octet-stream")
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_scenarios(path: Path) -> list[dict]:
+    scenarios = [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+    for scenario in scenarios:
+        unknown_steps = set(scenario["steps"]) - STEPS.keys()
+        if unknown_steps:
+            raise ValueError(f"Unknown steps in {path}: {sorted(unknown_steps)}")
+    return scenarios
+
+
+def get_percentiles(latencies: list[float]) -> dict:
+    if not latencies:
+        return {name: None for name in QUANTILES}
+    latencies = sorted(latencies)
+    return {
+        name: round(latencies[min(math.ceil(quantile * len(latencies)) - 1, len(latencies) - 1)] * 1000, 3)
+        for name, quantile in QUANTILES.items()
+    }
+
+
+def get_histogram_quantile(buckets: list[tuple[float, float]], quantile: float) -> float | None:
+    """Estimates a quantile from cumulative histogram buckets like PromQL `histogram_quantile`."""
+    total = buckets[-1][1] if buckets else 0
+    if total <= 0:
+        return None
+    rank = quantile * total
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if math.isinf(upper_bound):
+                return lower_bound
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+
+def parse_stage_histograms(metrics: str) -> dict[str, dict[float, float]]:
+    histograms = {}
+    for family in text_string_to_metric_families(metrics):
+        if family.name not in STAGE_HISTOGRAMS:
+            continue
+        for sample in family.samples:
+            if not sample.name.endswith("_bucket"):
+                continue
+            labels = {name: value for name, value in sample.labels.items() if name != "le"}
+            stage = ".".join((STAGE_HISTOGRAMS[family.name], *labels.values()))
+            histograms.setdefault(stage, {})[float(sample.labels["le"])] = sample.value
+    return histograms
+
+
+def get_stages_report(before: dict[str, dict[float, float]], after: dict[str, dict[float, float]]) -> dict:
+    stages = {}
+    for stage, buckets in sorted(after.items()):
+        previous = before.get(stage, {})
+        delta = sorted((bound, count - previous.get(bound, 0)) for bound, count in buckets.items())
+        if not delta or delta[-1][1] <= 0:
+            continue
+        stages[stage] = {"count": int(delta[-1][1])}
+        for name, quantile in QUANTILES.items():
+            estimate = get_histogram_quantile(delta, quantile)
+            stages[stage][name] = round(estimate * 1000, 3) if estimate is not None else None
+    return stages
+
+
+def get_candidate_id(step: str, response: httpx.Response) -> str:
+    if not step.endswith("/stream"):
+        return response.json()["candidate_id"]
+    lines = response.text.splitlines()
+    for event_line, data_line in zip(lines, lines[1:]):
+        if event_line == "event: result":
+            return json.loads(data_line.removeprefix("data: "))["candidate_id"]
+    raise ValueError("The stream has no result event")
+
+
+async def run_session(client: httpx.AsyncClient, scenario: dict, session_number: int, samples: dict) -> bool:
+    candidate_id = None
+    for step in scenario["steps"]:
+        method, path = STEPS[step]
+        if step.startswith("generate_questions"):
+            # Candidate IDs are derived from the names, a unique one keeps concurrent sessions apart.
+            body = {
+                "first_name": scenario["first_name"],
+                "second_name": f"{scenario['second_name']} {session_number}",
+                "job_title": scenario["job_title"],
+            }
+        elif step.startswith("evaluate_responses"):
+            body = {"response": scenario["response"]}
+        else:
+            body = None
+        headers = {"candidate-id": candidate_id} if candidate_id else {}
+        started_at = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body, headers=headers)
+            response.raise_for_status()
+            if step.startswith("generate_questions"):
+                candidate_id = get_candidate_id(step, response)
+            # Streams report failures as error events after the 200 status.
+            if step.endswith("/stream") and "event: error" in response.text:
+                raise ValueError(f"{step} streamed an error")
+        except Exception:
+            samples[step]["errors"] += 1
+            return False
+        samples[step]["latencies"].append(time.perf_counter() - started_at)
+    return True
+
+
+async def run_load(base_url: str, scenarios: list[dict], sessions: int, concurrency: int) -> dict:
+    samples = {step: {"latencies": [], "errors": 0} for step in STEPS}
+    session_latencies = []
+    failed_sessions = 0
+    session_numbers = iter(range(sessions))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        metrics_before = parse_stage_histograms((await client.get("/metrics")).text)
+
+        async def virtual_candidate():
+            nonlocal failed_sessions
+            for session_number in session_numbers:
+                started_at = time.perf_counter()
+                succeeded = await run_session(
+                    client, scenarios[session_number % len(scenarios)], session_number, samples,
+                )
+                if succeeded:
+                    session_latencies.append(time.perf_counter() - started_at)
+                else:
+                    failed_sessions += 1
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(virtual_candidate() for _ in range(concurrency)))
+        duration = time.perf_counter() - started_at
+        metrics_after = parse_stage_histograms((await client.get("/metrics")).text)
+    endpoints = {
+        step: {
+            "requests": len(step_samples["latencies"]) + step_samples["errors"],
+            "errors": step_samples["errors"],
+            "throughput": round(len(step_samples["latencies"]) / duration, 3),
+            **get_percentiles(step_samples["latencies"]),
+        }
+        for step, step_samples in samples.items()
+        if step_samples["latencies"] or step_samples["errors"]
+    }
+    return {
+        "duration_seconds": round(duration, 3),
+        "sessions": {
+            "completed": len(session_latencies),
+            "failed": failed_sessions,
+            "throughput": round(len(session_latencies) / duration, 3),
+            **get_percentiles(session_latencies),
+        },
+        "endpoints": endpoints,
+        "stages": get_stages_report(metrics_before, metrics_after),
+    }
+
+
+@contextlib.asynccontextmanager
+async def run_application(workers: int, s3_port: int, redis_db: int, llm_latency: dict, ready_timeout: float):
+    config = Config()
+    port = get_free_port()
+    metrics_dir = tempfile.mkdtemp(prefix="interview_pipeline_load_metrics_")
+    # Flags are on when set to anything, so the ones to keep off are removed.
+    env = {name: value for name, value in os.environ.items() if name not in ("GUNICORN_RELOAD", "MINIO_SECURE")}
+    env.update({
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_WORKERS": str(workers),
+        "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+        "REDIS_SHARED_CONTEXT_DB": str(redis_db),
+        "MINIO_URL": f"127.0.0.1:{s3_port}",
+        "MINIO_ACCESS_KEY": "stand-in",
+        "MINIO_SECRET_KEY": "stand-in",
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "stand-in",
+        "LLM_GENERATE_QUESTIONS_BACKEND": "fake",
+        "LLM_RESPONSE_EVALUATION_BACKEND": "fake",
+        "LLM_VALIDATION_BACKEND": "fake",
+        "BATCH_JOBS_BACKEND": "fake",
+        "LLM_FAKE_LATENCY_DISTRIBUTION": llm_latency["distribution"],
+        "LLM_FAKE_LATENCY_MEAN": str(llm_latency["mean"]),
+        "LLM_FAKE_LATENCY_STDDEV": str(llm_latency["stddev"]),
+    })
+    # A file rather than a pipe, so the log of a long run can't fill the pipe and block the server.
+    log = tempfile.TemporaryFile(mode="w+")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app", "--config", str(config.BASE_DIR.parent / "gunicorn.conf.py")],
+        cwd=config.BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=log,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_until_ready(process, base_url, ready_timeout)
+        yield base_url
+    except RuntimeError:
+        log.seek(0)
+        print(log.read(), file=sys.stderr)
+        raise
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        log.close()
+
+
+async def wait_until_ready(process: subprocess.Popen, base_url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"The application exited with code {process.returncode}")
+            with contextlib.suppress(httpx.HTTPError):
+                if (await client.get("/ready")).status_code == 200:
+                    return
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"The application wasn't ready in {timeout}s")
+
+
+async def flush_redis(redis_db: int):
+    redis_connection = redis.Redis.from_url(Config().REDIS_HOST_URL, db=redis_db)
+    try:
+        await redis_connection.flushdb()
+    finally:
+        await redis_connection.close()
+
+
+def print_run(run: dict):
+    sessions = run["sessions"]
+    print(
+        f"\n{run['workers']} workers, {run['concurrency']} concurrent candidates: {sessions['completed']} sessions "
+        f"in {run['duration_seconds']:.2f} s, {sessions['throughput']:.2f} sessions/s, {sessions['failed']} failed"
+    )
+    rows = [("session", sessions)] + list(run["endpoints"].items()) + list(run["stages"].items())
+    for name, row in rows:
+        latencies = " ".join(
+            f"{row[quantile]:>9.1f} ms {quantile}" if row[quantile] is not None else f"{'-':>9} ms {quantile}"
+            for quantile in QUANTILES
+        )
+        throughput = f"{row['throughput']:>8.2f}/s" if "throughput" in row else f"{row['count']:>8} ops"
+        print(f"  {name:<52} {throughput} {latencies}")
+
+
+def print_comparison(results: dict, baseline: dict):
+    print(f"\nChange of p95 against {baseline.get('commit') or 'the baseline'}:")
+    baseline_runs = {(run["workers"], run["concurrency"]): run for run in baseline["runs"]}
+    for run in results["runs"]:
+        baseline_run = baseline_runs.get((run["workers"], run["concurrency"]))
+        if baseline_run is None:
+            continue
+        print(f"  {run['workers']} workers, {run['concurrency']} concurrent candidates")
+        rows = itertools.chain(
+            [("session", run["sessions"], baseline_run["sessions"])],
+            ((name, row, baseline_run["endpoints"].get(name)) for name, row in run["endpoints"].items()),
+            ((name, row, baseline_run["stages"].get(name)) for name, row in run["stages"].items()),
+        )
+        for name, row, baseline_row in rows:
+            if not baseline_row or not row["p95"] or not baseline_row["p95"]:
+                continue
+            change = (row["p95"] - baseline_row["p95"]) / baseline_row["p95"] * 100
+            print(f"    {name:<52} {baseline_row['p95']:>9.1f} ms -> {row['p95']:>9.1f} ms {change:>+7.1f}%")
+
+
+async def main(args: argparse.Namespace):
+    scenarios = load_scenarios(args.scenarios)
+    llm_latency = {
+        "distribution": args.llm_latency_distribution,
+        "mean": args.llm_latency_mean,
+        "stddev": args.llm_latency_stddev,
+    }
+    results = {
+        "commit": get_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "scenarios": str(args.scenarios),
+        "sessions": args.sessions,
+        "llm_latency": llm_latency,
+        "runs": [],
+    }
+    s3_stand_in = S3StandIn()
+    s3_stand_in.start()
+    try:
+        for workers in args.workers:
+            for concurrency in args.concurrency:
+                # Every run starts from an empty shared context and questions cache.
+                await flush_redis(args.redis_db)
+                async with run_application(
+                        workers, s3_stand_in.port, args.redis_db, llm_latency, args.ready_timeout,
+                ) as base_url:
+                    run = {"workers": workers, "concurrency": concurrency}
+                    run.update(await run_load(base_url, scenarios, args.sessions, concurrency))
+                results["runs"].append(run)
+                print_run(run)
+    finally:
+        s3_stand_in.stop()
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults are written to {args.output}")
+    if args.baseline:
+        print_comparison(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", type=Path, default=SCENARIOS_PATH, help="JSONL file of candidate scenarios.")
+    parser.add_argument("--sessions", type=int, default=200, help="Sessions to replay per run.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2], help="Gunicorn worker counts to sweep.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50], help="Concurrent candidates to sweep.")
+    parser.add_argument("--llm-latency-distribution", default="lognormal")
+    parser.add_argument("--llm-latency-mean", type=float, default=0.5, help="Mean LLM latency in seconds.")
+    parser.add_argument("--llm-latency-stddev", type=float, default=0.2)
+    parser.add_argument("--redis-db", type=int, default=15, help="Redis database flushed and used by the runs.")
+    parser.add_argument("--ready-timeout", type=float, default=60)
+    parser.add_argument("--output", type=Path, default=Path("interview_pipeline_load.json"))
+    parser.add_argument("--baseline", type=Path, help="Results of a previous run to compare with.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+"""
+Counts Redis round trips made by every endpoint's service call against the Redis from `REDIS_HOST_URL`.
+
+Agents and MinIO are replaced with in-process fakes, so only the Redis traffic is measured.
+Run from the `src` directory: `python -m benchmarks.shared_context_round_trips`.
+"""
+import asyncio
+import time
+
+import redis.asyncio as redis
+
+from config import Config
+from dto import ResponseEvaluationAgentResult, ValidationAgentResult
+from infrastructure.evaluation_cache import EvaluationCache, get_evaluation_cache_key
+from infrastructure.files_storage import FilesStorage
+from infrastructure.persistence_queue import PersistenceQueue
+from infrastructure.questions_cache import QuestionsCache
+from infrastructure.redis_shards import SingleRedisShards
+from infrastructure.session_archive import SessionArchive
+from infrastructure.shared_context import SharedContext
+from infrastructure.single_flight import SingleFlight
+from infrastructure.speculation import Speculation
+from services import EvaluateResponsesService, GenerateQuestionsService, ValidationService
+
+
+class RoundTripsCountingConnection(redis.Connection):
+    round_trips = 0
+
+    async def send_packed_command(self, command, check_health: bool = True):
+        RoundTripsCountingConnection.round_trips += 1
+        await super().send_packed_command(command, check_health)
+
+
+class FakeGenerateQuestionsAgent:
+    async def generate_questions(self, job_title: str) -> list[str]:
+        return ["1. Question?", "2. Question?", "3. Question?"]
+
+
+class FakeResponseEvaluationAgent:
+    name = "response_evaluation"
+
+    def get_cache_key(self, job_title, questions, response) -> str:
+        return get_evaluation_cache_key(self.name, "fake", "fake", job_title, questions, response)
+
+    async def evaluate_response(self, job_title, questions, response) -> list[ResponseEvaluationAgentResult]:
+        return [{"score": 3, "comment": "Comment."} for _ in questions]
+
+
+class FakeValidationAgent:
+    name = "validation"
+
+    def get_cache_key(self, job_title, questions, response, scores, comments) -> str:
+        return get_evaluation_cache_key(self.name, "fake", "fake", job_title, questions, response, scores, comments)
+
+    async def validate_scores(self, job_title, questions, response, scores, comments) -> ValidationAgentResult:
+        return {"scores": [{"score": 4, "comment": "Comment."} for _ in questions], "feedback": "Good"}
+
+
+class FakeFilesStorage(FilesStorage):
+    async def put_object(self, bucket_name, object_name, data, length, content_type) -> str:
+        return f"{self._config.MINIO_PUBLIC_HOST}/{bucket_name}/{object_name}"
+
+
+async def measure(name: str, call, iterations: int):
+    RoundTripsCountingConnection.round_trips = 0
+    started_at = time.perf_counter()
+    for i in range(iterations):
+        await call(i)
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"{name:<20} {RoundTripsCountingConnection.round_trips / iterations:>6.1f} round trips/request "
+        f"{elapsed / iterations * 1000:>8.3f} ms/request"
+    )
+
+
+async def main(iterations: int = 200):
+    config = Config()
+    redis_connection = redis.Redis.from_url(config.REDIS_HOST_URL, db=config.REDIS_SHARED_CONTEXT_DB)
+    redis_connection.connection_pool.connection_class = RoundTripsCountingConnection
+    shared_context = SharedContext(config, SingleRedisShards(redis_connection))
+    single_flight = SingleFlight(config, redis_connection)
+    evaluation_cache = EvaluationCache(config, redis_connection)
+    generate_questions_service = GenerateQuestionsService(
+        shared_context, FakeGenerateQuestionsAgent(), QuestionsCache(config, redis_connection), single_flight,
+    )
+    validation_service = ValidationService(
+        config,
+        shared_context,
+        FakeValidationAgent(),
+        FakeFilesStorage(config, None, None),
+        single_flight,
+        PersistenceQueue(config, redis_connection, FakeFilesStorage(config, None, None)),
+        SessionArchive(config, redis_connection, FakeFilesStorage(config, None, None)),
+        evaluation_cache,
+        Speculation(config, single_flight),
+    )
+    evaluate_responses_service = EvaluateResponsesService(
+        config, shared_context, FakeResponseEvaluationAgent(), single_flight, evaluation_cache, validation_service,
+    )
+    candidate_ids = []
+
+    async def generate_questions(i: int):
+        result = await generate_questions_service.generate_questions("Benchmark", f"Candidate {i}", "Developer")
+        candidate_ids.append(result.candidate_id)
+
+    await measure("generate_questions", generate_questions, iterations)
+    await measure(
+        "evaluate_responses",
+        # Responses differ, so every evaluation misses the evaluation cache like a first submission.
+        lambda i: evaluate_responses_service.evaluate_response(candidate_ids[i], f"Response {i}."),
+        iterations,
+    )
+    await measure("validate_scores", lambda i: validation_service.validate(candidate_ids[i]), iterations)
+    await redis_connection.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Throughput of the shared context on one Redis node against the same load sharded over several nodes.
+
+Every setup is loaded by `--processes` client processes, each with `--concurrency` candidates going through the
+sessions of the interview flow: saving the questions, the scores and the validation result and reading the session
+between them. A single Python process saturates before a Redis node does, so there should be enough processes to
+make Redis the bottleneck. The single node setup uses the first of `--urls`, the sharded one all of them, and with
+`--cluster-url` a Redis Cluster is measured too. Sessions are written under the `shared_context_benchmark` key
+prefix and deleted after every run.
+Run from the `src` directory:
+`python -m benchmarks.shared_context_sharding --urls redis://localhost:6379/0 redis://localhost:6380/0`.
+"""
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import statistics
+import time
+
+from config import Config
+from dto import ResponseEvaluationAgentResult, ValidationAgentResult
+from infrastructure.redis_shards import create_redis_shards
+from infrastructure.shared_context import SharedContext
+
+KEY_PREFIX = "shared_context_benchmark"
+SCORES_AND_COMMENTS = [ResponseEvaluationAgentResult(score=4, comment="Good answer.")] * 3
+VALIDATION_RESULT = ValidationAgentResult(scores=SCORES_AND_COMMENTS, feedback="Scores are consistent.")
+
+
+async def run_sessions(shared_context: SharedContext, process: int, worker: int, sessions: int) -> list[float]:
+    latencies = []
+
+    async def timed(operation):
+        started_at = time.perf_counter()
+        result = await operation
+        latencies.append(time.perf_counter() - started_at)
+        return result
+
+    for session in range(sessions):
+        candidate_id = hashlib.sha256(f"{process}:{worker}:{session}".encode()).hexdigest()
+        await timed(
+            shared_context.save_candidate_info_and_questions(
+                candidate_id, "Jane", "Doe", "Backend developer", ["Question one?", "Question two?", "Question three?"],
+            )
+        )
+        candidate_info = await timed(shared_context.get_full_candidate_info(candidate_id))
+        await timed(shared_context.save_response_scores_and_comments(candidate_info, "My answer.", SCORES_AND_COMMENTS))
+        candidate_info = await timed(shared_context.get_full_candidate_info(candidate_id))
+        await timed(shared_context.save_validation_result(candidate_info, VALIDATION_RESULT))
+    return latencies
+
+
+async def run_process(mode: str, urls: list[str], process: int, concurrency: int, sessions: int) -> list[float]:
+    redis_shards = create_redis_shards(mode, urls, 160)
+    shared_context = SharedContext(Config(SHARED_CONTEXT_KEY_PREFIX=KEY_PREFIX), redis_shards)
+    results = await asyncio.gather(
+        *(run_sessions(shared_context, process, worker, sessions) for worker in range(concurrency))
+    )
+    await redis_shards.close()
+    return [latency for latencies in results for latency in latencies]
+
+
+def run_process_sync(arguments: tuple) -> list[float]:
+    return asyncio.run(run_process(*arguments))
+
+
+async def delete_sessions(mode: str, urls: list[str]):
+    redis_shards = create_redis_shards(mode, urls, 160)
+    for connection in redis_shards.get_scan_connections():
+        keys = [key async for key in connection.scan_iter(match=f"{KEY_PREFIX}:*", count=1000)]
+        # One key per command, the keys of a Redis Cluster are in different slots.
+        async with connection.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.delete(key)
+            await pipe.execute()
+    await redis_shards.close()
+
+
+def run_setup(name: str, mode: str, urls: list[str], processes: int, concurrency: int, sessions: int):
+    started_at = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(
+            run_process_sync, [(mode, urls, process, concurrency, sessions) for process in range(processes)],
+        )
+    elapsed = time.perf_counter() - started_at
+    asyncio.run(delete_sessions(mode, urls))
+    latencies = sorted(latency for process_latencies in results for latency in process_latencies)
+    print(
+        f"{name:<20} {len(urls):>2} nodes {len(latencies) / elapsed:>9.0f} ops/s "
+        f"p50 {statistics.median(latencies) * 1000:>7.2f} ms "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:>7.2f} ms"
+    )
+
+
+def main(args: argparse.Namespace):
+    run_setup("single", "single", args.urls[:1], args.processes, args.concurrency, args.sessions)
+    if len(args.urls) > 1:
+        run_setup("sharded", "sharded", args.urls, args.processes, args.concurrency, args.sessions)
+    if args.cluster_url:
+        run_setup("cluster", "cluster", [args.cluster_url], args.processes, args.concurrency, args.sessions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", nargs="+", required=True, help="URLs of the Redis nodes to shard over.")
+    parser.add_argument("--cluster-url", help="URL of any node of a Redis Cluster.")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent candidates per process.")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions per candidate.")
+    main(parser.parse_args())
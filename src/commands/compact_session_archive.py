@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import json
+import zoneinfo
+from collections import defaultdict
+from datetime import datetime
+
+from config import Config
+from dependencies import Container, DependenciesOverrides
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.files_storage import FilesStorage
+from infrastructure.session_archive import HOUR_FORMAT, SessionArchive
+
+
+async def compact_session_archive(config: Config, before: datetime, concurrency: int, delete: bool):
+    container = Container(DependenciesOverrides(config).override_dependencies())
+    files_storage = container.resolve(FilesStorage)
+    session_archive = container.resolve(SessionArchive)
+    utc = zoneinfo.ZoneInfo("UTC")
+    object_names_by_hour = defaultdict(list)
+    async for object_name in files_storage.iter_object_names(config.PERSISTENT_DATA_BUCKET_NAME):
+        _, _, timestamp = object_name.removesuffix(".json").rpartition("_")
+        finished_at = datetime.fromtimestamp(float(timestamp), utc)
+        if finished_at < before:
+            object_names_by_hour[finished_at.strftime(HOUR_FORMAT)].append((object_name, finished_at.timestamp()))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_record(object_name: str, finished_at: float) -> dict:
+        async with semaphore:
+            data = await files_storage.get_object(config.PERSISTENT_DATA_BUCKET_NAME, object_name)
+        return {"finished_at": finished_at, **json.loads(data)}
+
+    async def remove_objects(object_name: str):
+        async with semaphore:
+            await files_storage.remove_object(config.PERSISTENT_DATA_BUCKET_NAME, object_name)
+            await files_storage.remove_object(config.LOGS_BUCKET_NAME, object_name)
+
+    segment_max_records = int(config.SESSION_ARCHIVE_SEGMENT_MAX_RECORDS)
+    compacted = 0
+    for hour, object_names in sorted(object_names_by_hour.items()):
+        for start in range(0, len(object_names), segment_max_records):
+            chunk = object_names[start:start + segment_max_records]
+            records = await asyncio.gather(*(get_record(object_name, ts) for object_name, ts in chunk))
+            segment_name = await session_archive.write_segment(hour, records)
+            if delete:
+                await asyncio.gather(*(remove_objects(object_name) for object_name, _ in chunk))
+            compacted += len(records)
+            print(f"Compacted {len(records)} sessions of {hour} into {segment_name}")
+    print(f"Compacted {compacted} sessions in total")
+    await container.resolve(ConnectionPools).close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compacts per-session JSON objects of the persistent data bucket into hourly session archive segments."
+        ),
+    )
+    parser.add_argument(
+        "--before",
+        type=datetime.fromisoformat,
+        default=datetime.now(zoneinfo.ZoneInfo("UTC")).replace(minute=0, second=0, microsecond=0),
+        help="Compact only sessions finished before this ISO datetime, defaults to the start of the current hour.",
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="Delete compacted objects together with their session logs.",
+    )
+    args = parser.parse_args()
+    before = args.before if args.before.tzinfo else args.before.replace(tzinfo=zoneinfo.ZoneInfo("UTC"))
+    asyncio.run(compact_session_archive(Config(), before, args.concurrency, args.delete))
@@ -0,0 +1,32 @@
+import argparse
+import asyncio
+
+from config import Config
+from dependencies import Container, DependenciesOverrides
+from infrastructure.shared_context import SharedContext
+
+
+async def migrate_shared_context(config: Config, batch_size: int):
+    shared_context = Container(DependenciesOverrides(config).override_dependencies()).resolve(SharedContext)
+    scanned = 0
+    migrated = 0
+    candidate_ids = []
+    async for candidate_id in shared_context.iter_candidate_ids(batch_size):
+        candidate_ids.append(candidate_id)
+        if len(candidate_ids) >= batch_size:
+            migrated += await shared_context.migrate_candidates_info(candidate_ids)
+            scanned += len(candidate_ids)
+            candidate_ids = []
+    if candidate_ids:
+        migrated += await shared_context.migrate_candidates_info(candidate_ids)
+        scanned += len(candidate_ids)
+    print(f"Scanned {scanned} candidates, re-encoded {migrated} of them with {config.SHARED_CONTEXT_CODEC} codec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Re-encodes candidates info in the shared context with the codec set in SHARED_CONTEXT_CODEC.",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(migrate_shared_context(Config(), args.batch_size))
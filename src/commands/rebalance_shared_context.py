@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+
+from config import Config
+from dependencies import Container, DependenciesOverrides
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.shared_context import SharedContext
+
+
+async def rebalance_shared_context(config: Config, batch_size: int, batch_delay: float, delete_source: bool):
+    container = Container(DependenciesOverrides(config).override_dependencies())
+    shared_context = container.resolve(SharedContext)
+    scanned = 0
+    moved = 0
+    candidate_ids = []
+    async for candidate_id in shared_context.iter_fallback_candidate_ids(batch_size):
+        candidate_ids.append(candidate_id)
+        if len(candidate_ids) >= batch_size:
+            moved += await shared_context.move_candidates_info_from_fallback(candidate_ids, delete_source)
+            scanned += len(candidate_ids)
+            candidate_ids = []
+            await asyncio.sleep(batch_delay)
+    if candidate_ids:
+        moved += await shared_context.move_candidates_info_from_fallback(candidate_ids, delete_source)
+        scanned += len(candidate_ids)
+    print(f"Scanned {scanned} candidates in the fallback shared context, moved {moved} of them")
+    await container.resolve(ConnectionPools).close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Moves candidates info from the shared context set up by REDIS_SHARED_CONTEXT_FALLBACK_MODE, "
+            "REDIS_SHARED_CONTEXT_FALLBACK_URLS and SHARED_CONTEXT_FALLBACK_KEY_PREFIX, or from the legacy bare keys "
+            "without it, to the current one, while the application keeps serving and reads the candidates not moved "
+            "yet from the fallback."
+        ),
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--batch-delay", type=float, default=0)
+    parser.add_argument("--keep-source", action="store_true", help="Doesn't delete the moved candidates info.")
+    args = parser.parse_args()
+    config = Config()
+    if not config.REDIS_SHARED_CONTEXT_FALLBACK_MODE and not config.SHARED_CONTEXT_LEGACY_KEYS_FALLBACK:
+        parser.error(
+            "Neither REDIS_SHARED_CONTEXT_FALLBACK_MODE nor SHARED_CONTEXT_LEGACY_KEYS_FALLBACK is set, there is "
+            "nothing to move the shared context from"
+        )
+    asyncio.run(rebalance_shared_context(config, args.batch_size, args.batch_delay, not args.keep_source))
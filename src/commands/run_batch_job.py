@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+from dataclasses import asdict
+
+from config import Config
+from dependencies import Container, DependenciesOverrides
+from infrastructure.connection_pools import ConnectionPools
+from services import BatchJobsService
+
+
+async def run_batch_job(config: Config, kind: str, candidate_ids: list[str]):
+    container = Container(DependenciesOverrides(config).override_dependencies())
+    batch_jobs_service = container.resolve(BatchJobsService)
+    job = await batch_jobs_service.create_job(kind, candidate_ids)
+    print(f"Submitted batch job {job.job_id} ({job.status})")
+    job = await batch_jobs_service.wait_for_job(job.job_id)
+    print(asdict(job))
+    await container.resolve(ConnectionPools).close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs evaluation or validation of candidates as an offline batch job.")
+    parser.add_argument("kind", choices=["evaluation", "validation"])
+    parser.add_argument("candidate_ids", nargs="+")
+    args = parser.parse_args()
+    asyncio.run(run_batch_job(Config(), args.kind, args.candidate_ids))
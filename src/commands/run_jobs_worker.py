@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import signal
+
+from config import Config
+from dependencies import Container, DependenciesOverrides
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.jobs import JOB_QUEUES, JobQueue
+from infrastructure.persistence_queue import PersistenceQueue
+from infrastructure.questions_cache import QuestionsCache
+from infrastructure.speculation import Speculation
+from services import JobsService
+
+
+async def run_jobs_worker(config: Config, queues: list[str]):
+    container = Container(DependenciesOverrides(config).override_dependencies())
+    jobs_service = container.resolve(JobsService)
+    questions_cache = container.resolve(QuestionsCache)
+    questions_cache_task = asyncio.create_task(questions_cache.run())
+    workers_task = asyncio.create_task(jobs_service.run_workers(queues))
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        # Jobs interrupted by the shutdown stay pending and are taken over by the other workers.
+        loop.add_signal_handler(signal_number, workers_task.cancel)
+    print(f"Running jobs of the queues: {', '.join(queues)}")
+    try:
+        await workers_task
+    except asyncio.CancelledError:
+        pass
+    questions_cache_task.cancel()
+    await asyncio.gather(questions_cache_task, return_exceptions=True)
+    await container.resolve(Speculation).close()
+    await questions_cache.flush()
+    if config.PERSISTENCE_WRITE_BEHIND:
+        # Objects of the jobs run here are put before the exit, like on the shutdown of the API workers.
+        await container.resolve(PersistenceQueue).flush()
+    await container.resolve(JobQueue).close()
+    await container.resolve(ConnectionPools).close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs the asynchronous jobs of the API, with `JOBS_<QUEUE>_CONCURRENCY` jobs at a time per queue.",
+    )
+    parser.add_argument("--queue", action="append", choices=JOB_QUEUES, dest="queues", help="All queues by default.")
+    args = parser.parse_args()
+    asyncio.run(run_jobs_worker(Config(), args.queues or list(JOB_QUEUES)))
@@ -10,18 +10,150 @@ class Config(BaseSettings):
     BASE_DIR: PosixPath = Path(__file__).resolve().parent
 
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL: str | None = os.getenv("OPENAI_BASE_URL")
+    OPENAI_HTTP2: bool = bool(os.getenv("OPENAI_HTTP2", ""))
+    OPENAI_HTTP_MAX_CONNECTIONS: int = os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", 100)
+    OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = os.getenv("OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS", 100)
+    OPENAI_HTTP_POOL_SHARD_SIZE: int = os.getenv("OPENAI_HTTP_POOL_SHARD_SIZE", 10)
+    OPENAI_HTTP_KEEPALIVE_EXPIRY: float = os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", 30)
+    OPENAI_HTTP_CONNECT_TIMEOUT: float = os.getenv("OPENAI_HTTP_CONNECT_TIMEOUT", 5)
+    OPENAI_HTTP_READ_TIMEOUT: float = os.getenv("OPENAI_HTTP_READ_TIMEOUT", 60)
+    OPENAI_HTTP_WRITE_TIMEOUT: float = os.getenv("OPENAI_HTTP_WRITE_TIMEOUT", 10)
+    OPENAI_HTTP_POOL_TIMEOUT: float = os.getenv("OPENAI_HTTP_POOL_TIMEOUT", 30)
 
     REDIS_HOST_URL: str = os.getenv("REDIS_HOST_URL")
     REDIS_SHARED_CONTEXT_DB: int = os.getenv("REDIS_SHARED_CONTEXT_DB", 1)
+    REDIS_SHARED_CONTEXT_MODE: str = os.getenv("REDIS_SHARED_CONTEXT_MODE", "single")
+    REDIS_SHARED_CONTEXT_URLS: str = os.getenv("REDIS_SHARED_CONTEXT_URLS", "")
+    REDIS_SHARED_CONTEXT_VIRTUAL_NODES: int = os.getenv("REDIS_SHARED_CONTEXT_VIRTUAL_NODES", 160)
+    REDIS_SHARED_CONTEXT_FALLBACK_MODE: str = os.getenv("REDIS_SHARED_CONTEXT_FALLBACK_MODE", "")
+    REDIS_SHARED_CONTEXT_FALLBACK_URLS: str = os.getenv("REDIS_SHARED_CONTEXT_FALLBACK_URLS", "")
+    SHARED_CONTEXT_KEY_PREFIX: str = os.getenv("SHARED_CONTEXT_KEY_PREFIX", "")
+    # Without fallback shards, sessions not found are read from their legacy bare keys, empty it once they're moved.
+    SHARED_CONTEXT_LEGACY_KEYS_FALLBACK: bool = bool(os.getenv("SHARED_CONTEXT_LEGACY_KEYS_FALLBACK", "1"))
+    SHARED_CONTEXT_FALLBACK_KEY_PREFIX: str = os.getenv("SHARED_CONTEXT_FALLBACK_KEY_PREFIX", "")
+    SHARED_CONTEXT_CODEC: str = os.getenv("SHARED_CONTEXT_CODEC", "json")
+    SHARED_CONTEXT_QUESTIONS_TTL: int = os.getenv("SHARED_CONTEXT_QUESTIONS_TTL", 60 * 60 * 24)
+    SHARED_CONTEXT_EVALUATED_TTL: int = os.getenv("SHARED_CONTEXT_EVALUATED_TTL", 60 * 60 * 24 * 3)
+
+    SESSION_REAPER_ENABLED: bool = bool(os.getenv("SESSION_REAPER_ENABLED", ""))
+    SESSION_REAPER_INTERVAL: float = os.getenv("SESSION_REAPER_INTERVAL", 60 * 5)
+    SESSION_REAPER_EXPIRY_THRESHOLD: int = os.getenv("SESSION_REAPER_EXPIRY_THRESHOLD", 60 * 10)
+    SESSION_REAPER_BATCH_SIZE: int = os.getenv("SESSION_REAPER_BATCH_SIZE", 100)
+    SESSION_REAPER_BATCH_DELAY: float = os.getenv("SESSION_REAPER_BATCH_DELAY", 0.1)
 
     MINIO_URL: str = os.getenv("MINIO_URL")
     MINIO_SECURE: bool = bool(os.getenv("MINIO_SECURE", ""))
     MINIO_ACCESS_KEY: str = os.getenv("MINIO_ACCESS_KEY")
     MINIO_SECRET_KEY: str = os.getenv("MINIO_SECRET_KEY")
     MINIO_PUBLIC_HOST: str = os.getenv("MINIO_PUBLIC_HOST", "http://127.0.0.1:9000")
+    MINIO_REGION: str = os.getenv("MINIO_REGION", "us-east-1")
+    MINIO_HTTP_MAX_CONNECTIONS: int = os.getenv("MINIO_HTTP_MAX_CONNECTIONS", 100)
+    MINIO_HTTP_KEEPALIVE_EXPIRY: float = os.getenv("MINIO_HTTP_KEEPALIVE_EXPIRY", 30)
+    MINIO_HTTP_CONNECT_TIMEOUT: float = os.getenv("MINIO_HTTP_CONNECT_TIMEOUT", 5)
+    MINIO_HTTP_READ_TIMEOUT: float = os.getenv("MINIO_HTTP_READ_TIMEOUT", 30)
+    MINIO_HTTP_POOL_TIMEOUT: float = os.getenv("MINIO_HTTP_POOL_TIMEOUT", 30)
+    MINIO_HTTP_TIMEOUT: float = os.getenv("MINIO_HTTP_TIMEOUT", 60 * 5)
+
+    HTTP_DNS_CACHE_TTL: int = os.getenv("HTTP_DNS_CACHE_TTL", 60 * 5)
+
+    FILES_STORAGE_PRESIGNED_URL_EXPIRES: int = os.getenv("FILES_STORAGE_PRESIGNED_URL_EXPIRES", 60 * 60 * 24 * 7)
+    FILES_STORAGE_PRESIGNED_URL_CACHE_TTL: float = os.getenv("FILES_STORAGE_PRESIGNED_URL_CACHE_TTL", 60)
+    FILES_STORAGE_PRESIGNED_URL_CACHE_MAXSIZE: int = os.getenv("FILES_STORAGE_PRESIGNED_URL_CACHE_MAXSIZE", 1024)
 
     PERSISTENT_DATA_BUCKET_NAME: str = os.getenv("PERSISTENT_DATA_BUCKET_NAME", "candidates-info")
     LOGS_BUCKET_NAME: str = os.getenv("LOGS_BUCKET_NAME", "logs")
 
+    SESSION_ARCHIVE_ENABLED: bool = bool(os.getenv("SESSION_ARCHIVE_ENABLED", ""))
+    SESSION_ARCHIVE_BUCKET_NAME: str = os.getenv("SESSION_ARCHIVE_BUCKET_NAME", "sessions-archive")
+    SESSION_ARCHIVE_FLUSH_INTERVAL: float = os.getenv("SESSION_ARCHIVE_FLUSH_INTERVAL", 60 * 5)
+    SESSION_ARCHIVE_SEGMENT_MAX_RECORDS: int = os.getenv("SESSION_ARCHIVE_SEGMENT_MAX_RECORDS", 50000)
+    SESSION_ARCHIVE_FRAME_RECORDS: int = os.getenv("SESSION_ARCHIVE_FRAME_RECORDS", 256)
+    SESSION_ARCHIVE_COMPRESSION_LEVEL: int = os.getenv("SESSION_ARCHIVE_COMPRESSION_LEVEL", 10)
+    SESSION_ARCHIVE_INDEX_TTL: int = os.getenv("SESSION_ARCHIVE_INDEX_TTL", 60 * 60 * 24 * 7)
+
+    PERSISTENCE_WRITE_BEHIND: bool = bool(os.getenv("PERSISTENCE_WRITE_BEHIND", ""))
+    PERSISTENCE_QUEUE_MAX_ATTEMPTS: int = os.getenv("PERSISTENCE_QUEUE_MAX_ATTEMPTS", 5)
+    PERSISTENCE_QUEUE_RETRY_IDLE: float = os.getenv("PERSISTENCE_QUEUE_RETRY_IDLE", 30)
+    PERSISTENCE_QUEUE_BATCH_SIZE: int = os.getenv("PERSISTENCE_QUEUE_BATCH_SIZE", 50)
+    PERSISTENCE_QUEUE_BLOCK: float = os.getenv("PERSISTENCE_QUEUE_BLOCK", 5)
+
+    LLM_SCHEDULER_INITIAL_CONCURRENCY: int = os.getenv("LLM_SCHEDULER_INITIAL_CONCURRENCY", 8)
+    LLM_SCHEDULER_MIN_CONCURRENCY: int = os.getenv("LLM_SCHEDULER_MIN_CONCURRENCY", 1)
+    LLM_SCHEDULER_MAX_CONCURRENCY: int = os.getenv("LLM_SCHEDULER_MAX_CONCURRENCY", 64)
+    LLM_SCHEDULER_BACKOFF_RATIO: float = os.getenv("LLM_SCHEDULER_BACKOFF_RATIO", 0.5)
+    LLM_SCHEDULER_MAX_RETRIES: int = os.getenv("LLM_SCHEDULER_MAX_RETRIES", 3)
+    LLM_SCHEDULER_RETRY_BASE_DELAY: float = os.getenv("LLM_SCHEDULER_RETRY_BASE_DELAY", 0.5)
+    LLM_SCHEDULER_RETRY_MAX_DELAY: float = os.getenv("LLM_SCHEDULER_RETRY_MAX_DELAY", 20)
+    LLM_SCHEDULER_INTERACTIVE_DEADLINE: float = os.getenv("LLM_SCHEDULER_INTERACTIVE_DEADLINE", 10)
+    LLM_SCHEDULER_STANDARD_DEADLINE: float = os.getenv("LLM_SCHEDULER_STANDARD_DEADLINE", 30)
+    LLM_SCHEDULER_BATCH_DEADLINE: float = os.getenv("LLM_SCHEDULER_BATCH_DEADLINE", 60 * 5)
+
+    LLM_GENERATE_QUESTIONS_BACKEND: str = os.getenv("LLM_GENERATE_QUESTIONS_BACKEND", "openai")
+    LLM_GENERATE_QUESTIONS_MODEL: str = os.getenv("LLM_GENERATE_QUESTIONS_MODEL", "gpt-3.5-turbo")
+    LLM_RESPONSE_EVALUATION_BACKEND: str = os.getenv("LLM_RESPONSE_EVALUATION_BACKEND", "openai")
+    LLM_RESPONSE_EVALUATION_MODEL: str = os.getenv("LLM_RESPONSE_EVALUATION_MODEL", "gpt-3.5-turbo")
+    LLM_VALIDATION_BACKEND: str = os.getenv("LLM_VALIDATION_BACKEND", "openai")
+    LLM_VALIDATION_MODEL: str = os.getenv("LLM_VALIDATION_MODEL", "gpt-3.5-turbo")
+    LLM_GENERATE_QUESTIONS_MAX_PROMPT_TOKENS: int = os.getenv("LLM_GENERATE_QUESTIONS_MAX_PROMPT_TOKENS", 1000)
+    LLM_RESPONSE_EVALUATION_MAX_PROMPT_TOKENS: int = os.getenv("LLM_RESPONSE_EVALUATION_MAX_PROMPT_TOKENS", 12000)
+    LLM_VALIDATION_MAX_PROMPT_TOKENS: int = os.getenv("LLM_VALIDATION_MAX_PROMPT_TOKENS", 12000)
+    LLM_LOCAL_BASE_URL: str = os.getenv("LLM_LOCAL_BASE_URL", "http://127.0.0.1:8080/v1")
+    LLM_LOCAL_API_KEY: str = os.getenv("LLM_LOCAL_API_KEY", "local")
+    LLM_FAKE_LATENCY_DISTRIBUTION: str = os.getenv("LLM_FAKE_LATENCY_DISTRIBUTION", "lognormal")
+    LLM_FAKE_LATENCY_MEAN: float = os.getenv("LLM_FAKE_LATENCY_MEAN", 1)
+    LLM_FAKE_LATENCY_STDDEV: float = os.getenv("LLM_FAKE_LATENCY_STDDEV", 0.5)
+    LLM_FAKE_STREAM_CHUNK_SIZE: int = os.getenv("LLM_FAKE_STREAM_CHUNK_SIZE", 16)
+    LLM_FAKE_STREAM_CHUNK_INTERVAL: float = os.getenv("LLM_FAKE_STREAM_CHUNK_INTERVAL", 0.02)
+    LLM_FAKE_SEED: int = os.getenv("LLM_FAKE_SEED", 0)
+
+    TRACING_ENABLED: bool = bool(os.getenv("TRACING_ENABLED", ""))
+    TRACING_SAMPLE_RATE: float = os.getenv("TRACING_SAMPLE_RATE", 1.0)
+    TRACING_EXPORT_PATH: str = os.getenv("TRACING_EXPORT_PATH", "/tmp/traces.ndjson")
+    TRACING_EXPORT_BATCH_SIZE: int = os.getenv("TRACING_EXPORT_BATCH_SIZE", 512)
+    TRACING_EXPORT_INTERVAL: float = os.getenv("TRACING_EXPORT_INTERVAL", 5)
+    TRACING_EXPORT_MAX_QUEUE_SIZE: int = os.getenv("TRACING_EXPORT_MAX_QUEUE_SIZE", 4096)
+
+    CONNECTION_POOLS_REDIS_WARM_CONNECTIONS: int = os.getenv("CONNECTION_POOLS_REDIS_WARM_CONNECTIONS", 10)
+    CONNECTION_POOLS_WARM_UP_TIMEOUT: float = os.getenv("CONNECTION_POOLS_WARM_UP_TIMEOUT", 10)
+    CONNECTION_POOLS_WARM_UP_RETRY_DELAY: float = os.getenv("CONNECTION_POOLS_WARM_UP_RETRY_DELAY", 1)
+
+    QUESTIONS_CACHE_POOL_SIZE: int = os.getenv("QUESTIONS_CACHE_POOL_SIZE", 5)
+    QUESTIONS_CACHE_TTL: int = os.getenv("QUESTIONS_CACHE_TTL", 60 * 60 * 24)
+    QUESTIONS_CACHE_LOCAL_MAXSIZE: int = os.getenv("QUESTIONS_CACHE_LOCAL_MAXSIZE", 1024)
+    QUESTIONS_CACHE_STATS_FLUSH_INTERVAL: float = os.getenv("QUESTIONS_CACHE_STATS_FLUSH_INTERVAL", 10)
+
+    EVALUATION_CACHE_TTL: int = os.getenv("EVALUATION_CACHE_TTL", 60 * 60 * 24)
+    EVALUATION_CACHE_LOCAL_MAXSIZE: int = os.getenv("EVALUATION_CACHE_LOCAL_MAXSIZE", 1024)
+
+    SINGLE_FLIGHT_LOCK_TIMEOUT: int = os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", 120)
+    SINGLE_FLIGHT_RESULT_TTL: int = os.getenv("SINGLE_FLIGHT_RESULT_TTL", 10)
+
+    SPECULATIVE_VALIDATION_ENABLED: bool = bool(os.getenv("SPECULATIVE_VALIDATION_ENABLED", ""))
+    SPECULATION_CONCURRENCY: int = os.getenv("SPECULATION_CONCURRENCY", 4)
+
+    BATCH_EVALUATION_TOKEN_BUDGET: int = os.getenv("BATCH_EVALUATION_TOKEN_BUDGET", 4000)
+    BATCH_EVALUATION_CONCURRENCY: int = os.getenv("BATCH_EVALUATION_CONCURRENCY", 4)
+
+    BATCH_JOBS_BACKEND: str = os.getenv("BATCH_JOBS_BACKEND", "openai")
+    BATCH_JOBS_BUCKET_NAME: str = os.getenv("BATCH_JOBS_BUCKET_NAME", "batch-jobs")
+    BATCH_JOBS_POLL_INTERVAL: float = os.getenv("BATCH_JOBS_POLL_INTERVAL", 30)
+    BATCH_JOBS_FAKE_LATENCY: float = os.getenv("BATCH_JOBS_FAKE_LATENCY", 1)
+    BATCH_JOBS_TTL: int = os.getenv("BATCH_JOBS_TTL", 60 * 60 * 24 * 7)
+    BATCH_JOBS_LOCK_TIMEOUT: int = os.getenv("BATCH_JOBS_LOCK_TIMEOUT", 60 * 10)
+
+    JOBS_QUESTIONS_CONCURRENCY: int = os.getenv("JOBS_QUESTIONS_CONCURRENCY", 4)
+    JOBS_EVALUATION_CONCURRENCY: int = os.getenv("JOBS_EVALUATION_CONCURRENCY", 4)
+    JOBS_VALIDATION_CONCURRENCY: int = os.getenv("JOBS_VALIDATION_CONCURRENCY", 4)
+    JOBS_RESULT_TTL: int = os.getenv("JOBS_RESULT_TTL", 60 * 60 * 24)
+    JOBS_MAX_ATTEMPTS: int = os.getenv("JOBS_MAX_ATTEMPTS", 3)
+    JOBS_RETRY_IDLE: float = os.getenv("JOBS_RETRY_IDLE", 60)
+    JOBS_BLOCK: float = os.getenv("JOBS_BLOCK", 5)
+    JOBS_WEBHOOK_TIMEOUT: float = os.getenv("JOBS_WEBHOOK_TIMEOUT", 10)
+    JOBS_WEBHOOK_ATTEMPTS: int = os.getenv("JOBS_WEBHOOK_ATTEMPTS", 3)
+    JOBS_WEBHOOK_SECRET: str = os.getenv("JOBS_WEBHOOK_SECRET", "")
+    # Comma-separated hosts, or URL prefixes like "https://hooks.example.com/interviews/", callbacks may go to.
+    JOBS_WEBHOOK_ALLOWED_URLS: str = os.getenv("JOBS_WEBHOOK_ALLOWED_URLS", "")
+
     class Config:
         frozen = True
@@ -1,16 +1,41 @@
 import functools
-from typing import Callable
+import inspect
+from typing import Any, Callable
 
+import aiohttp
 import miniopy_async
 import redis.asyncio as redis
-from fastapi import Depends
+from fastapi import Depends, params
 from openai import AsyncOpenAI
 
 from infrastructure.agents import GenerateQuestionsAgent, ResponseEvaluationAgent, ValidationAgent
 from config import Config
+from infrastructure.batch_jobs import BatchClient, BatchJobsRegistry, FakeBatchClient, OpenAIBatchClient
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.evaluation_cache import EvaluationCache
 from infrastructure.files_storage import FilesStorage
+from infrastructure.http_pools import HTTPPoolMonitor, PooledMinio, create_minio_session, create_openai_http_client
+from infrastructure.jobs import JobQueue
+from infrastructure.llm_backends import (
+    FakeLLMBackend, LLMBackend, LocalLLMBackend, OpenAILLMBackend, get_agents_llm_backends,
+)
+from infrastructure.llm_scheduler import LLMScheduler
+from infrastructure.metrics import (
+    FILES_STORAGE_OPERATION_DURATION, SHARED_CONTEXT_OPERATION_DURATION, instrument_async_methods,
+)
+from infrastructure.persistence_queue import PersistenceQueue
+from infrastructure.prompts import get_tokenizer
+from infrastructure.questions_cache import QuestionsCache
+from infrastructure.redis_shards import RedisShards, create_redis_shards
+from infrastructure.session_archive import SessionArchive
+from infrastructure.session_reaper import SessionReaper
 from infrastructure.shared_context import SharedContext
-from services import GenerateQuestionsService, EvaluateResponsesService, ValidationService
+from infrastructure.single_flight import SingleFlight
+from infrastructure.speculation import Speculation
+from infrastructure.tracing import trace_async_methods
+from services import (
+    GenerateQuestionsService, EvaluateResponsesService, ValidationService, BatchJobsService, JobsService,
+)
 
 
 class Stub:
@@ -36,88 +61,458 @@ class Stub:
 
 
 class DependenciesOverrides:
+    """
+    Providers of the application dependencies. The lifespan resolves them once through a `Container`. Without it, like
+    with a `TestClient` used outside the lifespan, FastAPI calls the providers on every request, so they are memoised
+    per instance and hand out the same clients instead of opening new connections.
+    """
+
     def __init__(self, config: Config):
         self.config = config
         self.db_sessionmaker = None
+        self._instances: dict[Callable, Any] = {}
 
     def override_dependencies(self) -> dict:
-        return {
+        providers = {
             Config: self.get_config,
             redis.Redis: self.get_redis_shared_context_connection,
             miniopy_async.Minio: self.get_minio_client,
+            aiohttp.ClientSession: self.get_minio_session,
             FilesStorage: self.get_files_storage,
             AsyncOpenAI: self.get_openai_client,
+            LLMScheduler: self.get_llm_scheduler,
+            Stub(AsyncOpenAI, backend="local"): self.get_local_llm_client,
+            # Only the backends of the agents are in the graph, the others aren't built.
+            Stub(LLMBackend, agent="generate_questions"): self._get_llm_backend_provider(
+                self.config.LLM_GENERATE_QUESTIONS_BACKEND,
+            ),
+            Stub(LLMBackend, agent="response_evaluation"): self._get_llm_backend_provider(
+                self.config.LLM_RESPONSE_EVALUATION_BACKEND,
+            ),
+            Stub(LLMBackend, agent="validation"): self._get_llm_backend_provider(self.config.LLM_VALIDATION_BACKEND),
             GenerateQuestionsAgent: self.get_generate_questions_agent,
             ResponseEvaluationAgent: self.get_response_evaluation_agent,
             ValidationAgent: self.get_validation_agent,
+            RedisShards: self.get_shared_context_redis_shards,
+            Stub(RedisShards, role="fallback"): self.get_shared_context_fallback_redis_shards,
             SharedContext: self.get_shared_context,
+            QuestionsCache: self.get_questions_cache,
+            EvaluationCache: self.get_evaluation_cache,
+            SingleFlight: self.get_single_flight,
+            Speculation: self.get_speculation,
             GenerateQuestionsService: self.get_questions_generation_service,
             EvaluateResponsesService: self.get_responses_evaluation_service,
             ValidationService: self.get_validation_service,
+            BatchClient: self.get_batch_client,
+            BatchJobsRegistry: self.get_batch_jobs_registry,
+            BatchJobsService: self.get_batch_jobs_service,
+            JobQueue: self.get_job_queue,
+            JobsService: self.get_jobs_service,
+            SessionReaper: self.get_session_reaper,
+            PersistenceQueue: self.get_persistence_queue,
+            SessionArchive: self.get_session_archive,
+            ConnectionPools: self.get_connection_pools,
+            Stub(HTTPPoolMonitor, pool="openai"): self.get_openai_http_pool_monitor,
+            Stub(HTTPPoolMonitor, pool="minio"): self.get_minio_http_pool_monitor,
+            Stub(HTTPPoolMonitor, pool="local_llm"): self.get_local_llm_http_pool_monitor,
         }
+        return {dependency: self._memoise(provider) for dependency, provider in providers.items()}
 
     def get_config(self):
         return self.config
 
-    @functools.lru_cache(maxsize=1)
     def get_redis_shared_context_connection(self):
         return redis.Redis.from_url(self.config.REDIS_HOST_URL, db=self.config.REDIS_SHARED_CONTEXT_DB)
 
-    @functools.lru_cache(maxsize=1)
-    def get_minio_client(self):
-        return miniopy_async.Minio(
+    def get_minio_client(self, session: aiohttp.ClientSession = Depends(Stub(aiohttp.ClientSession))):
+        return PooledMinio(
+            session=session,
             endpoint=self.config.MINIO_URL,
             secure=self.config.MINIO_SECURE,
             access_key=self.config.MINIO_ACCESS_KEY,
             secret_key=self.config.MINIO_SECRET_KEY,
+            region=self.config.MINIO_REGION,
         )
 
-    @functools.lru_cache(maxsize=1)
+    def get_minio_http_pool_monitor(self):
+        return HTTPPoolMonitor("minio", int(self.config.MINIO_HTTP_MAX_CONNECTIONS))
+
+    def get_minio_session(self, monitor: HTTPPoolMonitor = Depends(Stub(HTTPPoolMonitor, pool="minio"))):
+        return create_minio_session(self.config, monitor)
+
     def get_files_storage(
             self,
             config: Config = Depends(Stub(Config)),
             minio_client: miniopy_async.Minio = Depends(Stub(miniopy_async.Minio)),
+            minio_session: aiohttp.ClientSession = Depends(Stub(aiohttp.ClientSession)),
+    ):
+        files_storage = instrument_async_methods(
+            FilesStorage(config, minio_client, minio_session), FILES_STORAGE_OPERATION_DURATION,
+        )
+        return trace_async_methods(files_storage, "files_storage")
+
+    def get_openai_http_pool_monitor(self):
+        return HTTPPoolMonitor("openai", int(self.config.OPENAI_HTTP_MAX_CONNECTIONS))
+
+    def get_openai_client(self, monitor: HTTPPoolMonitor = Depends(Stub(HTTPPoolMonitor, pool="openai"))):
+        # Retries are made by the LLM scheduler, so they are paced together with the other queued calls.
+        return AsyncOpenAI(
+            api_key=self.config.OPENAI_API_KEY,
+            base_url=self.config.OPENAI_BASE_URL,
+            max_retries=0,
+            http_client=create_openai_http_client(self.config, monitor),
+        )
+
+    def get_llm_scheduler(self):
+        return LLMScheduler(self.config)
+
+    def get_local_llm_http_pool_monitor(self):
+        if "local" not in get_agents_llm_backends(self.config):
+            return None
+        return HTTPPoolMonitor("local_llm", int(self.config.OPENAI_HTTP_MAX_CONNECTIONS))
+
+    def get_local_llm_client(
+            self,
+            monitor: HTTPPoolMonitor | None = Depends(Stub(HTTPPoolMonitor, pool="local_llm")),
+    ):
+        if monitor is None:
+            return None
+        # The pool of a local server is sized by the same settings as the OpenAI one.
+        return AsyncOpenAI(
+            api_key=self.config.LLM_LOCAL_API_KEY,
+            base_url=self.config.LLM_LOCAL_BASE_URL,
+            max_retries=0,
+            http_client=create_openai_http_client(self.config, monitor),
+        )
+
+    def get_openai_llm_backend(
+            self,
+            client: AsyncOpenAI = Depends(Stub(AsyncOpenAI)),
+            scheduler: LLMScheduler = Depends(Stub(LLMScheduler)),
+    ):
+        return OpenAILLMBackend(client, scheduler)
+
+    def get_local_llm_backend(
+            self,
+            client: AsyncOpenAI = Depends(Stub(AsyncOpenAI, backend="local")),
+            scheduler: LLMScheduler = Depends(Stub(LLMScheduler)),
+    ):
+        return LocalLLMBackend(client, scheduler)
+
+    def get_fake_llm_backend(
+            self,
+            config: Config = Depends(Stub(Config)),
+            scheduler: LLMScheduler = Depends(Stub(LLMScheduler)),
+    ):
+        return FakeLLMBackend(config, scheduler)
+
+    def get_generate_questions_agent(
+            self,
+            backend: LLMBackend = Depends(Stub(LLMBackend, agent="generate_questions")),
+    ):
+        return GenerateQuestionsAgent(
+            backend,
+            self.config.LLM_GENERATE_QUESTIONS_MODEL,
+            get_tokenizer(self.config.LLM_GENERATE_QUESTIONS_MODEL),
+            int(self.config.LLM_GENERATE_QUESTIONS_MAX_PROMPT_TOKENS),
+        )
+
+    def get_response_evaluation_agent(
+            self,
+            backend: LLMBackend = Depends(Stub(LLMBackend, agent="response_evaluation")),
     ):
-        return FilesStorage(config, minio_client)
+        return ResponseEvaluationAgent(
+            backend,
+            self.config.LLM_RESPONSE_EVALUATION_MODEL,
+            get_tokenizer(self.config.LLM_RESPONSE_EVALUATION_MODEL),
+            int(self.config.LLM_RESPONSE_EVALUATION_MAX_PROMPT_TOKENS),
+        )
 
-    @functools.lru_cache(maxsize=1)
-    def get_openai_client(self):
-        return AsyncOpenAI(api_key=self.config.OPENAI_API_KEY)
+    def get_validation_agent(
+            self,
+            backend: LLMBackend = Depends(Stub(LLMBackend, agent="validation")),
+    ):
+        return ValidationAgent(
+            backend,
+            self.config.LLM_VALIDATION_MODEL,
+            get_tokenizer(self.config.LLM_VALIDATION_MODEL),
+            int(self.config.LLM_VALIDATION_MAX_PROMPT_TOKENS),
+        )
 
-    @functools.lru_cache(maxsize=1)
-    def get_generate_questions_agent(self, client: AsyncOpenAI = Depends(Stub(AsyncOpenAI))):
-        return GenerateQuestionsAgent(client)
+    def get_shared_context_redis_shards(self, redis_connection: redis.Redis = Depends(Stub(redis.Redis))):
+        return create_redis_shards(
+            self.config.REDIS_SHARED_CONTEXT_MODE,
+            self._split_urls(self.config.REDIS_SHARED_CONTEXT_URLS),
+            int(self.config.REDIS_SHARED_CONTEXT_VIRTUAL_NODES),
+            redis_connection,
+        )
 
-    @functools.lru_cache(maxsize=1)
-    def get_response_evaluation_agent(self, client: AsyncOpenAI = Depends(Stub(AsyncOpenAI))):
-        return ResponseEvaluationAgent(client)
+    def get_shared_context_fallback_redis_shards(self, redis_connection: redis.Redis = Depends(Stub(redis.Redis))):
+        if not self.config.REDIS_SHARED_CONTEXT_FALLBACK_MODE:
+            return None
+        return create_redis_shards(
+            self.config.REDIS_SHARED_CONTEXT_FALLBACK_MODE,
+            self._split_urls(self.config.REDIS_SHARED_CONTEXT_FALLBACK_URLS),
+            int(self.config.REDIS_SHARED_CONTEXT_VIRTUAL_NODES),
+            redis_connection,
+        )
 
-    @functools.lru_cache(maxsize=1)
-    def get_validation_agent(self, client: AsyncOpenAI = Depends(Stub(AsyncOpenAI))):
-        return ValidationAgent(client)
+    def get_shared_context(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_shards: RedisShards = Depends(Stub(RedisShards)),
+            fallback_redis_shards: RedisShards | None = Depends(Stub(RedisShards, role="fallback")),
+    ):
+        shared_context = instrument_async_methods(
+            SharedContext(config, redis_shards, fallback_redis_shards), SHARED_CONTEXT_OPERATION_DURATION,
+        )
+        return trace_async_methods(shared_context, "shared_context")
 
-    def get_shared_context(self, redis_connection: redis.Redis = Depends(Stub(redis.Redis))):
-        return SharedContext(redis_connection)
+    def get_questions_cache(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+    ):
+        return QuestionsCache(config, redis_connection)
+
+    def get_evaluation_cache(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+    ):
+        return EvaluationCache(config, redis_connection)
+
+    def get_single_flight(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+    ):
+        return SingleFlight(config, redis_connection)
+
+    def get_speculation(
+            self,
+            config: Config = Depends(Stub(Config)),
+            single_flight: SingleFlight = Depends(Stub(SingleFlight)),
+    ):
+        return Speculation(config, single_flight)
 
     def get_questions_generation_service(
             self,
             shared_context: SharedContext = Depends(Stub(SharedContext)),
             agent: GenerateQuestionsAgent = Depends(Stub(GenerateQuestionsAgent)),
+            questions_cache: QuestionsCache = Depends(Stub(QuestionsCache)),
+            single_flight: SingleFlight = Depends(Stub(SingleFlight)),
     ):
-        return GenerateQuestionsService(shared_context, agent)
+        return GenerateQuestionsService(shared_context, agent, questions_cache, single_flight)
 
     def get_responses_evaluation_service(
             self,
+            config: Config = Depends(Stub(Config)),
             shared_context: SharedContext = Depends(Stub(SharedContext)),
             agent: ResponseEvaluationAgent = Depends(Stub(ResponseEvaluationAgent)),
+            single_flight: SingleFlight = Depends(Stub(SingleFlight)),
+            evaluation_cache: EvaluationCache = Depends(Stub(EvaluationCache)),
+            validation_service: ValidationService = Depends(Stub(ValidationService)),
     ):
-        return EvaluateResponsesService(shared_context, agent)
+        return EvaluateResponsesService(
+            config, shared_context, agent, single_flight, evaluation_cache, validation_service,
+        )
 
     def get_validation_service(
             self,
             config: Config = Depends(Stub(Config)),
             shared_context: SharedContext = Depends(Stub(SharedContext)),
             agent: ValidationAgent = Depends(Stub(ValidationAgent)),
-            files_storage_client: FilesStorage = Depends(Stub(FilesStorage))
+            files_storage_client: FilesStorage = Depends(Stub(FilesStorage)),
+            single_flight: SingleFlight = Depends(Stub(SingleFlight)),
+            persistence_queue: PersistenceQueue = Depends(Stub(PersistenceQueue)),
+            session_archive: SessionArchive = Depends(Stub(SessionArchive)),
+            evaluation_cache: EvaluationCache = Depends(Stub(EvaluationCache)),
+            speculation: Speculation = Depends(Stub(Speculation)),
     ):
-        return ValidationService(config, shared_context, agent, files_storage_client)
+        return ValidationService(
+            config, shared_context, agent, files_storage_client, single_flight, persistence_queue, session_archive,
+            evaluation_cache, speculation,
+        )
+
+    def get_batch_client(
+            self,
+            client: AsyncOpenAI = Depends(Stub(AsyncOpenAI)),
+            files_storage_client: FilesStorage = Depends(Stub(FilesStorage)),
+    ):
+        if self.config.BATCH_JOBS_BACKEND == "fake":
+            return FakeBatchClient(self.config, files_storage_client)
+        return OpenAIBatchClient(client)
+
+    def get_batch_jobs_registry(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+    ):
+        return BatchJobsRegistry(config, redis_connection)
+
+    def get_batch_jobs_service(
+            self,
+            config: Config = Depends(Stub(Config)),
+            shared_context: SharedContext = Depends(Stub(SharedContext)),
+            files_storage_client: FilesStorage = Depends(Stub(FilesStorage)),
+            batch_client: BatchClient = Depends(Stub(BatchClient)),
+            batch_jobs_registry: BatchJobsRegistry = Depends(Stub(BatchJobsRegistry)),
+            evaluation_agent: ResponseEvaluationAgent = Depends(Stub(ResponseEvaluationAgent)),
+            validation_agent: ValidationAgent = Depends(Stub(ValidationAgent)),
+            validation_service: ValidationService = Depends(Stub(ValidationService)),
+    ):
+        return BatchJobsService(
+            config, shared_context, files_storage_client, batch_client, batch_jobs_registry, evaluation_agent,
+            validation_agent, validation_service,
+        )
+
+    def get_job_queue(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+    ):
+        return JobQueue(config, redis_connection)
+
+    def get_jobs_service(
+            self,
+            config: Config = Depends(Stub(Config)),
+            job_queue: JobQueue = Depends(Stub(JobQueue)),
+            generate_questions_service: GenerateQuestionsService = Depends(Stub(GenerateQuestionsService)),
+            evaluate_responses_service: EvaluateResponsesService = Depends(Stub(EvaluateResponsesService)),
+            validation_service: ValidationService = Depends(Stub(ValidationService)),
+    ):
+        return JobsService(
+            config, job_queue, generate_questions_service, evaluate_responses_service, validation_service,
+        )
+
+    def get_session_reaper(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+            shared_context: SharedContext = Depends(Stub(SharedContext)),
+            files_storage_client: FilesStorage = Depends(Stub(FilesStorage)),
+    ):
+        return SessionReaper(config, redis_connection, shared_context, files_storage_client)
+
+    def get_persistence_queue(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+            files_storage_client: FilesStorage = Depends(Stub(FilesStorage)),
+    ):
+        return PersistenceQueue(config, redis_connection, files_storage_client)
+
+    def get_session_archive(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+            files_storage_client: FilesStorage = Depends(Stub(FilesStorage)),
+    ):
+        return SessionArchive(config, redis_connection, files_storage_client)
+
+    def get_connection_pools(
+            self,
+            config: Config = Depends(Stub(Config)),
+            redis_connection: redis.Redis = Depends(Stub(redis.Redis)),
+            minio_session: aiohttp.ClientSession = Depends(Stub(aiohttp.ClientSession)),
+            openai_client: AsyncOpenAI = Depends(Stub(AsyncOpenAI)),
+            local_llm_client: AsyncOpenAI | None = Depends(Stub(AsyncOpenAI, backend="local")),
+            openai_http_pool_monitor: HTTPPoolMonitor = Depends(Stub(HTTPPoolMonitor, pool="openai")),
+            minio_http_pool_monitor: HTTPPoolMonitor = Depends(Stub(HTTPPoolMonitor, pool="minio")),
+            local_llm_http_pool_monitor: HTTPPoolMonitor | None = Depends(Stub(HTTPPoolMonitor, pool="local_llm")),
+            shared_context_redis_shards: RedisShards = Depends(Stub(RedisShards)),
+            shared_context_fallback_redis_shards: RedisShards | None = Depends(Stub(RedisShards, role="fallback")),
+    ):
+        return ConnectionPools(
+            config,
+            redis_connection,
+            minio_session,
+            openai_client,
+            local_llm_client,
+            [
+                monitor for monitor in (openai_http_pool_monitor, minio_http_pool_monitor, local_llm_http_pool_monitor)
+                if monitor is not None
+            ],
+            [
+                redis_shards for redis_shards in (shared_context_redis_shards, shared_context_fallback_redis_shards)
+                if redis_shards is not None
+            ],
+        )
+
+    def _memoise(self, provider: Callable) -> Callable:
+        # Keyed by the provider, so dependencies sharing one, like agents on one LLM backend, share its instance.
+        @functools.wraps(provider)
+        def memoised_provider(*args, **kwargs):
+            if provider not in self._instances:
+                self._instances[provider] = provider(*args, **kwargs)
+            return self._instances[provider]
+
+        return memoised_provider
+
+    @staticmethod
+    def _split_urls(urls: str) -> list[str]:
+        return [url.strip() for url in urls.split(",") if url.strip()]
+
+    def _get_llm_backend_provider(self, name: str) -> Callable:
+        providers = {
+            "openai": self.get_openai_llm_backend,
+            "local": self.get_local_llm_backend,
+            "fake": self.get_fake_llm_backend,
+        }
+        if name not in providers:
+            raise ValueError(f"Unknown LLM backend: {name}")
+        return providers[name]
+
+
+class Container:
+    """
+    Resolves the dependency graph declared by the providers of a dependency overrides mapping once.
+
+    FastAPI solves the whole `Stub` chain of a handler again on every request, inspecting every provider on the way
+    and running the sync ones in its threadpool. The container calls every provider once with its resolved `Stub`
+    dependencies and replaces it with an async provider returning the instance, so a request only looks up its
+    direct dependencies. Providers with any other parameters depend on the request and are left to FastAPI.
+    """
+
+    def __init__(self, providers: dict):
+        self._providers = dict(providers)
+        self._instances = {}
+
+    def resolve(self, dependency: Any) -> Any:
+        if dependency in self._instances:
+            return self._instances[dependency]
+        provider = self._providers[dependency]
+        instance = provider(
+            **{
+                name: self.resolve(parameter.default.dependency)
+                for name, parameter in inspect.signature(provider).parameters.items()
+            }
+        )
+        self._instances[dependency] = instance
+        return instance
+
+    def resolve_all(self):
+        for dependency, provider in self._providers.items():
+            if self._is_resolvable(provider):
+                self.resolve(dependency)
+
+    def get_dependency_overrides(self) -> dict:
+        """Returns async providers of the resolved instances, to be merged into `FastAPI.dependency_overrides`."""
+        return {dependency: self._get_instance_provider(instance) for dependency, instance in self._instances.items()}
+
+    def _is_resolvable(self, provider: Callable) -> bool:
+        return all(
+            isinstance(parameter.default, params.Depends)
+            and isinstance(parameter.default.dependency, Stub)
+            and parameter.default.dependency in self._providers
+            and self._is_resolvable(self._providers[parameter.default.dependency])
+            for parameter in inspect.signature(provider).parameters.values()
+        )
+
+    @staticmethod
+    def _get_instance_provider(instance: Any) -> Callable:
+        async def provide_instance():
+            return instance
+
+        return provide_instance
@@ -1,5 +1,8 @@
 import typing
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
+
+# Pydantic validates agent outputs against these TypedDicts, which needs the `typing_extensions` ones before 3.12.
+from typing_extensions import TypedDict
 
 
 @dataclass(slots=True)
@@ -19,13 +22,116 @@ class SharedContextCandidateFullInfo:
     scores: list[int]
     response_comments: list[str]
     feedback: str
+    # Token of the stored session it was read from, writes of an outdated session are rejected. Not part of the record.
+    revision: str = ""
+
+    def to_record(self) -> dict:
+        """Fields of the session as stored and exported, without the revision."""
+        record = asdict(self)
+        del record["revision"]
+        return record
+
+
+class GeneratedQuestionsAgentResult(TypedDict):
+    questions: list[str]
 
 
-class ResponseEvaluationAgentResult(typing.TypedDict):
+class ResponseEvaluationAgentResult(TypedDict):
     score: int
     comment: str
 
 
-class ValidationAgentResult(typing.TypedDict):
+class ResponseEvaluationAgentScores(TypedDict):
+    scores: list[ResponseEvaluationAgentResult]
+
+
+class ValidationAgentResult(TypedDict):
     scores: list[ResponseEvaluationAgentResult]
     feedback: str
+
+
+@dataclass(slots=True)
+class QuestionsCacheStats:
+    hits: int
+    local_hits: int
+    misses: int
+
+
+@dataclass(slots=True)
+class StreamEvent:
+    event: str
+    data: typing.Any
+
+
+@dataclass(slots=True)
+class BatchEvaluationResult:
+    candidate_id: str
+    scores: list[ResponseEvaluationAgentResult] | None = None
+    error: str | None = None
+
+
+@dataclass(slots=True)
+class BatchJob:
+    job_id: str
+    kind: str
+    batch_id: str
+    status: str
+    candidate_ids: list[str]
+    failed_candidate_ids: list[str]
+    created_at: float
+
+
+@dataclass(slots=True)
+class Job:
+    job_id: str
+    queue: str
+    status: str
+    payload: dict
+    callback_url: str | None
+    attempts: int
+    result: typing.Any | None
+    error: str | None
+    created_at: float
+    finished_at: float | None
+
+
+@dataclass(slots=True)
+class PersistenceQueueStats:
+    depth: int
+    pending: int
+    lag: int
+    dead_letters: int
+    oldest_entry_age_seconds: float
+
+
+@dataclass(slots=True)
+class StorageObject:
+    bucket_name: str
+    object_name: str
+    data: bytes
+    content_type: str
+
+
+@dataclass(slots=True)
+class LLMSchedulerStats:
+    in_flight: int
+    queued: int
+    concurrency_limit: float
+    queue_wait_seconds: float
+    latency_seconds: float
+    remaining_requests: int | None
+    remaining_tokens: int | None
+    shed: int
+    retries: int
+    throttled: int
+
+
+@dataclass(slots=True)
+class HTTPPoolStats:
+    name: str
+    max_connections: int
+    in_flight: int
+    peak_in_flight: int
+    queued: int
+    requests: int
+    connections_created: int
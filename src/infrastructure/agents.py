@@ -1,14 +1,157 @@
-import json
+import time
+from typing import Any, AsyncIterator, Callable
 
-from openai import AsyncOpenAI
+from openai.types import CompletionUsage
+from pydantic import TypeAdapter
 
-from dto import ResponseEvaluationAgentResult, ValidationAgentResult
+from dto import (
+    GeneratedQuestionsAgentResult, ResponseEvaluationAgentResult, ResponseEvaluationAgentScores,
+    SharedContextCandidateFullInfo, ValidationAgentResult,
+)
+from infrastructure.evaluation_cache import get_evaluation_cache_key
+from infrastructure.llm_backends import LLMBackend, estimate_tokens, get_response_format_kwargs
+from infrastructure.llm_scheduler import Priority
+from infrastructure.metrics import (
+    LLM_CALL_DURATION, LLM_CALL_TOKENS, LLM_STRUCTURED_OUTPUT_WASTED_TOKENS, LLM_STRUCTURED_OUTPUTS,
+)
+from infrastructure.prompts import PromptBuilder, Tokenizer, minify_prompt
+from infrastructure.structured_output import StructuredOutputError, parse_structured_output
+from infrastructure.tracing import Span, tracer
+
+GENERATED_QUESTIONS_OUTPUT = TypeAdapter(GeneratedQuestionsAgentResult)
+RESPONSE_EVALUATION_OUTPUT = TypeAdapter(ResponseEvaluationAgentScores)
+RESPONSES_BATCH_EVALUATION_OUTPUT = TypeAdapter(dict[str, list[ResponseEvaluationAgentResult]])
+VALIDATION_OUTPUT = TypeAdapter(ValidationAgentResult)
+
+
+def get_llm_span_attributes(agent: str, backend: LLMBackend, model: str, priority: Priority) -> dict:
+    return {"llm.model": model, "llm.backend": backend.name, "llm.agent": agent, "llm.priority": priority.name}
+
+
+def set_llm_span_usage(span: Span, usage: CompletionUsage | None):
+    if usage is not None:
+        span.set_attribute("llm.prompt_tokens", usage.prompt_tokens)
+        span.set_attribute("llm.completion_tokens", usage.completion_tokens)
+
+
+def observe_llm_call(agent: str, operation: str, started_at: float, usage: CompletionUsage | None):
+    LLM_CALL_DURATION.labels(agent, operation).observe(time.perf_counter() - started_at)
+    if usage is not None:
+        LLM_CALL_TOKENS.labels(agent, "prompt").observe(usage.prompt_tokens)
+        LLM_CALL_TOKENS.labels(agent, "completion").observe(usage.completion_tokens)
+
+
+def observe_wasted_tokens(agent: str, content: str, usage: CompletionUsage | None = None):
+    LLM_STRUCTURED_OUTPUT_WASTED_TOKENS.labels(agent).inc(
+        usage.total_tokens if usage is not None else estimate_tokens(content),
+    )
+
+
+async def create_chat_completion_content(
+        agent: str,
+        backend: LLMBackend,
+        model: str,
+        priority: Priority,
+        messages: list[dict],
+) -> tuple[str, CompletionUsage | None]:
+    started_at = time.perf_counter()
+    with tracer.start_span("llm.chat_completion", **get_llm_span_attributes(agent, backend, model, priority)) as span:
+        result = await backend.create_chat_completion(priority, model, messages, json_output=True)
+        usage = getattr(result, "usage", None)
+        set_llm_span_usage(span, usage)
+    observe_llm_call(agent, "completion", started_at, usage)
+    return (result.choices[0].message.content or "").strip(), usage
+
+
+async def create_structured_completion(
+        agent: str,
+        backend: LLMBackend,
+        model: str,
+        priority: Priority,
+        messages: list[dict],
+        parse: Callable[[str], tuple[Any, bool]],
+) -> Any:
+    """
+    Returns the completion parsed by `parse`, which also tells whether the output had to be repaired.
+    An output beyond repair is re-asked once, with the rejected reply and what is wrong with it, which is cheaper
+    than failing the request and having the client retry it from scratch.
+    """
+    content, usage = await create_chat_completion_content(agent, backend, model, priority, messages)
+    try:
+        result, repaired = parse(content)
+    except StructuredOutputError as e:
+        observe_wasted_tokens(agent, content, usage)
+        reask_messages = [
+            *messages,
+            {"role": "assistant", "content": content},
+            {
+                "role": "user",
+                "content": f"Your reply is not valid: {e}. Reply again with only the JSON in the required format.",
+            },
+        ]
+        content, usage = await create_chat_completion_content(agent, backend, model, priority, reask_messages)
+        try:
+            result, _ = parse(content)
+        except StructuredOutputError:
+            observe_wasted_tokens(agent, content, usage)
+            LLM_STRUCTURED_OUTPUTS.labels(agent, "failed").inc()
+            raise
+        outcome = "reasked"
+    else:
+        outcome = "repaired" if repaired else "valid"
+    LLM_STRUCTURED_OUTPUTS.labels(agent, outcome).inc()
+    return result
+
+
+def parse_agent_output(agent: str, content: str, parse: Callable[[str], tuple[Any, bool]]) -> Any:
+    """Parses an output which can't be re-asked, like a streamed or a batched one."""
+    try:
+        result, repaired = parse(content)
+    except StructuredOutputError:
+        observe_wasted_tokens(agent, content)
+        LLM_STRUCTURED_OUTPUTS.labels(agent, "failed").inc()
+        raise
+    LLM_STRUCTURED_OUTPUTS.labels(agent, "repaired" if repaired else "valid").inc()
+    return result
+
+
+def check_scores(scores: list[ResponseEvaluationAgentResult], questions_count: int):
+    if len(scores) != questions_count:
+        raise StructuredOutputError(f"Expected {questions_count} scores, one per question, got {len(scores)}")
+    for position, score in enumerate(scores):
+        if not 1 <= score["score"] <= 5:
+            raise StructuredOutputError(f"Score {position} is {score['score']}, expected from 1 to 5")
+
+
+async def stream_chat_completion_content(
+        agent: str,
+        backend: LLMBackend,
+        model: str,
+        priority: Priority,
+        messages: list[dict],
+) -> AsyncIterator[str]:
+    started_at = time.perf_counter()
+    usage = None
+    chunks = backend.stream_chat_completion(priority, model, messages, json_output=True)
+    span_attributes = get_llm_span_attributes(agent, backend, model, priority)
+    with tracer.start_span("llm.chat_completion.stream", **span_attributes) as span:
+        async for chunk in chunks:
+            # With `include_usage` the last chunk has no choices and carries the usage of the whole stream.
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        set_llm_span_usage(span, usage)
+    observe_llm_call(agent, "stream", started_at, usage)
 
 
 class GenerateQuestionsAgent:
-    def __init__(self, client: AsyncOpenAI):
-        self._client = client
-        self._system_content = (
+    name = "generate_questions"
+
+    def __init__(self, backend: LLMBackend, model: str, tokenizer: Tokenizer, max_prompt_tokens: int):
+        self._backend = backend
+        self._model = model
+        self._prompts = PromptBuilder(self.name, tokenizer, max_prompt_tokens)
+        self._system_content = minify_prompt(
             """
             You are an HR assistant tasked with generating interview questions tailored to the candidate's job title.
             The questions should focus on practical technical requirements, skills, and knowledge essential for 
@@ -17,24 +160,53 @@ class GenerateQuestionsAgent:
             
             Output format is a valid JSON string like:
             
-            ["1. [Insert Question]", "2. [Insert Question]"]
+            {"questions": ["1. [Insert Question]", "2. [Insert Question]"]}
             """
         )
 
     async def generate_questions(self, job_title: str) -> list[str]:
-        prompt = f"Generate 3 interview questions for a {job_title}."
-        result = await self._client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "system", "content": self._system_content}, {"role": "user", "content": prompt}]
+        return await create_structured_completion(
+            self.name,
+            self._backend,
+            self._model,
+            Priority.INTERACTIVE,
+            self._get_messages(job_title),
+            self._parse_questions,
+        )
+
+    def stream_questions(self, job_title: str) -> AsyncIterator[str]:
+        return stream_chat_completion_content(
+            self.name, self._backend, self._model, Priority.INTERACTIVE, self._get_messages(job_title),
         )
-        questions = result.choices[0].message.content.strip()
-        return json.loads(questions)
+
+    def parse_questions(self, content: str) -> list[str]:
+        return parse_agent_output(self.name, content, self._parse_questions)
+
+    def _parse_questions(self, content: str) -> tuple[list[str], bool]:
+        result, repaired = parse_structured_output(content, GENERATED_QUESTIONS_OUTPUT)
+        if not result["questions"]:
+            raise StructuredOutputError("Expected at least one question")
+        return result["questions"], repaired
+
+    def _get_messages(self, job_title: str) -> list[dict]:
+        prompt = self._prompts.build_prompt(
+            self._system_content,
+            "Generate 3 interview questions for a {job_title}.",
+            truncated_field="job_title",
+            job_title=job_title,
+        )
+        return self._prompts.build_messages(self._system_content, prompt)
 
 
 class ResponseEvaluationAgent:
-    def __init__(self, client: AsyncOpenAI):
-        self._client = client
-        self._system_content = (
+    name = "response_evaluation"
+    _prompt_template = "Job Title: {job_title}\nQuestions: {questions}\nResponse: {response}\n"
+
+    def __init__(self, backend: LLMBackend, model: str, tokenizer: Tokenizer, max_prompt_tokens: int):
+        self._backend = backend
+        self._model = model
+        self._prompts = PromptBuilder(self.name, tokenizer, max_prompt_tokens)
+        self._system_content = minify_prompt(
             """
             You are an interview evaluator responsible for scoring the candidate's responses to interview questions.
             For each question, assign a score from 1 to 5 based on the quality of the response and provide a brief
@@ -43,20 +215,47 @@ class ResponseEvaluationAgent:
             spelling mistakes into account, decide only based on technical side.
             
             Output format is a valid JSON string like:
-            [
-                {
-                    "score": [Insert Integer Score],
-                    "comment": [Insert Comment]
-                },
-                {
-                    "score": [Insert Integer Score],
-                    "comment": [Insert Comment]
-                }
+            {
+                "scores": [
+                    {
+                        "score": [Insert Integer Score],
+                        "comment": [Insert Comment]
+                    },
+                    {
+                        "score": [Insert Integer Score],
+                        "comment": [Insert Comment]
+                    }
+                    
+                    [Repeat for all responses]
+                ]
+            }
+            """
+        )
+        self._batch_system_content = minify_prompt(
+            """
+            You are an interview evaluator responsible for scoring the responses of several candidates to their 
+            interview questions. Every candidate is evaluated independently from others. For each question, assign 
+            a score from 1 to 5 based on the quality of the response and provide a brief comment explaining the 
+            rationale for the score. Take the candidate's job title into account to ensure the evaluation is aligned 
+            with the expectations and requirements of the role, do not take any grammar or spelling mistakes into 
+            account, decide only based on technical side.
+            
+            Output format is a valid JSON string like:
+            {
+                "[Insert Candidate ID]": [
+                    {
+                        "score": [Insert Integer Score],
+                        "comment": [Insert Comment]
+                    },
+                    
+                    [Repeat for all responses of the candidate]
+                ],
                 
-                [Repeat for all responses]
-            ]
+                [Repeat for all candidates]
+            }
             """
         )
+        self._prompt_version = self._prompts.get_prompt_version(self._system_content, self._prompt_template)
 
     async def evaluate_response(
             self,
@@ -64,22 +263,108 @@ class ResponseEvaluationAgent:
             questions: list[str],
             response: str,
     ) -> list[ResponseEvaluationAgentResult]:
-        prompt = (
-            f"Job Title: {job_title}\n"
-            f"Questions: {questions}\n"
-            f"Response: {response}\n"
+        return await create_structured_completion(
+            self.name,
+            self._backend,
+            self._model,
+            Priority.STANDARD,
+            self._get_messages(job_title, questions, response),
+            lambda content: self._parse_evaluation(content, len(questions)),
         )
-        result = await self._client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "system", "content": self._system_content}, {"role": "user", "content": prompt}]
+
+    def stream_evaluation(self, job_title: str, questions: list[str], response: str) -> AsyncIterator[str]:
+        return stream_chat_completion_content(
+            self.name,
+            self._backend,
+            self._model,
+            Priority.STANDARD,
+            self._get_messages(job_title, questions, response),
         )
-        return json.loads(result.choices[0].message.content.strip())
+
+    async def evaluate_responses_batch(
+            self,
+            items_prompts: list[str],
+    ) -> dict[str, list[ResponseEvaluationAgentResult]]:
+        """Evaluates a chunk of candidates by the prompts of `get_batch_item_prompt`, which has to fit its budget."""
+        prompt = "\n".join(items_prompts)
+        # Scores of every candidate are checked by the caller with `check_scores`, so one bad candidate doesn't fail
+        # the whole chunk.
+        return await create_structured_completion(
+            self.name,
+            self._backend,
+            self._model,
+            Priority.BATCH,
+            self._prompts.build_messages(self._batch_system_content, prompt),
+            lambda content: parse_structured_output(content, RESPONSES_BATCH_EVALUATION_OUTPUT),
+        )
+
+    def parse_evaluation(self, content: str, questions_count: int) -> list[ResponseEvaluationAgentResult]:
+        return parse_agent_output(self.name, content, lambda output: self._parse_evaluation(output, questions_count))
+
+    def get_batch_request_body(self, candidate_info: SharedContextCandidateFullInfo) -> dict:
+        return {
+            "model": self._model,
+            "messages": self._get_messages(
+                candidate_info.job_title, candidate_info.questions, candidate_info.candidate_response,
+            ),
+            **get_response_format_kwargs(True),
+        }
+
+    def count_tokens(self, text: str) -> int:
+        return self._prompts.count_tokens(text)
+
+    def count_batch_fixed_tokens(self) -> int:
+        """Tokens of a batch chunk besides the prompts of its candidates."""
+        return self._prompts.count_messages_tokens(self._batch_system_content, "")
+
+    def get_cache_key(self, job_title: str, questions: list[str], response: str) -> str:
+        return get_evaluation_cache_key(self.name, self._model, self._prompt_version, job_title, questions, response)
+
+    def get_batch_item_prompt(self, candidate_info: SharedContextCandidateFullInfo, max_prompt_tokens: int) -> str:
+        # Every candidate is truncated to fit a chunk of `max_prompt_tokens` alone, chunks are then packed under it.
+        return self._prompts.build_prompt(
+            self._batch_system_content,
+            "Candidate ID: {candidate_id}\nJob Title: {job_title}\nQuestions: {questions}\nResponse: {response}\n",
+            truncated_field="response",
+            max_prompt_tokens=max_prompt_tokens,
+            candidate_id=candidate_info.candidate_id,
+            job_title=candidate_info.job_title,
+            questions=candidate_info.questions,
+            response=candidate_info.candidate_response,
+        )
+
+    def _parse_evaluation(
+            self,
+            content: str,
+            questions_count: int,
+    ) -> tuple[list[ResponseEvaluationAgentResult], bool]:
+        result, repaired = parse_structured_output(content, RESPONSE_EVALUATION_OUTPUT)
+        check_scores(result["scores"], questions_count)
+        return result["scores"], repaired
+
+    def _get_messages(self, job_title: str, questions: list[str], response: str) -> list[dict]:
+        prompt = self._prompts.build_prompt(
+            self._system_content,
+            self._prompt_template,
+            truncated_field="response",
+            job_title=job_title,
+            questions=questions,
+            response=response,
+        )
+        return self._prompts.build_messages(self._system_content, prompt)
 
 
 class ValidationAgent:
-    def __init__(self, client: AsyncOpenAI):
-        self._client = client
-        self._system_content = (
+    name = "validation"
+    _prompt_template = (
+        "Job Title: {job_title}\nQuestions: {questions}\nResponse: {response}\nScores: {scores}\nComments: {comments}"
+    )
+
+    def __init__(self, backend: LLMBackend, model: str, tokenizer: Tokenizer, max_prompt_tokens: int):
+        self._backend = backend
+        self._model = model
+        self._prompts = PromptBuilder(self.name, tokenizer, max_prompt_tokens)
+        self._system_content = minify_prompt(
             """
             You are a Validation Agent responsible for reviewing and confirming the accuracy of interview evaluation 
             scores and providing meaningful feedback, do not take any grammar or spelling mistakes into account, 
@@ -114,6 +399,7 @@ class ValidationAgent:
             }
             """
         )
+        self._prompt_version = self._prompts.get_prompt_version(self._system_content, self._prompt_template)
 
     async def validate_scores(
             self,
@@ -123,15 +409,77 @@ class ValidationAgent:
             scores: list[int],
             comments: list[str],
     ) -> ValidationAgentResult:
-        prompt = (
-            f"Job Title: {job_title}\n"
-            f"Questions: {questions}\n"
-            f"Response: {response}\n"
-            f"Scores: {scores}\n"
-            f"Comments: {comments}"
-        )
-        result = await self._client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "system", "content": self._system_content}, {"role": "user", "content": prompt}]
-        )
-        return json.loads(result.choices[0].message.content.strip())
+        return await create_structured_completion(
+            self.name,
+            self._backend,
+            self._model,
+            Priority.STANDARD,
+            self._get_messages(job_title, questions, response, scores, comments),
+            lambda content: self._parse_validation(content, len(questions)),
+        )
+
+    def stream_validation(
+            self,
+            job_title: str,
+            questions: list[str],
+            response: str,
+            scores: list[int],
+            comments: list[str],
+    ) -> AsyncIterator[str]:
+        return stream_chat_completion_content(
+            self.name,
+            self._backend,
+            self._model,
+            Priority.STANDARD,
+            self._get_messages(job_title, questions, response, scores, comments),
+        )
+
+    def get_batch_request_body(self, candidate_info: SharedContextCandidateFullInfo) -> dict:
+        return {
+            "model": self._model,
+            "messages": self._get_messages(
+                candidate_info.job_title, candidate_info.questions, candidate_info.candidate_response,
+                candidate_info.scores, candidate_info.response_comments,
+            ),
+            **get_response_format_kwargs(True),
+        }
+
+    def get_cache_key(
+            self,
+            job_title: str,
+            questions: list[str],
+            response: str,
+            scores: list[int],
+            comments: list[str],
+    ) -> str:
+        return get_evaluation_cache_key(
+            self.name, self._model, self._prompt_version, job_title, questions, response, scores, comments,
+        )
+
+    def parse_validation(self, content: str, questions_count: int) -> ValidationAgentResult:
+        return parse_agent_output(self.name, content, lambda output: self._parse_validation(output, questions_count))
+
+    def _parse_validation(self, content: str, questions_count: int) -> tuple[ValidationAgentResult, bool]:
+        result, repaired = parse_structured_output(content, VALIDATION_OUTPUT)
+        check_scores(result["scores"], questions_count)
+        return result, repaired
+
+    def _get_messages(
+            self,
+            job_title: str,
+            questions: list[str],
+            response: str,
+            scores: list[int],
+            comments: list[str],
+    ) -> list[dict]:
+        prompt = self._prompts.build_prompt(
+            self._system_content,
+            self._prompt_template,
+            truncated_field="response",
+            job_title=job_title,
+            questions=questions,
+            response=response,
+            scores=scores,
+            comments=comments,
+        )
+        return self._prompts.build_messages(self._system_content, prompt)
@@ -0,0 +1,195 @@
+import abc
+import contextlib
+import io
+import json
+import time
+import uuid
+from dataclasses import asdict
+from typing import AsyncIterator
+
+import redis.asyncio as redis
+from miniopy_async.error import S3Error
+from openai import AsyncOpenAI
+from redis.exceptions import LockError
+
+from config import Config
+from dto import BatchJob
+from infrastructure.files_storage import FilesStorage
+from infrastructure.llm_backends import get_fake_completion_content
+
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchClient(abc.ABC):
+    @abc.abstractmethod
+    async def submit(self, input_object_name: str, data: bytes) -> str:
+        """Submits JSONL requests already uploaded as `input_object_name`, returns the batch ID."""
+
+    @abc.abstractmethod
+    async def get_status(self, batch_id: str) -> str:
+        pass
+
+    @abc.abstractmethod
+    async def get_results(self, batch_id: str) -> list[dict]:
+        """Returns Batch API output lines, each of them has `custom_id`, `response` and `error` keys."""
+
+
+class OpenAIBatchClient(BatchClient):
+    def __init__(self, client: AsyncOpenAI):
+        self._client = client
+
+    async def submit(self, input_object_name: str, data: bytes) -> str:
+        input_file = await self._client.files.create(file=(input_object_name, data), purpose="batch")
+        batch = await self._client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    async def get_status(self, batch_id: str) -> str:
+        batch = await self._client.batches.retrieve(batch_id)
+        return batch.status
+
+    async def get_results(self, batch_id: str) -> list[dict]:
+        batch = await self._client.batches.retrieve(batch_id)
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await self._client.files.content(file_id)
+                results.extend(json.loads(line) for line in content.text.splitlines() if line.strip())
+        return results
+
+
+class FakeBatchClient(BatchClient):
+    """
+    Local stand-in for the Batch API to run the whole batch flow offline. Reads the uploaded input back from the files
+    storage, answers every request with a deterministic completion after `BATCH_JOBS_FAKE_LATENCY` seconds and stores
+    the output next to the input. Batches are kept in the files storage too, so any worker can poll them.
+    """
+
+    def __init__(self, config: Config, files_storage: FilesStorage):
+        self._bucket_name = config.BATCH_JOBS_BUCKET_NAME
+        self._latency = float(config.BATCH_JOBS_FAKE_LATENCY)
+        self._files_storage = files_storage
+
+    async def submit(self, input_object_name: str, data: bytes) -> str:
+        batch_id = f"fake_batch_{uuid.uuid4().hex}"
+        await self._save_batch(
+            batch_id,
+            {"input_object_name": input_object_name, "output_object_name": None, "submitted_at": time.time()},
+        )
+        return batch_id
+
+    async def get_status(self, batch_id: str) -> str:
+        batch = await self._get_batch(batch_id)
+        if batch is None:
+            return "failed"
+        if batch["output_object_name"] is not None:
+            return "completed"
+        if time.time() - batch["submitted_at"] < self._latency:
+            return "in_progress"
+        await self._process(batch_id, batch)
+        return "completed"
+
+    async def get_results(self, batch_id: str) -> list[dict]:
+        batch = await self._get_batch(batch_id)
+        output = await self._files_storage.get_object(self._bucket_name, batch["output_object_name"])
+        return [json.loads(line) for line in output.decode("utf-8").splitlines() if line.strip()]
+
+    async def _get_batch(self, batch_id: str) -> dict | None:
+        try:
+            data = await self._files_storage.get_object(self._bucket_name, self._get_batch_object_name(batch_id))
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None
+            raise
+        return json.loads(data)
+
+    async def _save_batch(self, batch_id: str, batch: dict):
+        data = json.dumps(batch).encode("utf-8")
+        await self._files_storage.put_object(
+            bucket_name=self._bucket_name,
+            object_name=self._get_batch_object_name(batch_id),
+            data=io.BytesIO(data),
+            length=len(data),
+            content_type="application/json",
+        )
+
+    @staticmethod
+    def _get_batch_object_name(batch_id: str) -> str:
+        return f"{batch_id}/batch.json"
+
+    async def _process(self, batch_id: str, batch: dict):
+        input_data = await self._files_storage.get_object(self._bucket_name, batch["input_object_name"])
+        output_lines = []
+        for line in input_data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output_lines.append(
+                json.dumps(
+                    {
+                        "id": f"{batch_id}_{request['custom_id']}",
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "body": self._get_completion(request["body"])},
+                        "error": None,
+                    }
+                )
+            )
+        output_data = "\n".join(output_lines).encode("utf-8")
+        output_object_name = f"{batch_id}/output.jsonl"
+        await self._files_storage.put_object(
+            bucket_name=self._bucket_name,
+            object_name=output_object_name,
+            data=io.BytesIO(output_data),
+            length=len(output_data),
+            content_type="application/jsonl",
+        )
+        # Polls of other workers processing the batch at the same time write the same output.
+        batch["output_object_name"] = output_object_name
+        await self._save_batch(batch_id, batch)
+
+    def _get_completion(self, body: dict) -> dict:
+        content = get_fake_completion_content(body["messages"])
+        return {
+            "object": "chat.completion",
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        }
+
+
+class BatchJobsRegistry:
+    """Batch jobs kept in Redis for `BATCH_JOBS_TTL` seconds since their last change."""
+
+    _key_prefix = "batch_job"
+
+    def __init__(self, config: Config, redis_connection: redis.Redis):
+        self._redis_connection = redis_connection
+        self._ttl = int(config.BATCH_JOBS_TTL)
+        self._lock_timeout = int(config.BATCH_JOBS_LOCK_TIMEOUT)
+
+    async def save(self, job: BatchJob):
+        await self._redis_connection.set(f"{self._key_prefix}:{job.job_id}", json.dumps(asdict(job)), ex=self._ttl)
+
+    @contextlib.asynccontextmanager
+    async def lock(self, job_id: str) -> AsyncIterator[bool]:
+        """Holds the lock of the job if it is free, yields whether it is held."""
+        lock = self._redis_connection.lock(f"{self._key_prefix}:lock:{job_id}", timeout=self._lock_timeout)
+        if not await lock.acquire(blocking=False):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            try:
+                await lock.release()
+            except LockError:
+                pass
+
+    async def get(self, job_id: str) -> BatchJob | None:
+        data = await self._redis_connection.get(f"{self._key_prefix}:{job_id}")
+        if data is None:
+            return None
+        return BatchJob(**json.loads(data))
+
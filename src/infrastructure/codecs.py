@@ -0,0 +1,113 @@
+import abc
+import json
+import zlib
+from dataclasses import fields
+
+import msgpack
+
+from dto import SharedContextCandidateFullInfo
+
+HEADER_MAGIC = b"SC"
+HEADER_VERSION = 1
+HEADER_LENGTH = len(HEADER_MAGIC) + 2
+# The revision is kept next to the record, so rewriting the same session with another codec doesn't change it.
+CANDIDATE_INFO_FIELDS = tuple(
+    field.name for field in fields(SharedContextCandidateFullInfo) if field.name != "revision"
+)
+# Field order of the positional msgpack records, frozen as they were stored.
+POSITIONAL_CANDIDATE_INFO_FIELDS = (
+    "candidate_id", "first_name", "second_name", "job_title", "questions", "candidate_response", "scores",
+    "response_comments", "feedback",
+)
+
+
+def get_candidate_info(data: dict) -> SharedContextCandidateFullInfo:
+    """Stored fields the record doesn't have anymore are dropped, fields added since need defaults."""
+    return SharedContextCandidateFullInfo(
+        **{name: value for name, value in data.items() if name in CANDIDATE_INFO_FIELDS},
+    )
+
+
+class CandidateInfoCodec(abc.ABC):
+    codec_id: int
+    name: str
+
+    @abc.abstractmethod
+    def encode_payload(self, candidate_info: SharedContextCandidateFullInfo) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def decode_payload(self, payload: bytes) -> SharedContextCandidateFullInfo:
+        pass
+
+
+class JSONCandidateInfoCodec(CandidateInfoCodec):
+    codec_id = 1
+    name = "json"
+
+    def encode_payload(self, candidate_info: SharedContextCandidateFullInfo) -> bytes:
+        data = candidate_info.to_record()
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def decode_payload(self, payload: bytes) -> SharedContextCandidateFullInfo:
+        return get_candidate_info(json.loads(payload))
+
+
+class MsgpackCandidateInfoCodec(CandidateInfoCodec):
+    """
+    Stores fields by name, so adding, removing or reordering fields of `SharedContextCandidateFullInfo` keeps stored
+    records readable. The first records stored fields positionally and are still read in their field order.
+    """
+
+    codec_id = 2
+    name = "msgpack"
+
+    def encode_payload(self, candidate_info: SharedContextCandidateFullInfo) -> bytes:
+        return msgpack.packb(candidate_info.to_record())
+
+    def decode_payload(self, payload: bytes) -> SharedContextCandidateFullInfo:
+        data = msgpack.unpackb(payload)
+        if isinstance(data, list):
+            data = dict(zip(POSITIONAL_CANDIDATE_INFO_FIELDS, data))
+        return get_candidate_info(data)
+
+
+class ZlibMsgpackCandidateInfoCodec(MsgpackCandidateInfoCodec):
+    codec_id = 3
+    name = "msgpack_zlib"
+
+    def encode_payload(self, candidate_info: SharedContextCandidateFullInfo) -> bytes:
+        return zlib.compress(super().encode_payload(candidate_info), 6)
+
+    def decode_payload(self, payload: bytes) -> SharedContextCandidateFullInfo:
+        return super().decode_payload(zlib.decompress(payload))
+
+
+CODECS: dict[int, CandidateInfoCodec] = {
+    codec.codec_id: codec
+    for codec in (JSONCandidateInfoCodec(), MsgpackCandidateInfoCodec(), ZlibMsgpackCandidateInfoCodec())
+}
+
+
+def get_codec(name: str) -> CandidateInfoCodec:
+    for codec in CODECS.values():
+        if codec.name == name:
+            return codec
+    raise ValueError(f"Unknown candidate info codec: {name}")
+
+
+def encode_candidate_info(candidate_info: SharedContextCandidateFullInfo, codec: CandidateInfoCodec) -> bytes:
+    return HEADER_MAGIC + bytes((HEADER_VERSION, codec.codec_id)) + codec.encode_payload(candidate_info)
+
+
+def get_record_codec_id(record: bytes) -> int:
+    if record[:len(HEADER_MAGIC)] != HEADER_MAGIC or len(record) < HEADER_LENGTH:
+        raise ValueError("Candidate info record has no valid header")
+    version, codec_id = record[len(HEADER_MAGIC)], record[len(HEADER_MAGIC) + 1]
+    if version != HEADER_VERSION or codec_id not in CODECS:
+        raise ValueError(f"Unsupported candidate info record version {version} or codec {codec_id}")
+    return codec_id
+
+
+def decode_candidate_info(record: bytes) -> SharedContextCandidateFullInfo:
+    return CODECS[get_record_codec_id(record)].decode_payload(record[HEADER_LENGTH:])
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+
+import aiohttp
+import redis.asyncio as redis
+from openai import AsyncOpenAI
+
+from config import Config
+from dto import HTTPPoolStats
+from infrastructure.http_pools import HTTPPoolMonitor
+from infrastructure.llm_backends import get_agents_llm_backends
+from infrastructure.redis_shards import RedisShards
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPools:
+    """
+    Network clients of one worker process. The application lifespan warms them before the worker takes traffic, so
+    the first requests don't pay for the connection and TLS setup, and closes them on shutdown.
+    """
+
+    def __init__(
+            self,
+            config: Config,
+            redis_connection: redis.Redis,
+            minio_session: aiohttp.ClientSession,
+            openai_client: AsyncOpenAI,
+            local_llm_client: AsyncOpenAI | None,
+            http_pool_monitors: list[HTTPPoolMonitor],
+            redis_shards: list[RedisShards],
+    ):
+        self._redis_connection = redis_connection
+        self._minio_session = minio_session
+        self._openai_client = openai_client
+        self._local_llm_client = local_llm_client
+        self._http_pool_monitors = http_pool_monitors
+        self._redis_shards = redis_shards
+        self._minio_url = f"{'https' if config.MINIO_SECURE else 'http'}://{config.MINIO_URL}/"
+        self._redis_warm_connections = int(config.CONNECTION_POOLS_REDIS_WARM_CONNECTIONS)
+        self._retry_delay = float(config.CONNECTION_POOLS_WARM_UP_RETRY_DELAY)
+        self._warm = {"redis": False, "minio": False}
+        # Only the LLM clients in use are warmed, so a worker on the fake backend gets ready offline.
+        llm_backends = get_agents_llm_backends(config)
+        if "openai" in llm_backends or config.BATCH_JOBS_BACKEND == "openai":
+            self._warm["openai"] = False
+        if "local" in llm_backends:
+            self._warm["local_llm"] = False
+
+    @property
+    def ready(self) -> bool:
+        return all(self._warm.values())
+
+    def get_status(self) -> dict[str, bool]:
+        return dict(self._warm)
+
+    def get_http_pools_stats(self) -> list[HTTPPoolStats]:
+        return [monitor.get_stats() for monitor in self._http_pool_monitors]
+
+    async def warm_up(self):
+        """Warms up the pools, retrying the failed ones until every pool is warm."""
+        warm_ups = {
+            "redis": self._warm_up_redis,
+            "minio": self._warm_up_minio,
+            "openai": self._warm_up_openai,
+            "local_llm": self._warm_up_local_llm,
+        }
+        while True:
+            pending = [name for name, warm in self._warm.items() if not warm]
+            results = await asyncio.gather(*(warm_ups[name]() for name in pending), return_exceptions=True)
+            for name, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    logger.warning("Failed to warm up %s connection pool: %r", name, result)
+                else:
+                    self._warm[name] = True
+            if self.ready:
+                return
+            await asyncio.sleep(self._retry_delay)
+
+    async def close(self):
+        await asyncio.gather(
+            self._redis_connection.close(),
+            *(redis_shards.close() for redis_shards in self._redis_shards),
+            self._minio_session.close(),
+            self._openai_client.close(),
+            *([self._local_llm_client.close()] if self._local_llm_client is not None else []),
+            return_exceptions=True,
+        )
+
+    async def _warm_up_redis(self):
+        # Concurrent commands take separate connections, so the pool ends up with this many open ones.
+        await asyncio.gather(*(self._redis_connection.ping() for _ in range(self._redis_warm_connections)))
+        # Every node of the shared context is checked with one connection, the main Redis too in the single mode.
+        await asyncio.gather(
+            *(
+                connection.ping()
+                for redis_shards in self._redis_shards
+                for connection in redis_shards.get_scan_connections()
+            )
+        )
+
+    async def _warm_up_minio(self):
+        # Any response means the connection is open and kept alive, the status of an anonymous request doesn't matter.
+        async with self._minio_session.head(self._minio_url):
+            pass
+
+    async def _warm_up_openai(self):
+        await self._openai_client.models.list()
+
+    async def _warm_up_local_llm(self):
+        await self._local_llm_client.models.list()
@@ -0,0 +1,84 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+import orjson
+import redis.asyncio as redis
+
+from config import Config
+from infrastructure.metrics import EVALUATION_CACHE_LOOKUPS
+
+
+def get_evaluation_cache_key(agent: str, model: str, prompt_version: str, *inputs: Any) -> str:
+    """Content address of an agent result, the prompt version changes with the prompts and invalidates old results."""
+    return hashlib.sha256(orjson.dumps([agent, model, prompt_version, *inputs])).hexdigest()
+
+
+class EvaluationCache:
+    """
+    Parsed results of the evaluation and validation agents by the content address of their inputs, so byte-identical
+    re-submissions don't spend tokens again. Results are kept in Redis for `EVALUATION_CACHE_TTL` seconds and the
+    most recently used ones in the memory of the worker until their Redis TTL runs out.
+    """
+
+    _key_prefix = "evaluation_cache"
+
+    def __init__(self, config: Config, redis_connection: redis.Redis):
+        self._redis_connection = redis_connection
+        self._ttl = int(config.EVALUATION_CACHE_TTL)
+        self._local_maxsize = int(config.EVALUATION_CACHE_LOCAL_MAXSIZE)
+        # Serialized results, so callers can't change the cached ones through the returned objects.
+        self._local_results: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    async def get_or_evaluate(self, agent: str, key: str, evaluate: Callable[[], Awaitable[Any]]) -> Any:
+        result = await self.get(agent, key)
+        if result is None:
+            result = await evaluate()
+            await self.save(key, result)
+        return result
+
+    async def get(self, agent: str, key: str) -> Any | None:
+        key = self._get_key(key)
+        data = self._get_local_result(key)
+        if data is not None:
+            EVALUATION_CACHE_LOOKUPS.labels(agent, "local_hit").inc()
+            return orjson.loads(data)
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.ttl(key)
+            data, ttl = await pipe.execute()
+        if data is None:
+            EVALUATION_CACHE_LOOKUPS.labels(agent, "miss").inc()
+            return None
+        self._set_local_result(key, data, ttl)
+        EVALUATION_CACHE_LOOKUPS.labels(agent, "hit").inc()
+        return orjson.loads(data)
+
+    async def save(self, key: str, result: Any):
+        key = self._get_key(key)
+        data = orjson.dumps(result)
+        await self._redis_connection.set(key, data, ex=self._ttl)
+        self._set_local_result(key, data, self._ttl)
+
+    def _get_key(self, key: str) -> str:
+        return f"{self._key_prefix}:{key}"
+
+    def _get_local_result(self, key: str) -> bytes | None:
+        local_result = self._local_results.get(key)
+        if local_result is None:
+            return None
+        expires_at, data = local_result
+        if expires_at <= time.monotonic():
+            del self._local_results[key]
+            return None
+        self._local_results.move_to_end(key)
+        return data
+
+    def _set_local_result(self, key: str, data: bytes, ttl: int):
+        if ttl <= 0:
+            return
+        self._local_results[key] = (time.monotonic() + ttl, data)
+        self._local_results.move_to_end(key)
+        while len(self._local_results) > self._local_maxsize:
+            self._local_results.popitem(last=False)
@@ -1,16 +1,43 @@
 import abc
+import asyncio
 import io
-from typing import Union
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Union
+from urllib.parse import urlunsplit
 
+import aiohttp
 import miniopy_async
+from miniopy_async.credentials import Credentials
+from miniopy_async.error import S3Error
+from miniopy_async.helpers import BaseURL
+from miniopy_async.signer import presign_v4
+from miniopy_async.time import utcnow
 
 from config import Config
+from dto import StorageObject
+
+# Buckets are never deleted by the application, so once ensured they are known for the whole process lifetime.
+KNOWN_BUCKETS: set[str] = set()
 
 
 class FilesStorage(abc.ABC):
-    def __init__(self, config: Config, minio_client: miniopy_async.Minio):
+    def __init__(self, config: Config, minio_client: miniopy_async.Minio, session: aiohttp.ClientSession):
         self._config = config
         self._minio_client = minio_client
+        # miniopy_async opens a session per call unless one is given, which only its object reads accept.
+        self._session = session
+        self._region = config.MINIO_REGION
+        self._credentials = Credentials(config.MINIO_ACCESS_KEY, config.MINIO_SECRET_KEY)
+        public_host = config.MINIO_PUBLIC_HOST or f"{'https' if config.MINIO_SECURE else 'http'}://{config.MINIO_URL}"
+        self._public_base_url = BaseURL(public_host, self._region)
+        self._presigned_url_expires = int(config.FILES_STORAGE_PRESIGNED_URL_EXPIRES)
+        self._presigned_url_cache_ttl = float(config.FILES_STORAGE_PRESIGNED_URL_CACHE_TTL)
+        self._presigned_url_cache_maxsize = int(config.FILES_STORAGE_PRESIGNED_URL_CACHE_MAXSIZE)
+        self._presigned_url_cache: OrderedDict[tuple[str, str], tuple[str, float]] = OrderedDict()
+
+    async def ensure_buckets(self, bucket_names: list[str]):
+        await asyncio.gather(*(self._ensure_bucket(bucket_name) for bucket_name in bucket_names))
 
     async def put_object(
             self,
@@ -20,8 +47,7 @@ class FilesStorage(abc.ABC):
             length: int,
             content_type: str,
     ) -> str:
-        if not await self._minio_client.bucket_exists(bucket_name):
-            await self._minio_client.make_bucket(bucket_name)
+        await self._ensure_bucket(bucket_name)
         await self._minio_client.put_object(
             bucket_name=bucket_name,
             object_name=object_name,
@@ -29,6 +55,62 @@ class FilesStorage(abc.ABC):
             length=length,
             content_type=content_type,
         )
-        return await self._minio_client.get_presigned_url(
-            "GET", bucket_name, object_name, change_host=self._config.MINIO_PUBLIC_HOST,
+        return self.get_object_url(bucket_name, object_name)
+
+    async def put_objects(self, objects: list[StorageObject]) -> list[str]:
+        """Uploads the objects concurrently and returns their URLs in the same order."""
+        return await asyncio.gather(
+            *(
+                self.put_object(
+                    bucket_name=storage_object.bucket_name,
+                    object_name=storage_object.object_name,
+                    data=io.BytesIO(storage_object.data),
+                    length=len(storage_object.data),
+                    content_type=storage_object.content_type,
+                )
+                for storage_object in objects
+            )
+        )
+
+    def get_object_url(self, bucket_name: str, object_name: str) -> str:
+        """Presigns the GET URL locally, the region is fixed by `MINIO_REGION` so no bucket location is requested."""
+        key = (bucket_name, object_name)
+        now = time.monotonic()
+        cached = self._presigned_url_cache.get(key)
+        if cached is not None and cached[1] > now:
+            self._presigned_url_cache.move_to_end(key)
+            return cached[0]
+        url = self._public_base_url.build("GET", self._region, bucket_name=bucket_name, object_name=object_name)
+        url = urlunsplit(
+            presign_v4("GET", url, self._region, self._credentials, utcnow(), self._presigned_url_expires)
+        )
+        self._presigned_url_cache[key] = (url, now + self._presigned_url_cache_ttl)
+        self._presigned_url_cache.move_to_end(key)
+        if len(self._presigned_url_cache) > self._presigned_url_cache_maxsize:
+            self._presigned_url_cache.popitem(last=False)
+        return url
+
+    async def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0) -> bytes:
+        response = await self._minio_client.get_object(
+            bucket_name, object_name, self._session, offset=offset, length=length,
         )
+        async with response:
+            return await response.read()
+
+    async def iter_object_names(self, bucket_name: str, prefix: str | None = None) -> AsyncIterator[str]:
+        async for storage_object in self._minio_client.list_objects(bucket_name, prefix=prefix, recursive=True):
+            yield storage_object.object_name
+
+    async def remove_object(self, bucket_name: str, object_name: str):
+        await self._minio_client.remove_object(bucket_name, object_name)
+
+    async def _ensure_bucket(self, bucket_name: str):
+        if bucket_name in KNOWN_BUCKETS:
+            return
+        if not await self._minio_client.bucket_exists(bucket_name):
+            try:
+                await self._minio_client.make_bucket(bucket_name)
+            except S3Error as e:
+                if e.code != "BucketAlreadyOwnedByYou":
+                    raise
+        KNOWN_BUCKETS.add(bucket_name)
@@ -0,0 +1,241 @@
+import asyncio
+from typing import Callable
+
+import aiohttp
+import httpx
+import miniopy_async
+import openai
+
+from config import Config
+from dto import HTTPPoolStats
+from infrastructure.metrics import HTTP_POOL_CONNECTIONS_CREATED, HTTP_POOL_IN_FLIGHT, HTTP_POOL_QUEUED
+
+
+class HTTPPoolMonitor:
+    """Counts requests and connections of one HTTP connection pool through the public tracing hooks of its client."""
+
+    def __init__(self, name: str, max_connections: int):
+        self.name = name
+        self._max_connections = max_connections
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._queued = 0
+        self._requests = 0
+        self._connections_created = 0
+        self._in_flight_gauge = HTTP_POOL_IN_FLIGHT.labels(name)
+        self._queued_gauge = HTTP_POOL_QUEUED.labels(name)
+        self._connections_created_counter = HTTP_POOL_CONNECTIONS_CREATED.labels(name)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def on_request_start(self):
+        self._requests += 1
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        self._in_flight_gauge.set(self._in_flight)
+
+    def on_request_end(self):
+        self._in_flight -= 1
+        self._in_flight_gauge.set(self._in_flight)
+
+    def on_queued_start(self):
+        self._queued += 1
+        self._queued_gauge.set(self._queued)
+
+    def on_queued_end(self):
+        self._queued -= 1
+        self._queued_gauge.set(self._queued)
+
+    def on_connection_created(self):
+        self._connections_created += 1
+        self._connections_created_counter.inc()
+
+    def get_stats(self) -> HTTPPoolStats:
+        return HTTPPoolStats(
+            name=self.name,
+            max_connections=self._max_connections,
+            in_flight=self._in_flight,
+            peak_in_flight=self._peak_in_flight,
+            queued=self._queued,
+            requests=self._requests,
+            connections_created=self._connections_created,
+        )
+
+    def get_aiohttp_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.on_request_start()
+
+        async def on_request_end(session, context, params):
+            self.on_request_end()
+
+        async def on_connection_queued_start(session, context, params):
+            self.on_queued_start()
+
+        async def on_connection_queued_end(session, context, params):
+            self.on_queued_end()
+
+        async def on_connection_create_end(session, context, params):
+            self.on_connection_created()
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_end)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return trace_config
+
+
+class PooledAsyncHTTPTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport splitting its connections into shards of small httpcore pools and reporting to a pool monitor.
+
+    httpcore rescans every waiting request against every connection whenever a connection changes state, so against a
+    50 ms stub 500 concurrent requests took 16 s on one pool of 100 connections and 2 s on 10 shards. Requests go
+    to the least loaded shard and, over HTTP/1.1, first wait for one of `max_connections` slots on a FIFO semaphore,
+    so they don't queue inside the pools. A request is in flight until its response is closed.
+    """
+
+    def __init__(
+            self,
+            monitor: HTTPPoolMonitor,
+            limits: httpx.Limits,
+            shard_size: int,
+            pool_timeout: float,
+            http2: bool,
+    ):
+        shards_count = -(-limits.max_connections // shard_size)
+        shard_limits = httpx.Limits(
+            max_connections=-(-limits.max_connections // shards_count),
+            max_keepalive_connections=-(-limits.max_keepalive_connections // shards_count),
+            keepalive_expiry=limits.keepalive_expiry,
+        )
+        self._shards = [httpx.AsyncHTTPTransport(limits=shard_limits, http2=http2) for _ in range(shards_count)]
+        self._shards_load = [0] * shards_count
+        self._monitor = monitor
+        self._pool_timeout = pool_timeout
+        # HTTP/2 multiplexes requests over the connections, so the pool size doesn't bound them.
+        self._slots = asyncio.Semaphore(limits.max_connections) if not http2 else None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._monitor.on_request_start()
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            self._monitor.on_request_end()
+            raise
+        shard = min(range(len(self._shards)), key=self._shards_load.__getitem__)
+        self._shards_load[shard] += 1
+
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.complete":
+                self._monitor.on_connection_created()
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = await self._shards[shard].handle_async_request(request)
+        except BaseException:
+            self._release(shard)
+            raise
+        response.stream = MonitoredResponseStream(response.stream, lambda: self._release(shard))
+        return response
+
+    async def aclose(self):
+        await asyncio.gather(*(shard.aclose() for shard in self._shards))
+
+    async def _acquire_slot(self):
+        if self._slots is None:
+            return
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        self._monitor.on_queued_start()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._pool_timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout("Timed out waiting for a connection of the pool") from None
+        finally:
+            self._monitor.on_queued_end()
+
+    def _release(self, shard: int):
+        self._shards_load[shard] -= 1
+        if self._slots is not None:
+            self._slots.release()
+        self._monitor.on_request_end()
+
+
+class MonitoredResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+        await self._stream.aclose()
+
+
+class PooledMinio(miniopy_async.Minio):
+    """
+    miniopy_async opens a new aiohttp session, and so new connections, for almost every call. This client sends all
+    of its requests through one shared session instead, so they reuse the keep-alive connections of its pool.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, **kwargs):
+        super().__init__(**kwargs)
+        self._session = session
+
+    async def _url_open(self, *args, session=None, **kwargs):
+        # Relies on `_url_open` being the single place of miniopy_async that sends requests, checked for 1.21.1.
+        return await super()._url_open(*args, session=self._session, **kwargs)
+
+
+def create_minio_session(config: Config, monitor: HTTPPoolMonitor) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=int(config.MINIO_HTTP_MAX_CONNECTIONS),
+        limit_per_host=int(config.MINIO_HTTP_MAX_CONNECTIONS),
+        keepalive_timeout=float(config.MINIO_HTTP_KEEPALIVE_EXPIRY),
+        use_dns_cache=True,
+        ttl_dns_cache=int(config.HTTP_DNS_CACHE_TTL),
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=float(config.MINIO_HTTP_TIMEOUT),
+        connect=float(config.MINIO_HTTP_POOL_TIMEOUT) + float(config.MINIO_HTTP_CONNECT_TIMEOUT),
+        sock_connect=float(config.MINIO_HTTP_CONNECT_TIMEOUT),
+        sock_read=float(config.MINIO_HTTP_READ_TIMEOUT),
+    )
+    return aiohttp.ClientSession(
+        connector=connector, timeout=timeout, trace_configs=[monitor.get_aiohttp_trace_config()],
+    )
+
+
+def create_openai_http_client(config: Config, monitor: HTTPPoolMonitor) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=int(config.OPENAI_HTTP_MAX_CONNECTIONS),
+        max_keepalive_connections=int(config.OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS),
+        keepalive_expiry=float(config.OPENAI_HTTP_KEEPALIVE_EXPIRY),
+    )
+    transport = PooledAsyncHTTPTransport(
+        monitor,
+        limits,
+        int(config.OPENAI_HTTP_POOL_SHARD_SIZE),
+        float(config.OPENAI_HTTP_POOL_TIMEOUT),
+        config.OPENAI_HTTP2,
+    )
+    timeout = httpx.Timeout(
+        connect=float(config.OPENAI_HTTP_CONNECT_TIMEOUT),
+        read=float(config.OPENAI_HTTP_READ_TIMEOUT),
+        write=float(config.OPENAI_HTTP_WRITE_TIMEOUT),
+        pool=float(config.OPENAI_HTTP_POOL_TIMEOUT),
+    )
+    return openai.DefaultAsyncHttpxClient(transport=transport, timeout=timeout)
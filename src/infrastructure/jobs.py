@@ -0,0 +1,287 @@
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import ipaddress
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import asdict
+from typing import Any, Awaitable, Callable
+
+import httpx
+import orjson
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from config import Config
+from dto import Job
+from infrastructure.llm_scheduler import LLMSchedulerOverloadedError
+from infrastructure.metrics import JOB_QUEUE_WAIT, JOB_WEBHOOKS, JOBS_FINISHED
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUES = ("questions", "evaluation", "validation")
+JOB_FINAL_STATUSES = ("succeeded", "failed")
+
+
+class CallbackURLNotAllowedError(Exception):
+    """Callback URL of a job isn't an allowed HTTPS URL of a public host."""
+
+
+async def check_callback_url(
+        callback_url: str,
+        allowed_urls: list[str],
+) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+    """
+    Rejects callback URLs which could make the workers call internal services: other schemes than HTTPS, hosts or
+    URLs not in `allowed_urls` when it isn't empty, and hosts resolving to any private, loopback, link-local (like
+    the cloud metadata endpoint) or otherwise not public address. Returns the checked address to call the host at,
+    resolving it again for the call could give another one.
+    """
+    try:
+        url = httpx.URL(callback_url)
+    except httpx.InvalidURL:
+        raise CallbackURLNotAllowedError(f"Invalid callback URL: {callback_url}")
+    if url.scheme != "https" or not url.host:
+        raise CallbackURLNotAllowedError(f"Callback URL must be an HTTPS URL: {callback_url}")
+    if allowed_urls and not any(
+        # Prefixes match at a path boundary, "https://hooks.example.com" doesn't allow "https://hooks.example.com.evil".
+        callback_url.startswith(allowed_url.rstrip("/") + "/") if "://" in allowed_url
+        else url.host == allowed_url.lower()
+        for allowed_url in allowed_urls
+    ):
+        raise CallbackURLNotAllowedError(f"Callback URL isn't allowed: {callback_url}")
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(url.host, url.port or 443, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise CallbackURLNotAllowedError(f"Callback host can't be resolved: {url.host}")
+    checked_addresses = []
+    for *_, socket_address in addresses:
+        # Link-local IPv6 addresses come with the scope of their interface, like "fe80::1%eth0".
+        address = ipaddress.ip_address(socket_address[0].partition("%")[0])
+        if not address.is_global:
+            raise CallbackURLNotAllowedError(f"Callback host {url.host} resolves to a non-public address {address}")
+        checked_addresses.append(address)
+    return checked_addresses[0]
+
+
+class JobQueue:
+    """
+    Asynchronous jobs, queued into one Redis Stream per queue and run by the workers of any process sharing its
+    consumer group. Jobs are kept for `JOBS_RESULT_TTL` seconds to be polled, and their callback URL, if any,
+    receives the job once it has finished. Callback URLs are checked by `check_callback_url` when the job is
+    enqueued, and again before the call, as the host may resolve to another address by then. The call goes to the
+    checked address, with the host of the URL in the Host header and TLS SNI, so it can't be rebound to another one.
+
+    A worker keeps claiming the entry of the job it runs, so only the entries of crashed workers stay idle for
+    `JOBS_RETRY_IDLE` seconds and are run again, up to `JOBS_MAX_ATTEMPTS` times. Jobs rejected by an overloaded
+    LLM scheduler are left pending to be retried the same way.
+    """
+
+    _key_prefix = "job"
+    _stream_prefix = "jobs"
+    _group = "job_workers"
+
+    def __init__(self, config: Config, redis_connection: redis.Redis):
+        self._redis_connection = redis_connection
+        self._result_ttl = int(config.JOBS_RESULT_TTL)
+        self._max_attempts = int(config.JOBS_MAX_ATTEMPTS)
+        self._retry_idle_ms = int(float(config.JOBS_RETRY_IDLE) * 1000)
+        self._block_ms = int(float(config.JOBS_BLOCK) * 1000)
+        self._webhook_timeout = float(config.JOBS_WEBHOOK_TIMEOUT)
+        self._webhook_attempts = int(config.JOBS_WEBHOOK_ATTEMPTS)
+        self._webhook_secret = config.JOBS_WEBHOOK_SECRET.encode("utf-8")
+        self._webhook_allowed_urls = [url.strip() for url in config.JOBS_WEBHOOK_ALLOWED_URLS.split(",") if url.strip()]
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._created_groups: set[str] = set()
+        self._webhook_client: httpx.AsyncClient | None = None
+
+    async def enqueue(self, queue: str, payload: dict, callback_url: str | None = None) -> Job:
+        if callback_url:
+            await check_callback_url(callback_url, self._webhook_allowed_urls)
+        job = Job(
+            job_id=uuid.uuid4().hex,
+            queue=queue,
+            status="queued",
+            payload=payload,
+            callback_url=callback_url,
+            attempts=0,
+            result=None,
+            error=None,
+            created_at=time.time(),
+            finished_at=None,
+        )
+        async with self._redis_connection.pipeline(transaction=True) as pipe:
+            pipe.set(self._get_key(job.job_id), orjson.dumps(asdict(job)), ex=self._result_ttl)
+            pipe.xadd(self._get_stream(queue), {"job_id": job.job_id})
+            await pipe.execute()
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        data = await self._redis_connection.get(self._get_key(job_id))
+        if data is None:
+            return None
+        return Job(**orjson.loads(data))
+
+    async def run_worker(self, queue: str, handler: Callable[[dict], Awaitable[Any]], concurrency: int):
+        """Runs the jobs of the queue with the handler, at most `concurrency` of them at a time."""
+        await self._ensure_group(queue)
+        await asyncio.gather(*(self._consume(queue, handler) for _ in range(concurrency)))
+
+    async def close(self):
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+
+    async def _consume(self, queue: str, handler: Callable[[dict], Awaitable[Any]]):
+        while True:
+            try:
+                message = await self._take_message(queue)
+                if message is not None:
+                    await self._process_message(queue, *message, handler)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to process %s jobs", queue)
+                await asyncio.sleep(1)
+
+    async def _take_message(self, queue: str) -> tuple[bytes, dict] | None:
+        stream = self._get_stream(queue)
+        _, messages, _ = await self._redis_connection.xautoclaim(
+            stream, self._group, self._consumer, self._retry_idle_ms, count=1,
+        )
+        if not messages:
+            response = await self._redis_connection.xreadgroup(
+                self._group, self._consumer, {stream: ">"}, count=1, block=self._block_ms,
+            )
+            messages = response[0][1] if response else []
+        return messages[0] if messages else None
+
+    async def _process_message(
+            self,
+            queue: str,
+            message_id: bytes,
+            fields: dict,
+            handler: Callable[[dict], Awaitable[Any]],
+    ):
+        job = await self.get(fields[b"job_id"].decode())
+        if job is not None and job.status not in JOB_FINAL_STATUSES:
+            if job.attempts == 0:
+                JOB_QUEUE_WAIT.labels(queue).observe(max(time.time() - job.created_at, 0.0))
+            job.status = "running"
+            job.attempts += 1
+            await self._save(job)
+            if job.attempts > self._max_attempts:
+                await self._finish(job, error="Too many attempts")
+            else:
+                async with self._keep_claimed(queue, message_id):
+                    try:
+                        result = await handler(job.payload)
+                    except LLMSchedulerOverloadedError:
+                        # Left pending, the entry is claimed again once it has been idle for the retry delay.
+                        return
+                    except Exception as e:
+                        logger.exception("Job %s failed", job.job_id)
+                        await self._finish(job, error=str(e) or type(e).__name__)
+                    else:
+                        await self._finish(job, result=result)
+        async with self._redis_connection.pipeline(transaction=True) as pipe:
+            pipe.xack(self._get_stream(queue), self._group, message_id)
+            pipe.xdel(self._get_stream(queue), message_id)
+            await pipe.execute()
+
+    @contextlib.asynccontextmanager
+    async def _keep_claimed(self, queue: str, message_id: bytes):
+        """Resets the idle time of the entry while its job runs, so other workers don't take it over."""
+
+        async def claim():
+            while True:
+                await asyncio.sleep(self._retry_idle_ms / 1000 / 3)
+                await self._redis_connection.xclaim(
+                    self._get_stream(queue), self._group, self._consumer, 0, [message_id], justid=True,
+                )
+
+        task = asyncio.create_task(claim())
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _finish(self, job: Job, result: Any = None, error: str | None = None):
+        job.status = "failed" if error is not None else "succeeded"
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        await self._save(job)
+        JOBS_FINISHED.labels(job.queue, job.status).inc()
+        if job.callback_url:
+            await self._send_webhook(job)
+
+    async def _save(self, job: Job):
+        await self._redis_connection.set(self._get_key(job.job_id), orjson.dumps(asdict(job)), ex=self._result_ttl)
+
+    async def _send_webhook(self, job: Job):
+        try:
+            address = await check_callback_url(job.callback_url, self._webhook_allowed_urls)
+        except CallbackURLNotAllowedError as e:
+            logger.warning("Not calling back for job %s: %s", job.job_id, e)
+            JOB_WEBHOOKS.labels("rejected").inc()
+            return
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(timeout=self._webhook_timeout)
+        url = httpx.URL(job.callback_url)
+        body = orjson.dumps(get_job_body(job))
+        headers = {"Content-Type": "application/json", "Host": url.netloc.decode("ascii")}
+        if self._webhook_secret:
+            signature = hmac.new(self._webhook_secret, body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={signature}"
+        for attempt in range(self._webhook_attempts):
+            if attempt:
+                await asyncio.sleep(2 ** attempt)
+            try:
+                response = await self._webhook_client.post(
+                    url.copy_with(host=str(address)),
+                    content=body,
+                    headers=headers,
+                    # The certificate is still verified for the host of the URL.
+                    extensions={"sni_hostname": url.host},
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.warning("Failed to call back %s for job %s: %r", job.callback_url, job.job_id, e)
+            else:
+                JOB_WEBHOOKS.labels("delivered").inc()
+                return
+        JOB_WEBHOOKS.labels("failed").inc()
+
+    async def _ensure_group(self, queue: str):
+        if queue in self._created_groups:
+            return
+        try:
+            await self._redis_connection.xgroup_create(self._get_stream(queue), self._group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._created_groups.add(queue)
+
+    def _get_key(self, job_id: str) -> str:
+        return f"{self._key_prefix}:{job_id}"
+
+    def _get_stream(self, queue: str) -> str:
+        return f"{self._stream_prefix}:{queue}"
+
+
+def get_job_body(job: Job) -> dict:
+    """The public view of a job, polled by clients and posted to their callback URL."""
+    return {
+        "job_id": job.job_id,
+        "queue": job.queue,
+        "status": job.status,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
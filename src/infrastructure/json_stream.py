@@ -0,0 +1,55 @@
+from typing import Any
+
+import orjson
+
+
+class JSONArrayItemsParser:
+    """
+    Incrementally parses JSON text fed in chunks and returns items of the arrays nested at `items_depth`
+    as soon as each of them is complete, e.g. `items_depth=1` for `[...]` and `items_depth=2` for `{"key": [...]}`.
+    Items which aren't valid JSON are skipped, the whole `text` is validated once the stream ends.
+    """
+
+    def __init__(self, items_depth: int = 1):
+        self._items_depth = items_depth
+        self._text = ""
+        self._containers: list[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._item_start: int | None = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> list[Any]:
+        items = []
+        offset = len(self._text)
+        self._text += chunk
+        for position in range(offset, len(self._text)):
+            char = self._text[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            in_items_array = len(self._containers) == self._items_depth and self._containers[-1] == "["
+            if in_items_array and char in ",]":
+                if self._item_start is not None:
+                    try:
+                        items.append(orjson.loads(self._text[self._item_start:position]))
+                    except orjson.JSONDecodeError:
+                        pass
+                    self._item_start = None
+            elif in_items_array and self._item_start is None and not char.isspace():
+                self._item_start = position
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._containers.append(char)
+            elif char in "]}" and self._containers:
+                self._containers.pop()
+        return items
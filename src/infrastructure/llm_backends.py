@@ -0,0 +1,279 @@
+import abc
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from typing import Any, AsyncIterator
+
+from openai import AsyncOpenAI
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice, ChoiceDelta
+
+from config import Config
+from infrastructure.llm_scheduler import LLMScheduler, Priority
+
+# Completions of the agents are short, reserve this many tokens for them on top of the prompt in rate limit budgets.
+COMPLETION_TOKENS_ESTIMATE = 500
+LLM_FAKE_LATENCY_DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal", "exponential")
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text, good enough for packing prompts under a budget.
+    return len(text) // 4 + 1
+
+
+def estimate_messages_tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(message["content"]) for message in messages) + COMPLETION_TOKENS_ESTIMATE
+
+
+def get_agents_llm_backends(config: Config) -> set[str]:
+    return {
+        config.LLM_GENERATE_QUESTIONS_BACKEND,
+        config.LLM_RESPONSE_EVALUATION_BACKEND,
+        config.LLM_VALIDATION_BACKEND,
+    }
+
+
+def get_response_format_kwargs(json_output: bool) -> dict:
+    # JSON mode of the chat completions API, supported by OpenAI-compatible local servers too.
+    return {"response_format": {"type": "json_object"}} if json_output else {}
+
+
+class LLMBackend(abc.ABC):
+    """Chat completions provider of the agents. Every call waits for a slot of the shared LLM scheduler."""
+
+    name: str
+
+    @abc.abstractmethod
+    async def create_chat_completion(
+            self,
+            priority: Priority,
+            model: str,
+            messages: list[dict],
+            json_output: bool = False,
+    ) -> ChatCompletion:
+        """With `json_output` the model is constrained to reply with a JSON object."""
+
+    @abc.abstractmethod
+    def stream_chat_completion(
+            self,
+            priority: Priority,
+            model: str,
+            messages: list[dict],
+            json_output: bool = False,
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        """Streams the completion chunks, the last one has no choices and carries the usage of the whole stream."""
+
+
+class OpenAILLMBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, client: AsyncOpenAI, scheduler: LLMScheduler):
+        self._client = client
+        self._scheduler = scheduler
+
+    async def create_chat_completion(
+            self,
+            priority: Priority,
+            model: str,
+            messages: list[dict],
+            json_output: bool = False,
+    ) -> ChatCompletion:
+        return await self._scheduler.run(
+            priority,
+            estimate_messages_tokens(messages),
+            lambda: self._client.chat.completions.with_raw_response.create(
+                model=model, messages=messages, **get_response_format_kwargs(json_output),
+            ),
+        )
+
+    def stream_chat_completion(
+            self,
+            priority: Priority,
+            model: str,
+            messages: list[dict],
+            json_output: bool = False,
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        return self._scheduler.stream(
+            priority,
+            estimate_messages_tokens(messages),
+            lambda: self._client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **get_response_format_kwargs(json_output),
+            ),
+        )
+
+
+class LocalLLMBackend(OpenAILLMBackend):
+    """
+    Locally hosted OpenAI-compatible server, like llama.cpp or vLLM, behind its own client pointed at
+    `LLM_LOCAL_BASE_URL`. Such servers don't report rate limits, so the scheduler only adapts its concurrency to them.
+    """
+
+    name = "local"
+
+
+class FakeRawResponse:
+    """Stands for a `with_raw_response` response in the LLM scheduler."""
+
+    def __init__(self, parsed: Any):
+        self.headers = {}
+        self._parsed = parsed
+
+    def parse(self) -> Any:
+        return self._parsed
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    In-process stand-in for load tests and offline runs. Answers every agent with a deterministic, well-formed
+    completion derived from its prompt. The first token comes after a latency drawn from
+    `LLM_FAKE_LATENCY_DISTRIBUTION` with `LLM_FAKE_LATENCY_MEAN` and `LLM_FAKE_LATENCY_STDDEV` seconds, seeded with
+    `LLM_FAKE_SEED`, and every next chunk of `LLM_FAKE_STREAM_CHUNK_SIZE` characters after
+    `LLM_FAKE_STREAM_CHUNK_INTERVAL` seconds. Non-streamed completions take as long as the streamed ones.
+    """
+
+    name = "fake"
+
+    def __init__(self, config: Config, scheduler: LLMScheduler):
+        if config.LLM_FAKE_LATENCY_DISTRIBUTION not in LLM_FAKE_LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown fake LLM latency distribution: {config.LLM_FAKE_LATENCY_DISTRIBUTION}")
+        self._scheduler = scheduler
+        self._distribution = config.LLM_FAKE_LATENCY_DISTRIBUTION
+        self._latency_mean = float(config.LLM_FAKE_LATENCY_MEAN)
+        self._latency_stddev = float(config.LLM_FAKE_LATENCY_STDDEV)
+        self._chunk_size = int(config.LLM_FAKE_STREAM_CHUNK_SIZE)
+        self._chunk_interval = float(config.LLM_FAKE_STREAM_CHUNK_INTERVAL)
+        self._random = random.Random(int(config.LLM_FAKE_SEED))
+
+    async def create_chat_completion(
+            self,
+            priority: Priority,
+            model: str,
+            messages: list[dict],
+            json_output: bool = False,
+    ) -> ChatCompletion:
+        async def request() -> FakeRawResponse:
+            content = get_fake_completion_content(messages)
+            chunks_count = max(math.ceil(len(content) / self._chunk_size), 1)
+            await asyncio.sleep(self.sample_latency() + (chunks_count - 1) * self._chunk_interval)
+            return FakeRawResponse(
+                ChatCompletion(
+                    id=self._get_completion_id(messages),
+                    object="chat.completion",
+                    created=int(time.time()),
+                    model=model,
+                    choices=[
+                        Choice(
+                            index=0,
+                            finish_reason="stop",
+                            message=ChatCompletionMessage(role="assistant", content=content),
+                        ),
+                    ],
+                    usage=self._get_usage(messages, content),
+                ),
+            )
+
+        return await self._scheduler.run(priority, estimate_messages_tokens(messages), request)
+
+    def stream_chat_completion(
+            self,
+            priority: Priority,
+            model: str,
+            messages: list[dict],
+            json_output: bool = False,
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        async def request() -> FakeRawResponse:
+            await asyncio.sleep(self.sample_latency())
+            return FakeRawResponse(self._stream_chunks(model, messages))
+
+        return self._scheduler.stream(priority, estimate_messages_tokens(messages), request)
+
+    def sample_latency(self) -> float:
+        mean, stddev = self._latency_mean, self._latency_stddev
+        if self._distribution == "constant" or mean <= 0:
+            return max(mean, 0.0)
+        if self._distribution == "uniform":
+            # The half-width of a uniform distribution with this standard deviation.
+            half_width = stddev * math.sqrt(3)
+            return max(self._random.uniform(mean - half_width, mean + half_width), 0.0)
+        if self._distribution == "normal":
+            return max(self._random.gauss(mean, stddev), 0.0)
+        if self._distribution == "lognormal":
+            sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+            return self._random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        return self._random.expovariate(1 / mean)
+
+    async def _stream_chunks(self, model: str, messages: list[dict]) -> AsyncIterator[ChatCompletionChunk]:
+        completion_id = self._get_completion_id(messages)
+        created = int(time.time())
+        content = get_fake_completion_content(messages)
+        for offset in range(0, len(content), self._chunk_size):
+            if offset:
+                await asyncio.sleep(self._chunk_interval)
+            yield ChatCompletionChunk(
+                id=completion_id,
+                object="chat.completion.chunk",
+                created=created,
+                model=model,
+                choices=[
+                    ChunkChoice(index=0, delta=ChoiceDelta(content=content[offset:offset + self._chunk_size])),
+                ],
+            )
+        yield ChatCompletionChunk(
+            id=completion_id,
+            object="chat.completion.chunk",
+            created=created,
+            model=model,
+            choices=[],
+            usage=self._get_usage(messages, content),
+        )
+
+    @staticmethod
+    def _get_completion_id(messages: list[dict]) -> str:
+        return f"fake-{hashlib.sha1(json.dumps(messages).encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def _get_usage(messages: list[dict], content: str) -> CompletionUsage:
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        completion_tokens = estimate_tokens(content)
+        return CompletionUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+
+
+def get_fake_completion_content(messages: list[dict]) -> str:
+    """Answers the prompts of the agents in their output formats, the same prompt always gets the same answer."""
+    prompt = messages[-1]["content"]
+    if "Candidate ID: " in prompt:
+        candidates = {}
+        for candidate_prompt in prompt.split("Candidate ID: ")[1:]:
+            candidate_id, _, candidate_prompt = candidate_prompt.partition("\n")
+            candidates[candidate_id.strip()] = get_fake_scores(candidate_prompt)
+        return json.dumps(candidates)
+    prompt_fields = dict(line.split(": ", 1) for line in prompt.splitlines() if ": " in line)
+    if "Job Title" not in prompt_fields:
+        return json.dumps(
+            {"questions": [f"{number}. Fake interview question {number} for the role?" for number in range(1, 4)]},
+        )
+    scores = get_fake_scores(prompt)
+    if "Scores" in prompt_fields:
+        return json.dumps({"scores": scores, "feedback": "Good"})
+    return json.dumps({"scores": scores})
+
+
+def get_fake_scores(prompt: str) -> list[dict]:
+    prompt_fields = dict(line.split(": ", 1) for line in prompt.splitlines() if ": " in line)
+    questions_count = len(json.loads(prompt_fields.get("Questions", "[]")))
+    # Scores from 1 to 5 derived from the response, so different responses get different but stable scores.
+    digest = hashlib.sha1(prompt_fields.get("Response", "").encode("utf-8")).digest()
+    return [{"score": digest[i % len(digest)] % 5 + 1, "comment": "Fake evaluation."} for i in range(questions_count)]
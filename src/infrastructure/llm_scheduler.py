@@ -0,0 +1,298 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import openai
+
+from config import Config
+from dto import LLMSchedulerStats
+from infrastructure.metrics import (
+    LLM_SCHEDULER_CONCURRENCY_LIMIT, LLM_SCHEDULER_IN_FLIGHT, LLM_SCHEDULER_QUEUED, LLM_SCHEDULER_QUEUE_WAIT,
+    LLM_SCHEDULER_RETRIES, LLM_SCHEDULER_SHED,
+)
+from infrastructure.tracing import get_current_span
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError,
+)
+DURATION_PART_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 60 * 60}
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    STANDARD = 1
+    BATCH = 2
+
+
+class LLMSchedulerOverloadedError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM calls are overloaded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def parse_rate_limit_duration(value: str) -> float:
+    """Parses OpenAI rate limit reset durations like `1s`, `6m0s` or `120ms` into seconds."""
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in DURATION_PART_PATTERN.findall(value))
+
+
+class LLMScheduler:
+    """
+    Shared gate in front of the OpenAI client.
+
+    Requests wait in a priority queue for one of the in-flight slots. The number of slots adapts AIMD-style: it grows
+    by one per window of successful calls and is cut by `LLM_SCHEDULER_BACKOFF_RATIO` on throttling. Request and token
+    budgets reported in the `x-ratelimit-*` response headers pause dispatching until they reset. Retryable errors are
+    retried with full jitter backoff. A request whose expected queue wait exceeds the deadline of its priority is
+    rejected right away with `LLMSchedulerOverloadedError` instead of queueing.
+    """
+
+    def __init__(self, config: Config):
+        self._min_concurrency = int(config.LLM_SCHEDULER_MIN_CONCURRENCY)
+        self._max_concurrency = int(config.LLM_SCHEDULER_MAX_CONCURRENCY)
+        self._backoff_ratio = float(config.LLM_SCHEDULER_BACKOFF_RATIO)
+        self._max_retries = int(config.LLM_SCHEDULER_MAX_RETRIES)
+        self._retry_base_delay = float(config.LLM_SCHEDULER_RETRY_BASE_DELAY)
+        self._retry_max_delay = float(config.LLM_SCHEDULER_RETRY_MAX_DELAY)
+        self._deadlines = {
+            Priority.INTERACTIVE: float(config.LLM_SCHEDULER_INTERACTIVE_DEADLINE),
+            Priority.STANDARD: float(config.LLM_SCHEDULER_STANDARD_DEADLINE),
+            Priority.BATCH: float(config.LLM_SCHEDULER_BATCH_DEADLINE),
+        }
+        self._limit = float(config.LLM_SCHEDULER_INITIAL_CONCURRENCY)
+        self._in_flight = 0
+        self._waiters: list[list] = []
+        self._sequence = itertools.count()
+        self._remaining_requests: int | None = None
+        self._remaining_tokens: int | None = None
+        self._requests_reset_at = 0.0
+        self._tokens_reset_at = 0.0
+        self._budget_timer: asyncio.TimerHandle | None = None
+        self._last_decrease_at = 0.0
+        self._latency = 1.0
+        self._queue_wait = 0.0
+        self._shed = 0
+        self._retries = 0
+        self._throttled = 0
+
+    async def run(
+            self,
+            priority: Priority,
+            tokens: int,
+            request: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Runs a `with_raw_response` request in a slot and returns the parsed response."""
+        raw_response = await self._open(priority, tokens, request)
+        self._release()
+        return raw_response.parse()
+
+    async def stream(
+            self,
+            priority: Priority,
+            tokens: int,
+            request: Callable[[], Awaitable[Any]],
+    ) -> AsyncIterator[Any]:
+        """Like `run` for streamed responses, the slot is held until the stream is consumed or closed."""
+        raw_response = await self._open(priority, tokens, request)
+        try:
+            async for chunk in raw_response.parse():
+                yield chunk
+        finally:
+            self._release()
+
+    def get_stats(self) -> LLMSchedulerStats:
+        return LLMSchedulerStats(
+            in_flight=self._in_flight,
+            queued=len(self._waiters),
+            concurrency_limit=self._limit,
+            queue_wait_seconds=self._queue_wait,
+            latency_seconds=self._latency,
+            remaining_requests=self._remaining_requests,
+            remaining_tokens=self._remaining_tokens,
+            shed=self._shed,
+            retries=self._retries,
+            throttled=self._throttled,
+        )
+
+    async def _open(
+            self,
+            priority: Priority,
+            tokens: int,
+            request: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        attempt = 0
+        while True:
+            await self._acquire(priority, tokens)
+            started_at = time.monotonic()
+            try:
+                raw_response = await request()
+            except RETRYABLE_ERRORS as e:
+                self._release()
+                self._on_error(e)
+                if attempt >= self._max_retries:
+                    raise
+                retry_delay = self._get_retry_delay(attempt, e)
+                span = get_current_span()
+                if span is not None:
+                    span.add_event("llm.retry", {"error": type(e).__name__, "delay": retry_delay})
+                    span.set_attribute("llm.retries", attempt + 1)
+                await asyncio.sleep(retry_delay)
+                attempt += 1
+                self._retries += 1
+                LLM_SCHEDULER_RETRIES.labels(type(e).__name__).inc()
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._on_success(time.monotonic() - started_at, raw_response.headers)
+            return raw_response
+
+    async def _acquire(self, priority: Priority, tokens: int):
+        if not self._waiters and self._has_slot() and self._has_budget(tokens):
+            self._grant(tokens)
+            LLM_SCHEDULER_QUEUE_WAIT.labels(priority.name).observe(0)
+            return
+        deadline = self._deadlines[priority]
+        expected_wait = self._get_expected_wait(priority)
+        if expected_wait > deadline:
+            self._shed += 1
+            LLM_SCHEDULER_SHED.labels(priority.name).inc()
+            raise LLMSchedulerOverloadedError(expected_wait)
+        future = asyncio.get_running_loop().create_future()
+        waiter = [priority, next(self._sequence), tokens, future]
+        heapq.heappush(self._waiters, waiter)
+        LLM_SCHEDULER_QUEUED.set(len(self._waiters))
+        # Dispatching right away also arms the budget reset timer when nothing is in flight to release a slot.
+        self._dispatch()
+        enqueued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(future, deadline)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                LLM_SCHEDULER_QUEUED.set(len(self._waiters))
+            elif future.done() and not future.cancelled():
+                # The slot was granted while the request was being cancelled or timing out, the next one takes it.
+                self._release()
+            if isinstance(e, asyncio.TimeoutError):
+                self._shed += 1
+                LLM_SCHEDULER_SHED.labels(priority.name).inc()
+                raise LLMSchedulerOverloadedError(deadline) from None
+            raise
+        queue_wait = time.monotonic() - enqueued_at
+        self._queue_wait += 0.2 * (queue_wait - self._queue_wait)
+        LLM_SCHEDULER_QUEUE_WAIT.labels(priority.name).observe(queue_wait)
+        span = get_current_span()
+        if span is not None:
+            span.set_attribute("llm.queue_wait_seconds", queue_wait)
+
+    def _release(self):
+        self._in_flight -= 1
+        LLM_SCHEDULER_IN_FLIGHT.set(self._in_flight)
+        self._dispatch()
+
+    def _grant(self, tokens: int):
+        self._in_flight += 1
+        LLM_SCHEDULER_IN_FLIGHT.set(self._in_flight)
+        now = time.monotonic()
+        # Budgets are known only until their reset, after it the next response headers report them again.
+        if self._remaining_requests is not None:
+            self._remaining_requests = self._remaining_requests - 1 if now < self._requests_reset_at else None
+        if self._remaining_tokens is not None:
+            self._remaining_tokens = self._remaining_tokens - tokens if now < self._tokens_reset_at else None
+
+    def _dispatch(self):
+        while self._waiters and self._has_slot():
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._has_budget(tokens):
+                self._schedule_dispatch_on_budget_reset()
+                return
+            heapq.heappop(self._waiters)
+            LLM_SCHEDULER_QUEUED.set(len(self._waiters))
+            self._grant(tokens)
+            future.set_result(None)
+
+    def _has_slot(self) -> bool:
+        return self._in_flight < max(int(self._limit), 1)
+
+    def _has_budget(self, tokens: int) -> bool:
+        now = time.monotonic()
+        if self._remaining_requests is not None and self._remaining_requests <= 0 and now < self._requests_reset_at:
+            return False
+        if self._remaining_tokens is not None and self._remaining_tokens < tokens and now < self._tokens_reset_at:
+            return False
+        return True
+
+    def _get_budget_reset_delay(self) -> float:
+        now = time.monotonic()
+        return max(self._requests_reset_at - now, self._tokens_reset_at - now, 0.0)
+
+    def _schedule_dispatch_on_budget_reset(self):
+        if self._budget_timer is not None and not self._budget_timer.cancelled():
+            return
+
+        def dispatch():
+            self._budget_timer = None
+            self._remaining_requests = None
+            self._remaining_tokens = None
+            self._dispatch()
+
+        self._budget_timer = asyncio.get_running_loop().call_later(self._get_budget_reset_delay(), dispatch)
+
+    def _get_expected_wait(self, priority: Priority) -> float:
+        ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority)
+        return ahead / max(int(self._limit), 1) * self._latency + self._get_budget_reset_delay()
+
+    def _on_success(self, latency: float, headers):
+        self._latency += 0.2 * (latency - self._latency)
+        self._limit = min(self._limit + 1 / self._limit, self._max_concurrency)
+        LLM_SCHEDULER_CONCURRENCY_LIMIT.set(self._limit)
+        now = time.monotonic()
+        if "x-ratelimit-remaining-requests" in headers:
+            self._remaining_requests = int(headers["x-ratelimit-remaining-requests"])
+            self._requests_reset_at = now + parse_rate_limit_duration(headers.get("x-ratelimit-reset-requests", ""))
+        if "x-ratelimit-remaining-tokens" in headers:
+            self._remaining_tokens = int(headers["x-ratelimit-remaining-tokens"])
+            self._tokens_reset_at = now + parse_rate_limit_duration(headers.get("x-ratelimit-reset-tokens", ""))
+
+    def _on_error(self, error: Exception):
+        if not isinstance(error, (openai.RateLimitError, openai.APITimeoutError)):
+            return
+        self._throttled += 1
+        now = time.monotonic()
+        # Throttling errors of calls which were already in flight belong to the same overload, decrease once for them.
+        if now - self._last_decrease_at < self._latency:
+            return
+        self._last_decrease_at = now
+        self._limit = max(self._limit * self._backoff_ratio, self._min_concurrency)
+        LLM_SCHEDULER_CONCURRENCY_LIMIT.set(self._limit)
+        if isinstance(error, openai.RateLimitError):
+            retry_after = self._get_retry_after(error)
+            if retry_after:
+                self._remaining_requests = 0
+                self._requests_reset_at = max(self._requests_reset_at, now + retry_after)
+
+    def _get_retry_delay(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self._retry_max_delay, self._retry_base_delay * 2 ** attempt))
+        return max(delay, self._get_retry_after(error))
+
+    @staticmethod
+    def _get_retry_after(error: Exception) -> float:
+        response = getattr(error, "response", None)
+        if response is None:
+            return 0.0
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        try:
+            return float(response.headers.get("retry-after", 0))
+        except ValueError:
+            return 0.0
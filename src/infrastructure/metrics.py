@@ -0,0 +1,144 @@
+import functools
+import inspect
+import os
+import time
+from typing import Any
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+STORAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+TOKENS_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Duration of HTTP requests.", ["method", "route", "status"],
+)
+LLM_CALL_DURATION = Histogram(
+    "llm_call_duration_seconds", "Duration of LLM calls of the agents.", ["agent", "operation"], buckets=LLM_BUCKETS,
+)
+LLM_CALL_TOKENS = Histogram(
+    "llm_call_tokens", "Prompt and completion tokens of LLM calls of the agents.", ["agent", "kind"],
+    buckets=TOKENS_BUCKETS,
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Prompt tokens of the agents counted locally before sending.", ["agent"],
+    buckets=TOKENS_BUCKETS,
+)
+SHARED_CONTEXT_OPERATION_DURATION = Histogram(
+    "shared_context_operation_duration_seconds", "Duration of shared context Redis operations.", ["operation"],
+    buckets=STORAGE_BUCKETS,
+)
+FILES_STORAGE_OPERATION_DURATION = Histogram(
+    "files_storage_operation_duration_seconds", "Duration of files storage operations.", ["operation"],
+    buckets=STORAGE_BUCKETS,
+)
+LLM_SCHEDULER_QUEUE_WAIT = Histogram(
+    "llm_scheduler_queue_wait_seconds", "Time LLM calls wait for a slot of the scheduler.", ["priority"],
+    buckets=STORAGE_BUCKETS + (10, 30, 60),
+)
+LLM_SCHEDULER_IN_FLIGHT = Gauge(
+    "llm_scheduler_in_flight", "LLM calls in flight.", multiprocess_mode="livesum",
+)
+LLM_SCHEDULER_QUEUED = Gauge(
+    "llm_scheduler_queued", "LLM calls waiting for a slot.", multiprocess_mode="livesum",
+)
+LLM_SCHEDULER_CONCURRENCY_LIMIT = Gauge(
+    "llm_scheduler_concurrency_limit", "Adaptive limit of LLM calls in flight.", multiprocess_mode="livesum",
+)
+LLM_SCHEDULER_SHED = Counter("llm_scheduler_shed", "LLM calls rejected because of overloading.", ["priority"])
+LLM_SCHEDULER_RETRIES = Counter("llm_scheduler_retries", "Retried LLM calls.", ["error"])
+LLM_PROMPT_TRUNCATIONS = Counter(
+    "llm_prompt_truncations", "Prompts of the agents truncated to fit their token budgets.", ["agent"],
+)
+LLM_STRUCTURED_OUTPUTS = Counter(
+    "llm_structured_outputs", "Structured outputs of the agents: valid, repaired, re-asked or failed.",
+    ["agent", "outcome"],
+)
+LLM_STRUCTURED_OUTPUT_WASTED_TOKENS = Counter(
+    "llm_structured_output_wasted_tokens", "Tokens spent on rejected outputs of the agents, estimated for streams.",
+    ["agent"],
+)
+EVALUATION_CACHE_LOOKUPS = Counter(
+    "evaluation_cache_lookups", "Lookups of agent results in the evaluation cache: hits, local hits and misses.",
+    ["agent", "result"],
+)
+SPECULATIONS = Counter(
+    "speculations", "Speculative calls started, skipped over the concurrency cap, cancelled and failed.", ["outcome"],
+)
+JOBS_FINISHED = Counter("jobs_finished", "Asynchronous jobs finished per queue and status.", ["queue", "status"])
+JOB_QUEUE_WAIT = Histogram(
+    "job_queue_wait_seconds", "Time asynchronous jobs wait in their queue until a worker takes them.", ["queue"],
+    buckets=LLM_BUCKETS,
+)
+JOB_WEBHOOKS = Counter(
+    "job_webhooks", "Callbacks of finished asynchronous jobs, delivered, failed and rejected.", ["outcome"],
+)
+HTTP_POOL_IN_FLIGHT = Gauge(
+    "http_pool_in_flight", "HTTP requests in flight per connection pool.", ["pool"], multiprocess_mode="livesum",
+)
+HTTP_POOL_QUEUED = Gauge(
+    "http_pool_queued", "HTTP requests waiting for a pool connection.", ["pool"], multiprocess_mode="livesum",
+)
+HTTP_POOL_CONNECTIONS_CREATED = Counter(
+    "http_pool_connections_created", "Connections opened by the HTTP connection pools.", ["pool"],
+)
+
+
+def instrument_async_methods(instance: Any, histogram: Histogram) -> Any:
+    """
+    Replaces public coroutine methods of the instance with ones observing their duration into the histogram,
+    labelled by the method name. Labelled children are resolved once here, so a call costs only two clock reads
+    and an observation.
+    """
+    for name, method in inspect.getmembers(instance, inspect.iscoroutinefunction):
+        if not name.startswith("_"):
+            setattr(instance, name, _get_timed_method(method, histogram.labels(name)))
+    return instance
+
+
+def _get_timed_method(method, observer):
+    @functools.wraps(method)
+    async def timed_method(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            observer.observe(time.perf_counter() - started_at)
+
+    return timed_method
+
+
+def generate_metrics() -> tuple[bytes, str]:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware observing request durations labelled by the route template rather than the raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started_at = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], route.path if route is not None else "unmatched", status,
+            ).observe(time.perf_counter() - started_at)
@@ -0,0 +1,189 @@
+import asyncio
+import io
+import logging
+import os
+import socket
+import time
+
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from config import Config
+from dto import PersistenceQueueStats, StorageObject
+from infrastructure.files_storage import FilesStorage
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceQueue:
+    """
+    Durable write-behind queue of objects to put into the files storage, backed by a Redis Stream.
+    Workers of all processes share one consumer group. Failed uploads stay pending and are reclaimed after
+    `PERSISTENCE_QUEUE_RETRY_IDLE` seconds, and go to the dead letter stream after `PERSISTENCE_QUEUE_MAX_ATTEMPTS`.
+    """
+
+    _stream = "persistence_queue"
+    _dead_letter_stream = "persistence_queue:dead_letter"
+    _group = "persistence_workers"
+
+    def __init__(self, config: Config, redis_connection: redis.Redis, files_storage_client: FilesStorage):
+        self._redis_connection = redis_connection
+        self._files_storage = files_storage_client
+        self._max_attempts = int(config.PERSISTENCE_QUEUE_MAX_ATTEMPTS)
+        self._retry_idle_ms = int(float(config.PERSISTENCE_QUEUE_RETRY_IDLE) * 1000)
+        self._batch_size = int(config.PERSISTENCE_QUEUE_BATCH_SIZE)
+        self._block_ms = int(float(config.PERSISTENCE_QUEUE_BLOCK) * 1000)
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._group_created = False
+
+    async def enqueue(self, objects: list[StorageObject]):
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            for storage_object in objects:
+                pipe.xadd(
+                    self._stream,
+                    {
+                        "bucket_name": storage_object.bucket_name,
+                        "object_name": storage_object.object_name,
+                        "data": storage_object.data,
+                        "content_type": storage_object.content_type,
+                    },
+                )
+            await pipe.execute()
+
+    async def run_worker(self):
+        while True:
+            try:
+                await self.process_batch(block=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to process persistence queue")
+                await asyncio.sleep(1)
+
+    async def flush(self):
+        """
+        Drains the entries taken by this worker and the ones not taken yet without blocking for new ones, used on
+        shutdown. Entries taken by other workers are left to them, and the flush stops at the first failed upload,
+        so a storage outage doesn't use up the attempts of the entries, the other workers retry them later.
+        """
+        await self._ensure_group()
+        # "0" reads the pending entries of this consumer again, ">" the entries not delivered to any consumer yet.
+        for stream_id in ("0", ">"):
+            while True:
+                response = await self._redis_connection.xreadgroup(
+                    self._group, self._consumer, {self._stream: stream_id}, count=self._batch_size,
+                )
+                messages = response[0][1] if response else []
+                if not messages:
+                    break
+                if await self._process_messages(messages):
+                    return
+
+    async def process_batch(self, block: bool) -> int:
+        await self._ensure_group()
+        _, messages, _ = await self._redis_connection.xautoclaim(
+            self._stream, self._group, self._consumer, self._retry_idle_ms, count=self._batch_size,
+        )
+        if not messages:
+            response = await self._redis_connection.xreadgroup(
+                self._group,
+                self._consumer,
+                {self._stream: ">"},
+                count=self._batch_size,
+                block=self._block_ms if block else None,
+            )
+            messages = response[0][1] if response else []
+        if messages:
+            await self._process_messages(messages)
+        return len(messages)
+
+    async def _process_messages(self, messages: list[tuple[bytes, dict | None]]) -> int:
+        """Puts the objects of the entries and acknowledges the persisted ones, returns the number of failed ones."""
+        # Pending entries deleted from the stream in the meantime come without fields, there is nothing to put.
+        deleted_ids = [message_id for message_id, fields in messages if fields is None]
+        messages = [(message_id, fields) for message_id, fields in messages if fields is not None]
+        failed = await self._put_objects(messages)
+        processed_ids = [message_id for message_id, _ in messages if message_id not in failed]
+        processed_ids.extend(await self._dead_letter_exhausted(failed))
+        processed_ids.extend(deleted_ids)
+        if processed_ids:
+            async with self._redis_connection.pipeline(transaction=True) as pipe:
+                pipe.xack(self._stream, self._group, *processed_ids)
+                pipe.xdel(self._stream, *processed_ids)
+                await pipe.execute()
+        return len(failed)
+
+    async def get_stats(self) -> PersistenceQueueStats:
+        await self._ensure_group()
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            pipe.xlen(self._stream)
+            pipe.xpending(self._stream, self._group)
+            pipe.xinfo_groups(self._stream)
+            pipe.xlen(self._dead_letter_stream)
+            pipe.xrange(self._stream, count=1)
+            depth, pending, groups, dead_letters, oldest = await pipe.execute()
+        group = next((group for group in groups if group["name"] == self._group.encode()), {})
+        oldest_age = 0.0
+        if oldest:
+            oldest_timestamp_ms = int(oldest[0][0].split(b"-")[0])
+            oldest_age = max(time.time() - oldest_timestamp_ms / 1000, 0.0)
+        return PersistenceQueueStats(
+            depth=depth,
+            pending=pending["pending"],
+            lag=group.get("lag") or 0,
+            dead_letters=dead_letters,
+            oldest_entry_age_seconds=oldest_age,
+        )
+
+    async def _ensure_group(self):
+        if self._group_created:
+            return
+        try:
+            await self._redis_connection.xgroup_create(self._stream, self._group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_created = True
+
+    async def _put_objects(self, messages: list[tuple[bytes, dict]]) -> dict[bytes, dict]:
+        results = await asyncio.gather(
+            *(
+                self._files_storage.put_object(
+                    bucket_name=fields[b"bucket_name"].decode(),
+                    object_name=fields[b"object_name"].decode(),
+                    data=io.BytesIO(fields[b"data"]),
+                    length=len(fields[b"data"]),
+                    content_type=fields[b"content_type"].decode(),
+                )
+                for _, fields in messages
+            ),
+            return_exceptions=True,
+        )
+        failed = {}
+        for (message_id, fields), result in zip(messages, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to persist %s: %r", fields[b"object_name"].decode(), result)
+                failed[message_id] = fields
+        return failed
+
+    async def _dead_letter_exhausted(self, failed: dict[bytes, dict]) -> list[bytes]:
+        if not failed:
+            return []
+        # One exact range per entry, a range over all failed ones could hold more entries pending for this consumer
+        # than a single reply returns, and the ones past it would be retried forever.
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            for message_id in failed:
+                pipe.xpending_range(
+                    self._stream, self._group, min=message_id, max=message_id, count=1, consumername=self._consumer,
+                )
+            pending = [entry for entries in await pipe.execute() for entry in entries]
+        exhausted_ids = [
+            entry["message_id"] for entry in pending
+            if entry["message_id"] in failed and entry["times_delivered"] >= self._max_attempts
+        ]
+        if exhausted_ids:
+            async with self._redis_connection.pipeline(transaction=False) as pipe:
+                for message_id in exhausted_ids:
+                    pipe.xadd(self._dead_letter_stream, failed[message_id])
+                await pipe.execute()
+        return exhausted_ids
@@ -0,0 +1,162 @@
+import functools
+import hashlib
+import logging
+import textwrap
+import threading
+from typing import Any
+
+import orjson
+import tiktoken
+
+from infrastructure.metrics import LLM_PROMPT_TOKENS, LLM_PROMPT_TRUNCATIONS
+
+logger = logging.getLogger(__name__)
+
+# Every chat message is wrapped into a few role and separator tokens.
+MESSAGE_TOKENS_OVERHEAD = 4
+# Local models aren't known to tiktoken, the encoding of the OpenAI chat models is close enough for budgets.
+DEFAULT_ENCODING = "cl100k_base"
+TRUNCATION_MARKER = "\n[...truncated...]\n"
+
+
+def minify_prompt(prompt: str) -> str:
+    """Drops the indentation of triple-quoted prompts, trailing spaces and repeated blank lines."""
+    lines = [line.rstrip() for line in textwrap.dedent(prompt).strip().splitlines()]
+    return "\n".join(line for i, line in enumerate(lines) if line or lines[i - 1])
+
+
+class PromptTooLongError(Exception):
+    """Fields of a prompt which can't be truncated don't fit its token budget alone."""
+
+
+class Tokenizer:
+    """
+    Counts tokens with the tiktoken encoding of the model. The encoding is loaded in a background thread on the first
+    use, downloaded unless cached in `TIKTOKEN_CACHE_DIR`, so a slow or unreachable download doesn't block the worker.
+    Until it's loaded, or when it can't be, every UTF-8 byte of the text is counted as a token. No token is shorter
+    than a byte, so prompts are never underestimated, only truncated more than needed, also CJK text and code.
+    """
+
+    def __init__(self, model: str | None):
+        self._model = model
+        self._encoding: tiktoken.Encoding | None = None
+        self._loading = model is None
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text.encode("utf-8"))
+        return len(encoding.encode_ordinary(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cuts the middle out of the text, the beginning and the end of an answer usually carry most of it."""
+        max_tokens = max(max_tokens - self.count(TRUNCATION_MARKER), 0)
+        encoding = self._get_encoding()
+        if encoding is None:
+            # The inverse of the estimate, a byte per token. Characters cut in the middle are dropped.
+            data = text.encode("utf-8")
+            head_length = max_tokens * 2 // 3
+            tail_length = max_tokens - head_length
+            head = data[:head_length].decode("utf-8", errors="ignore")
+            tail = data[len(data) - tail_length:].decode("utf-8", errors="ignore") if tail_length else ""
+            return f"{head}{TRUNCATION_MARKER}{tail}"
+        tokens = encoding.encode_ordinary(text)
+        head_length = max_tokens * 2 // 3
+        tail_length = max_tokens - head_length
+        head = encoding.decode(tokens[:head_length])
+        tail = encoding.decode(tokens[len(tokens) - tail_length:]) if tail_length else ""
+        return f"{head}{TRUNCATION_MARKER}{tail}"
+
+    def _get_encoding(self) -> tiktoken.Encoding | None:
+        if not self._loading:
+            self._loading = True
+            # tiktoken downloads without a timeout, a daemon thread stuck on it doesn't hold the shutdown.
+            threading.Thread(target=self._load_encoding, name=f"tokenizer-{self._model}", daemon=True).start()
+        return self._encoding
+
+    def _load_encoding(self):
+        try:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self._model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+        except Exception:
+            logger.warning("Failed to load the tokenizer of %s, tokens are counted as UTF-8 bytes", self._model)
+
+
+@functools.lru_cache
+def get_tokenizer(model: str) -> Tokenizer:
+    return Tokenizer(model)
+
+
+class PromptBuilder:
+    """
+    Assembles the messages of an agent. System prompts are minified once, so together with the fields which are the
+    same for many requests, like the job title and its questions, they form a byte-stable prefix the provider caches.
+    The field which varies the most goes last and is truncated when the prompt doesn't fit `max_prompt_tokens`.
+    """
+
+    def __init__(self, agent: str, tokenizer: Tokenizer, max_prompt_tokens: int):
+        self._agent = agent
+        self._tokenizer = tokenizer
+        self._max_prompt_tokens = max_prompt_tokens
+        self._system_contents_tokens: dict[str, int] = {}
+
+    def build_prompt(
+            self,
+            system_content: str,
+            template: str,
+            truncated_field: str | None = None,
+            max_prompt_tokens: int | None = None,
+            **fields,
+    ) -> str:
+        """
+        Formats the template with the fields, those which aren't strings as compact JSON. The `truncated_field` is cut
+        to the tokens left by the rest of the messages. `PromptTooLongError` is raised when the rest doesn't fit alone.
+        A `max_prompt_tokens` lower than the budget of the agent applies instead, like the one of a batch chunk.
+        """
+        if max_prompt_tokens is None or max_prompt_tokens > self._max_prompt_tokens:
+            max_prompt_tokens = self._max_prompt_tokens
+        values = {name: self._format_value(value) for name, value in fields.items()}
+        if truncated_field is None:
+            prompt = template.format(**values)
+            self._check_budget(self.count_messages_tokens(system_content, prompt), max_prompt_tokens)
+            return prompt
+        fixed_tokens = self.count_messages_tokens(system_content, template.format(**{**values, truncated_field: ""}))
+        available_tokens = max_prompt_tokens - fixed_tokens
+        if self._tokenizer.count(values[truncated_field]) > available_tokens:
+            # Not even the truncation marker fits, the truncated field can't bring the prompt under the budget.
+            self._check_budget(fixed_tokens + self._tokenizer.count(TRUNCATION_MARKER), max_prompt_tokens)
+            values[truncated_field] = self._tokenizer.truncate(values[truncated_field], available_tokens)
+            LLM_PROMPT_TRUNCATIONS.labels(self._agent).inc()
+        return template.format(**values)
+
+    def build_messages(self, system_content: str, prompt: str) -> list[dict]:
+        LLM_PROMPT_TOKENS.labels(self._agent).observe(self.count_messages_tokens(system_content, prompt))
+        return [{"role": "system", "content": system_content}, {"role": "user", "content": prompt}]
+
+    def get_prompt_version(self, system_content: str, template: str) -> str:
+        """Changes with the prompt and its budget, so results of other prompts aren't mistaken for its results."""
+        prompt = f"{system_content}\0{template}\0{self._max_prompt_tokens}"
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+    def count_tokens(self, text: str) -> int:
+        return self._tokenizer.count(text)
+
+    def count_messages_tokens(self, system_content: str, prompt: str) -> int:
+        system_content_tokens = self._system_contents_tokens.get(system_content)
+        if system_content_tokens is None:
+            system_content_tokens = self._system_contents_tokens[system_content] = self._tokenizer.count(
+                system_content,
+            )
+        return system_content_tokens + self.count_tokens(prompt) + 2 * MESSAGE_TOKENS_OVERHEAD
+
+    def _check_budget(self, tokens: int, max_prompt_tokens: int):
+        if tokens > max_prompt_tokens:
+            raise PromptTooLongError(
+                f"Prompt of the {self._agent} agent takes {tokens} tokens, over the budget of {max_prompt_tokens}"
+            )
+
+    @staticmethod
+    def _format_value(value: Any) -> str:
+        return value if isinstance(value, str) else orjson.dumps(value).decode("utf-8")
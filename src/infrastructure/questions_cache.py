@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections import OrderedDict
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+from config import Config
+from dto import QuestionsCacheStats
+
+logger = logging.getLogger(__name__)
+
+# Abbreviations which mean the same wherever they are in the title.
+JOB_TITLE_WORD_SYNONYMS = {
+    "sr": "senior",
+    "snr": "senior",
+    "jr": "junior",
+    "jnr": "junior",
+    "mid": "middle",
+    "js": "javascript",
+    "ts": "typescript",
+    "py": "python",
+    "qa": "quality assurance",
+    "ml": "machine learning",
+}
+# Spellings of the role noun, only for the last word of the title. Engineers and developers stay different roles.
+ROLE_NOUN_SYNONYMS = {
+    "dev": "developer",
+    "programmer": "developer",
+    "eng": "engineer",
+}
+ROLE_NOUNS = {"developer", "engineer", "architect", "lead", "tester", "analyst", "administrator", "scientist"}
+# Short qualifiers of a role noun, only for the word right before it, so common words like "be" are kept elsewhere.
+ROLE_QUALIFIER_SYNONYMS = {
+    "be": "backend",
+    "fe": "frontend",
+}
+WHOLE_JOB_TITLE_SYNONYMS = {
+    "swe": "software engineer",
+    "sde": "software engineer",
+}
+JOINED_TITLE_PARTS = {
+    ("back", "end"): "backend",
+    ("front", "end"): "frontend",
+    ("full", "stack"): "fullstack",
+}
+
+
+def normalize_job_title(job_title: str) -> str:
+    words = []
+    for word in re.sub(r"[^a-z0-9+#]+", " ", job_title.lower()).split():
+        if words and (words[-1], word) in JOINED_TITLE_PARTS:
+            words[-1] = JOINED_TITLE_PARTS[(words[-1], word)]
+        else:
+            words.append(word)
+    title = " ".join(words)
+    if title in WHOLE_JOB_TITLE_SYNONYMS:
+        return WHOLE_JOB_TITLE_SYNONYMS[title]
+    if words:
+        words[-1] = ROLE_NOUN_SYNONYMS.get(words[-1], words[-1])
+    if len(words) > 1 and words[-1] in ROLE_NOUNS:
+        words[-2] = ROLE_QUALIFIER_SYNONYMS.get(words[-2], words[-2])
+    return " ".join(JOB_TITLE_WORD_SYNONYMS.get(word, word) for word in words)
+
+
+class QuestionsCache:
+    """
+    Pools of generated question sets per normalized job title, kept in Redis and in the memory of the worker.
+    Hits of the local tier are counted in the worker and added to the shared stats with its next Redis round trip,
+    or at least every `QUESTIONS_CACHE_STATS_FLUSH_INTERVAL` seconds.
+    """
+
+    _key_prefix = "questions_cache"
+    _stats_key = f"{_key_prefix}:stats"
+
+    def __init__(self, config: Config, redis_connection: redis.Redis):
+        self._redis_connection = redis_connection
+        self._pool_size = int(config.QUESTIONS_CACHE_POOL_SIZE)
+        self._ttl = int(config.QUESTIONS_CACHE_TTL)
+        self._local_maxsize = int(config.QUESTIONS_CACHE_LOCAL_MAXSIZE)
+        self._stats_flush_interval = float(config.QUESTIONS_CACHE_STATS_FLUSH_INTERVAL)
+        self._local_pools: OrderedDict[str, tuple[float, list[list[str]]]] = OrderedDict()
+        self._unflushed_local_hits = 0
+
+    async def get(self, job_title: str) -> list[str] | None:
+        """Returns one of the cached question sets, or None if the pool for the job title isn't full yet."""
+        key = self._get_key(normalize_job_title(job_title))
+        pool = self._get_local_pool(key)
+        if pool is not None:
+            self._unflushed_local_hits += 1
+            return random.choice(pool)
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.ttl(key)
+            self._flush_local_hits(pipe)
+            raw_pool, ttl, *_ = await pipe.execute()
+        if len(raw_pool) < self._pool_size:
+            return None
+        pool = [json.loads(questions) for questions in raw_pool]
+        self._set_local_pool(key, pool, ttl)
+        await self._redis_connection.hincrby(self._stats_key, "hits", 1)
+        return random.choice(pool)
+
+    async def save(self, job_title: str, questions: list[str]):
+        key = self._get_key(normalize_job_title(job_title))
+        async with self._redis_connection.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, json.dumps(questions))
+            pipe.ltrim(key, -self._pool_size, -1)
+            pipe.expire(key, self._ttl, nx=True)
+            pipe.hincrby(self._stats_key, "misses", 1)
+            self._flush_local_hits(pipe)
+            await pipe.execute()
+
+    async def get_stats(self) -> QuestionsCacheStats:
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            self._flush_local_hits(pipe)
+            pipe.hgetall(self._stats_key)
+            *_, stats = await pipe.execute()
+        return QuestionsCacheStats(
+            hits=int(stats.get(b"hits", 0)),
+            local_hits=int(stats.get(b"local_hits", 0)),
+            misses=int(stats.get(b"misses", 0)),
+        )
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self._stats_flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush questions cache stats")
+
+    async def flush(self):
+        if not self._unflushed_local_hits:
+            return
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            self._flush_local_hits(pipe)
+            await pipe.execute()
+
+    def _flush_local_hits(self, pipe: Pipeline):
+        """Moves the local hits counted since the last flush into the pipeline, they are lost if it fails."""
+        if self._unflushed_local_hits:
+            pipe.hincrby(self._stats_key, "local_hits", self._unflushed_local_hits)
+            self._unflushed_local_hits = 0
+
+    def _get_key(self, normalized_job_title: str) -> str:
+        return f"{self._key_prefix}:{normalized_job_title}"
+
+    def _get_local_pool(self, key: str) -> list[list[str]] | None:
+        local_pool = self._local_pools.get(key)
+        if local_pool is None:
+            return None
+        expires_at, pool = local_pool
+        if expires_at <= time.monotonic():
+            del self._local_pools[key]
+            return None
+        self._local_pools.move_to_end(key)
+        return pool
+
+    def _set_local_pool(self, key: str, pool: list[list[str]], ttl: int):
+        if ttl <= 0:
+            return
+        self._local_pools[key] = (time.monotonic() + ttl, pool)
+        self._local_pools.move_to_end(key)
+        while len(self._local_pools) > self._local_maxsize:
+            self._local_pools.popitem(last=False)
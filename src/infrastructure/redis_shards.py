@@ -0,0 +1,188 @@
+import abc
+import bisect
+import hashlib
+from collections import defaultdict
+from typing import Union
+from urllib.parse import urlparse
+
+import redis.asyncio as redis
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+from redis.commands.core import AsyncScript
+from redis.crc import key_slot
+
+RedisClient = Union[redis.Redis, RedisCluster]
+
+
+def get_hash_tag(key: str) -> str:
+    """The part of the key Redis Cluster hashes: the content of the first non-empty `{...}`, or the whole key."""
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def get_node_name(connection: redis.Redis) -> str:
+    connection_kwargs = connection.connection_pool.connection_kwargs
+    return f"{connection_kwargs.get('host')}:{connection_kwargs.get('port')}/{connection_kwargs.get('db', 0)}"
+
+
+class RedisShards(abc.ABC):
+    """
+    Redis nodes holding the keys of one data set. Keys with the same hash tag always go to the same node, so the keys
+    of one entity can be changed together in a transaction or a script.
+    """
+
+    @abc.abstractmethod
+    def get_connection(self, key: str) -> RedisClient:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_node_name(self, key: str) -> str:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def group_keys_by_connection(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        """Groups the keys to be sent in one pipeline per group."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def group_keys_by_slot(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        """Groups the keys to be used together in one transaction or multi-key script per group."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_scan_connections(self) -> list[RedisClient]:
+        """Connections which together scan every key once."""
+        raise NotImplementedError
+
+    def register_script(self, script: str) -> AsyncScript:
+        """Registers a script to be called with the connection of its keys as the `client`."""
+        return self.get_scan_connections()[0].register_script(script)
+
+    async def close(self):
+        pass
+
+
+class SingleRedisShards(RedisShards):
+    """Every key on one Redis node. A connection shared with the rest of the application is left for it to close."""
+
+    def __init__(self, connection: redis.Redis, owns_connection: bool = False):
+        self._connection = connection
+        self._owns_connection = owns_connection
+        self._node_name = get_node_name(connection)
+
+    def get_connection(self, key: str) -> RedisClient:
+        return self._connection
+
+    def get_node_name(self, key: str) -> str:
+        return self._node_name
+
+    def group_keys_by_connection(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        return [(self._connection, keys)] if keys else []
+
+    def group_keys_by_slot(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        return self.group_keys_by_connection(keys)
+
+    def get_scan_connections(self) -> list[RedisClient]:
+        return [self._connection]
+
+    async def close(self):
+        if self._owns_connection:
+            await self._connection.close()
+
+
+class ConsistentHashRedisShards(RedisShards):
+    """
+    Keys spread over independent Redis nodes by a consistent hash ring of their hash tags. Each node takes
+    `virtual_nodes` points of the ring, so adding or removing a node moves only about its share of the keys.
+    """
+
+    def __init__(self, connections: list[redis.Redis], virtual_nodes: int):
+        self._connections = {get_node_name(connection): connection for connection in connections}
+        ring = sorted(
+            (self._hash(f"{node_name}#{point}"), node_name)
+            for node_name in self._connections
+            for point in range(virtual_nodes)
+        )
+        self._ring_hashes = [point_hash for point_hash, _ in ring]
+        self._ring_node_names = [node_name for _, node_name in ring]
+
+    def get_connection(self, key: str) -> RedisClient:
+        return self._connections[self.get_node_name(key)]
+
+    def get_node_name(self, key: str) -> str:
+        position = bisect.bisect(self._ring_hashes, self._hash(get_hash_tag(key))) % len(self._ring_hashes)
+        return self._ring_node_names[position]
+
+    def group_keys_by_connection(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        keys_by_node_name = defaultdict(list)
+        for key in keys:
+            keys_by_node_name[self.get_node_name(key)].append(key)
+        return [(self._connections[node_name], node_keys) for node_name, node_keys in keys_by_node_name.items()]
+
+    def group_keys_by_slot(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        return self.group_keys_by_connection(keys)
+
+    def get_scan_connections(self) -> list[RedisClient]:
+        return list(self._connections.values())
+
+    async def close(self):
+        for connection in self._connections.values():
+            await connection.close()
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class ClusterRedisShards(RedisShards):
+    """Keys spread over the slots of a Redis Cluster, the cluster client routes commands and pipelines by itself."""
+
+    def __init__(self, cluster: RedisCluster):
+        self._cluster = cluster
+
+    def get_connection(self, key: str) -> RedisClient:
+        return self._cluster
+
+    def get_node_name(self, key: str) -> str:
+        return f"cluster/{key_slot(key.encode('utf-8'))}"
+
+    def group_keys_by_connection(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        return [(self._cluster, keys)] if keys else []
+
+    def group_keys_by_slot(self, keys: list[str]) -> list[tuple[RedisClient, list[str]]]:
+        keys_by_slot = defaultdict(list)
+        for key in keys:
+            keys_by_slot[key_slot(key.encode("utf-8"))].append(key)
+        return [(self._cluster, slot_keys) for slot_keys in keys_by_slot.values()]
+
+    def get_scan_connections(self) -> list[RedisClient]:
+        return [self._cluster]
+
+    async def close(self):
+        await self._cluster.close()
+
+
+def create_redis_shards(
+        mode: str,
+        urls: list[str],
+        virtual_nodes: int,
+        default_connection: redis.Redis | None = None,
+) -> RedisShards:
+    """
+    Connects to the nodes of the mode: "single", the only URL or the default connection, "cluster", a Redis Cluster
+    discovered from its URLs, or "sharded", a consistent hash ring of all the URLs.
+    """
+    if mode == "single":
+        if urls:
+            return SingleRedisShards(redis.Redis.from_url(urls[0]), owns_connection=True)
+        return SingleRedisShards(default_connection)
+    if mode == "cluster":
+        # The cluster is discovered from any of its nodes, the rest of the URLs are only tried when the first fails.
+        startup_nodes = [ClusterNode(urlparse(url).hostname, urlparse(url).port or 6379) for url in urls[1:]]
+        return ClusterRedisShards(RedisCluster.from_url(urls[0], startup_nodes=startup_nodes))
+    if mode == "sharded":
+        return ConsistentHashRedisShards([redis.Redis.from_url(url) for url in urls], virtual_nodes)
+    raise ValueError(f"Unknown Redis shards mode: {mode}")
@@ -0,0 +1,213 @@
+import asyncio
+import contextlib
+import json
+import logging
+import uuid
+import zoneinfo
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+import redis.asyncio as redis
+import zstandard
+from redis.asyncio.lock import Lock
+
+from config import Config
+from dto import SharedContextCandidateFullInfo, StorageObject
+from infrastructure.files_storage import FilesStorage
+
+logger = logging.getLogger(__name__)
+
+HOUR_FORMAT = "%Y%m%d%H"
+SEGMENT_SUFFIX = ".ndjson.zst"
+INDEX_SUFFIX = ".index.json"
+TRIM_BUFFER_SCRIPT = """
+redis.call("LTRIM", KEYS[1], ARGV[1], -1)
+if redis.call("LLEN", KEYS[1]) == 0 then
+    redis.call("SREM", KEYS[2], ARGV[2])
+end
+"""
+
+
+def get_archive_record(candidate_info: SharedContextCandidateFullInfo, finished_at: datetime) -> dict:
+    return {"finished_at": finished_at.timestamp(), **candidate_info.to_record()}
+
+
+class SessionArchive:
+    """
+    Archive of finished sessions, optimized for scans by time range.
+
+    Finished sessions are buffered in Redis per hour. Closed hours are flushed into segments like
+    `sessions/2024/01/31/13/<id>.ndjson.zst`. A segment is a sequence of independent zstd frames of
+    `SESSION_ARCHIVE_FRAME_RECORDS` records each, ordered by `finished_at`. The `<id>.index.json` object next to
+    the segment keeps the offsets and time bounds of the frames and the position of every candidate, so readers fetch
+    single frames with ranged GETs instead of whole segments. Flushing is at least once, a flusher dying between the
+    upload and the buffer trim leaves the records to be archived again.
+
+    Segments of the candidates are indexed in Redis per segment hour for `SESSION_ARCHIVE_INDEX_TTL` seconds, older
+    sessions are found by the hour they finished in.
+    """
+
+    _hours_key = "session_archive:hours"
+    _buffer_key_prefix = "session_archive:buffer:"
+    _index_key_prefix = "session_archive:index:"
+    _lock_name = "session_archive:lock"
+
+    def __init__(self, config: Config, redis_connection: redis.Redis, files_storage_client: FilesStorage):
+        self._redis_connection = redis_connection
+        self._files_storage = files_storage_client
+        self._bucket_name = config.SESSION_ARCHIVE_BUCKET_NAME
+        self._flush_interval = float(config.SESSION_ARCHIVE_FLUSH_INTERVAL)
+        self._segment_max_records = int(config.SESSION_ARCHIVE_SEGMENT_MAX_RECORDS)
+        self._frame_records = int(config.SESSION_ARCHIVE_FRAME_RECORDS)
+        self._index_ttl = int(config.SESSION_ARCHIVE_INDEX_TTL)
+        self._compressor = zstandard.ZstdCompressor(level=int(config.SESSION_ARCHIVE_COMPRESSION_LEVEL))
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._trim_buffer = redis_connection.register_script(TRIM_BUFFER_SCRIPT)
+
+    async def append(self, candidate_info: SharedContextCandidateFullInfo, finished_at: datetime):
+        hour = finished_at.astimezone(zoneinfo.ZoneInfo("UTC")).strftime(HOUR_FORMAT)
+        record = json.dumps(get_archive_record(candidate_info, finished_at), ensure_ascii=False)
+        async with self._redis_connection.pipeline(transaction=True) as pipe:
+            pipe.rpush(f"{self._buffer_key_prefix}{hour}", record)
+            pipe.sadd(self._hours_key, hour)
+            await pipe.execute()
+
+    async def run(self):
+        while True:
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush session archive")
+            await asyncio.sleep(self._flush_interval)
+
+    async def flush(self, include_current_hour: bool = False) -> int:
+        """Writes buffered sessions of closed hours into segments and returns the number of archived sessions."""
+        # Like the session reaper, the lock is left to expire so only one worker flushes within an interval. It is
+        # extended while the flush runs, so a slow one isn't taken over by another worker writing the same hours.
+        lock = self._redis_connection.lock(self._lock_name, timeout=self._flush_interval)
+        if not await lock.acquire(blocking=False):
+            return 0
+        async with self._keep_locked(lock):
+            current_hour = datetime.now(zoneinfo.ZoneInfo("UTC")).strftime(HOUR_FORMAT)
+            archived = 0
+            for hour in sorted(hour.decode() for hour in await self._redis_connection.smembers(self._hours_key)):
+                if hour >= current_hour and not include_current_hour:
+                    continue
+                buffer_key = f"{self._buffer_key_prefix}{hour}"
+                while records := await self._redis_connection.lrange(buffer_key, 0, self._segment_max_records - 1):
+                    await self.write_segment(hour, [json.loads(record) for record in records])
+                    await self._trim_buffer(keys=[buffer_key, self._hours_key], args=[len(records), hour])
+                    archived += len(records)
+        return archived
+
+    @contextlib.asynccontextmanager
+    async def _keep_locked(self, lock: Lock):
+        """Resets the timeout of the lock while the block runs, the last reset keeps it for a whole interval after."""
+
+        async def extend():
+            while True:
+                await asyncio.sleep(self._flush_interval / 3)
+                await lock.reacquire()
+
+        task = asyncio.create_task(extend())
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            with contextlib.suppress(Exception):
+                await lock.reacquire()
+
+    async def write_segment(self, hour: str, records: list[dict]) -> str:
+        records = sorted(records, key=lambda record: record["finished_at"])
+        hour_datetime = datetime.strptime(hour, HOUR_FORMAT)
+        segment_name = f"sessions/{hour_datetime:%Y/%m/%d/%H}/{uuid.uuid4().hex}{SEGMENT_SUFFIX}"
+        segment = bytearray()
+        index = {"frames": [], "candidates": {}}
+        for start in range(0, len(records), self._frame_records):
+            frame_records = records[start:start + self._frame_records]
+            frame = self._compressor.compress(
+                b"".join(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in frame_records)
+            )
+            index["frames"].append(
+                {
+                    "offset": len(segment),
+                    "length": len(frame),
+                    "records": len(frame_records),
+                    "first_finished_at": frame_records[0]["finished_at"],
+                    "last_finished_at": frame_records[-1]["finished_at"],
+                }
+            )
+            for line, record in enumerate(frame_records):
+                index["candidates"][record["candidate_id"]] = [len(index["frames"]) - 1, line]
+            segment += frame
+        await self._files_storage.put_objects(
+            [
+                StorageObject(self._bucket_name, segment_name, bytes(segment), "application/zstd"),
+                StorageObject(
+                    self._bucket_name,
+                    self._get_index_name(segment_name),
+                    json.dumps(index).encode("utf-8"),
+                    "application/json",
+                ),
+            ]
+        )
+        index_key = f"{self._index_key_prefix}{hour}"
+        async with self._redis_connection.pipeline(transaction=True) as pipe:
+            pipe.hset(index_key, mapping={candidate_id: segment_name for candidate_id in index["candidates"]})
+            pipe.expire(index_key, self._index_ttl)
+            await pipe.execute()
+        return segment_name
+
+    async def iter_sessions(self, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        """Streams archived sessions finished within [start, end), holding one frame in memory at a time."""
+        start_timestamp, end_timestamp = start.timestamp(), end.timestamp()
+        hour = start.astimezone(zoneinfo.ZoneInfo("UTC")).replace(minute=0, second=0, microsecond=0)
+        while hour.timestamp() < end_timestamp:
+            async for object_name in self._files_storage.iter_object_names(
+                self._bucket_name, prefix=f"sessions/{hour:%Y/%m/%d/%H}/",
+            ):
+                if not object_name.endswith(SEGMENT_SUFFIX):
+                    continue
+                index = await self._get_index(object_name)
+                for frame in index["frames"]:
+                    if frame["last_finished_at"] < start_timestamp or frame["first_finished_at"] >= end_timestamp:
+                        continue
+                    for record in await self._read_frame(object_name, frame):
+                        if start_timestamp <= record["finished_at"] < end_timestamp:
+                            yield record
+            hour += timedelta(hours=1)
+
+    async def get_session(self, candidate_id: str, finished_at: datetime | None = None) -> dict | None:
+        """
+        Returns the archived session of the candidate. Without the time it finished at, only the hours still indexed
+        are looked up, the last `SESSION_ARCHIVE_INDEX_TTL` seconds.
+        """
+        if finished_at is not None:
+            hours = [finished_at.astimezone(zoneinfo.ZoneInfo("UTC"))]
+        else:
+            current_hour = datetime.now(zoneinfo.ZoneInfo("UTC"))
+            hours = [current_hour - timedelta(hours=hour) for hour in range(self._index_ttl // 3600 + 2)]
+        async with self._redis_connection.pipeline(transaction=False) as pipe:
+            for hour in hours:
+                pipe.hget(f"{self._index_key_prefix}{hour.strftime(HOUR_FORMAT)}", candidate_id)
+            segment_name = next((segment_name for segment_name in await pipe.execute() if segment_name), None)
+        if segment_name is None:
+            return None
+        segment_name = segment_name.decode()
+        index = await self._get_index(segment_name)
+        frame_number, line = index["candidates"][candidate_id]
+        return (await self._read_frame(segment_name, index["frames"][frame_number]))[line]
+
+    async def _get_index(self, segment_name: str) -> dict:
+        return json.loads(await self._files_storage.get_object(self._bucket_name, self._get_index_name(segment_name)))
+
+    async def _read_frame(self, segment_name: str, frame: dict) -> list[dict]:
+        data = await self._files_storage.get_object(
+            self._bucket_name, segment_name, offset=frame["offset"], length=frame["length"],
+        )
+        return [json.loads(line) for line in self._decompressor.decompress(data).splitlines()]
+
+    @staticmethod
+    def _get_index_name(segment_name: str) -> str:
+        return segment_name.removesuffix(SEGMENT_SUFFIX) + INDEX_SUFFIX
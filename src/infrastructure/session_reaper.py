@@ -0,0 +1,85 @@
+import asyncio
+import io
+import json
+import logging
+import zoneinfo
+from datetime import datetime
+
+import redis.asyncio as redis
+
+from config import Config
+from infrastructure.files_storage import FilesStorage
+from infrastructure.shared_context import SharedContext
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """
+    Archives incomplete interview sessions which are about to expire into the logs bucket and deletes them.
+    Only one worker reaps at a time, batches are spaced by `SESSION_REAPER_BATCH_DELAY` to keep Redis latency flat.
+    """
+
+    _lock_name = "session_reaper:lock"
+
+    def __init__(
+            self,
+            config: Config,
+            redis_connection: redis.Redis,
+            shared_context: SharedContext,
+            files_storage_client: FilesStorage,
+    ):
+        self._config = config
+        self._redis_connection = redis_connection
+        self._shared_context = shared_context
+        self._files_storage = files_storage_client
+        self._interval = float(config.SESSION_REAPER_INTERVAL)
+        self._expiry_threshold = int(config.SESSION_REAPER_EXPIRY_THRESHOLD)
+        self._batch_size = int(config.SESSION_REAPER_BATCH_SIZE)
+        self._batch_delay = float(config.SESSION_REAPER_BATCH_DELAY)
+
+    async def run(self):
+        while True:
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("Failed to reap expiring sessions")
+            await asyncio.sleep(self._interval)
+
+    async def reap(self) -> int:
+        # The lock is left to expire, so other workers don't reap again within the same interval.
+        lock = self._redis_connection.lock(self._lock_name, timeout=self._interval)
+        if not await lock.acquire(blocking=False):
+            return 0
+        reaped = 0
+        candidate_ids = []
+        async for candidate_id in self._shared_context.iter_candidate_ids(self._batch_size):
+            candidate_ids.append(candidate_id)
+            if len(candidate_ids) >= self._batch_size:
+                reaped += await self._reap_batch(candidate_ids)
+                candidate_ids = []
+                await asyncio.sleep(self._batch_delay)
+        if candidate_ids:
+            reaped += await self._reap_batch(candidate_ids)
+        return reaped
+
+    async def _reap_batch(self, candidate_ids: list[str]) -> int:
+        expiring_candidate_ids = await self._shared_context.get_expiring_candidate_ids(
+            candidate_ids, self._expiry_threshold,
+        )
+        if not expiring_candidate_ids:
+            return 0
+        candidates_info = await self._shared_context.get_full_candidates_info(expiring_candidate_ids)
+        current_datetime = datetime.now().astimezone(zoneinfo.ZoneInfo("UTC"))
+        data = "\n".join(json.dumps(candidate_info.to_record()) for candidate_info in candidates_info).encode("utf-8")
+        await self._files_storage.put_object(
+            bucket_name=self._config.LOGS_BUCKET_NAME,
+            object_name=f"abandoned_sessions/{current_datetime.timestamp()}.ndjson",
+            data=io.BytesIO(data),
+            length=len(data),
+            content_type="application/x-ndjson",
+        )
+        deleted = await self._shared_context.delete_expiring_candidates_info(
+            expiring_candidate_ids, self._expiry_threshold,
+        )
+        return len(deleted)
@@ -1,16 +1,184 @@
+import asyncio
 import json
+import re
+import uuid
+from dataclasses import replace
+from typing import AsyncIterator, Callable
 
-import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
 
-from dto import SharedContextCandidateFullInfo, ResponseEvaluationAgentResult
+from config import Config
+from dto import SharedContextCandidateFullInfo, ResponseEvaluationAgentResult, ValidationAgentResult
+from infrastructure.codecs import decode_candidate_info, encode_candidate_info, get_codec, get_record_codec_id
+from infrastructure.redis_shards import RedisClient, RedisShards
+
+CANDIDATE_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+DELETE_IF_EXPIRING_SCRIPT = """
+local deleted = {}
+for _, key in ipairs(KEYS) do
+    local ttl = redis.call("TTL", key)
+    if ttl >= 0 and ttl <= tonumber(ARGV[1]) then
+        redis.call("DEL", key)
+        table.insert(deleted, key)
+    end
+end
+return deleted
+"""
+# ARGV are the record and revision fields, then per key: the expected revision, the new revision, the record and the
+# TTL, -1 to keep the remaining one of an existing session. The expected revision is ANY_REVISION to create or
+# replace the session, ABSENT_REVISION when there must be no session yet, or the revision of an existing one, empty
+# for sessions stored before revisions. Sessions changed, or deleted, since they were read are left as they are and
+# their keys returned.
+ANY_REVISION = "*"
+ABSENT_REVISION = "-"
+SAVE_IF_UNCHANGED_SCRIPT = """
+local conflicts = {}
+for i, key in ipairs(KEYS) do
+    local offset = 2 + (i - 1) * 4
+    local expected_revision = ARGV[offset + 1]
+    local ttl = tonumber(ARGV[offset + 4])
+    local pttl = redis.call("PTTL", key)
+    local conflicted
+    if expected_revision == "*" then
+        conflicted = false
+    elseif expected_revision == "-" then
+        conflicted = pttl ~= -2
+    else
+        conflicted = pttl == -2 or (redis.call("HGET", key, ARGV[2]) or "") ~= expected_revision
+    end
+    if conflicted or (ttl < 0 and pttl == -2) then
+        table.insert(conflicts, key)
+    else
+        redis.call("DEL", key)
+        redis.call("HSET", key, ARGV[1], ARGV[offset + 3], ARGV[2], ARGV[offset + 2])
+        if ttl >= 0 then
+            redis.call("EXPIRE", key, ttl)
+        elseif pttl > 0 then
+            redis.call("PEXPIRE", key, pttl)
+        end
+    end
+end
+return conflicts
+"""
+
+
+class SharedContextConflictError(Exception):
+    """Session of the candidate has changed since it was read, like new questions generated during an evaluation."""
+
+    def __init__(self, candidate_id: str):
+        super().__init__(f"Session of candidate {candidate_id} has changed, retry with the current one")
+        self.candidate_id = candidate_id
+
+
+class CandidateKeys:
+    """
+    Redis keys of candidates, `<prefix>:{<candidate_id>}` for the session and `<prefix>:{<candidate_id>}:<kind>` for
+    any other key of the candidate, like the ones of its single flight calls. The candidate ID is the hash tag, also
+    without a prefix, so all keys of a candidate share a Redis Cluster slot and a shard. Only `legacy` keys, of sessions
+    stored before the namespacing, are the bare candidate IDs.
+    """
+
+    def __init__(self, prefix: str, legacy: bool = False):
+        self._namespace = f"{prefix}:" if prefix else ""
+        self._legacy = legacy
+        self._key_pattern = re.compile(rf"{re.escape(self._namespace)}\{{({CANDIDATE_ID_PATTERN.pattern})\}}")
+
+    @property
+    def scan_match(self) -> str | None:
+        return None if self._legacy else f"{self._namespace}{{*}}"
+
+    def get_key(self, candidate_id: str, kind: str | None = None) -> str:
+        key = candidate_id if self._legacy else f"{self._namespace}{{{candidate_id}}}"
+        return key if kind is None else f"{key}:{kind}"
+
+    def get_candidate_id(self, key: str) -> str | None:
+        """Returns the candidate ID of a session key, or None for any other key."""
+        if self._legacy:
+            return key if CANDIDATE_ID_PATTERN.fullmatch(key) else None
+        match = self._key_pattern.fullmatch(key)
+        return match.group(1) if match else None
 
 
 class SharedContext:
-    def __init__(self, redis_connection: redis.Redis):
-        self._redis_connection = redis_connection
+    """
+    Interview sessions of candidates, one Redis hash per candidate spread over the shards by the candidate ID.
+    Every write gives the session a new revision and only succeeds on the revision the session was read with, so
+    results computed from an outdated session don't overwrite a newer one.
+    While sessions are moved to new keys or shards, see `commands.rebalance_shared_context`, the ones not found are
+    read from the fallback shards under their old keys, or without fallback shards from the legacy bare keys.
+    """
+
+    _record_field = "record"
+    _revision_field = "revision"
+
+    def __init__(self, config: Config, redis_shards: RedisShards, fallback_redis_shards: RedisShards | None = None):
+        if fallback_redis_shards is None and config.SHARED_CONTEXT_LEGACY_KEYS_FALLBACK:
+            fallback_redis_shards = redis_shards
+        self._redis_shards = redis_shards
+        self._fallback_redis_shards = fallback_redis_shards
+        self._keys = CandidateKeys(config.SHARED_CONTEXT_KEY_PREFIX)
+        self._fallback_keys = CandidateKeys(
+            config.SHARED_CONTEXT_FALLBACK_KEY_PREFIX, legacy=not config.SHARED_CONTEXT_FALLBACK_KEY_PREFIX,
+        )
+        self._codec = get_codec(config.SHARED_CONTEXT_CODEC)
+        self._questions_ttl = int(config.SHARED_CONTEXT_QUESTIONS_TTL)
+        self._evaluated_ttl = int(config.SHARED_CONTEXT_EVALUATED_TTL)
+        self._delete_if_expiring = redis_shards.register_script(DELETE_IF_EXPIRING_SCRIPT)
+        self._save_if_unchanged = redis_shards.register_script(SAVE_IF_UNCHANGED_SCRIPT)
+
+    def get_candidate_key(self, candidate_id: str, kind: str) -> str:
+        """Key of the given kind next to the session of the candidate, for per-candidate keys of other components."""
+        return self._keys.get_key(candidate_id, kind)
 
     async def get_full_candidate_info(self, candidate_id: str) -> SharedContextCandidateFullInfo:
-        info = await self._redis_connection.hgetall(candidate_id)
+        key = self._keys.get_key(candidate_id)
+        info = await self._redis_shards.get_connection(key).hgetall(key)
+        if info or self._fallback_redis_shards is None:
+            return self._get_candidate_full_info(candidate_id, info)
+        fallback_key = self._fallback_keys.get_key(candidate_id)
+        info = await self._fallback_redis_shards.get_connection(fallback_key).hgetall(fallback_key)
+        return self._get_candidate_full_info(candidate_id, info, from_fallback=bool(info))
+
+    async def get_full_candidates_info(self, candidate_ids: list[str]) -> list[SharedContextCandidateFullInfo]:
+        infos, fallback_candidate_ids = await self._get_infos(candidate_ids)
+        return [
+            self._get_candidate_full_info(
+                candidate_id, infos[candidate_id], from_fallback=candidate_id in fallback_candidate_ids,
+            )
+            for candidate_id in candidate_ids
+        ]
+
+    async def _get_infos(self, candidate_ids: list[str]) -> tuple[dict[str, dict], set[str]]:
+        """Returns the infos of the candidates and the IDs of the ones read from the fallback shards."""
+        infos = await execute_by_connection(
+            self._redis_shards, self._keys, candidate_ids, lambda pipe, key: pipe.hgetall(key),
+        )
+        missing_candidate_ids = [candidate_id for candidate_id, info in infos.items() if not info]
+        if not missing_candidate_ids or self._fallback_redis_shards is None:
+            return infos, set()
+        infos.update(
+            await execute_by_connection(
+                self._fallback_redis_shards,
+                self._fallback_keys,
+                missing_candidate_ids,
+                lambda pipe, key: pipe.hgetall(key),
+            )
+        )
+        return infos, {candidate_id for candidate_id in missing_candidate_ids if infos[candidate_id]}
+
+    def _get_candidate_full_info(
+            self,
+            candidate_id: str,
+            info: dict,
+            from_fallback: bool = False,
+    ) -> SharedContextCandidateFullInfo:
+        # A session not moved yet is saved to its new key, which has to be still missing then.
+        revision = ABSENT_REVISION if from_fallback else info.get(self._revision_field.encode(), b"").decode()
+        record = info.get(self._record_field.encode())
+        if record is not None:
+            return replace(decode_candidate_info(record), revision=revision)
+        # Records written before the codecs were introduced keep every field separately.
         return SharedContextCandidateFullInfo(
             candidate_id=candidate_id,
             first_name=info.get(b"first_name", b"").decode(),
@@ -21,10 +189,16 @@ class SharedContext:
             scores=json.loads(info.get(b"scores", "[]")),
             response_comments=json.loads(info.get(b"response_comments", "[]")),
             feedback=info.get(b"feedback", b"").decode(),
+            revision=revision,
         )
 
     async def delete_candidate_info(self, candidate_id: str):
-        await self._redis_connection.delete(candidate_id)
+        key = self._keys.get_key(candidate_id)
+        await self._redis_shards.get_connection(key).delete(key)
+        if self._fallback_redis_shards is not None:
+            # Otherwise a session not moved yet would be read or moved back.
+            fallback_key = self._fallback_keys.get_key(candidate_id)
+            await self._fallback_redis_shards.get_connection(fallback_key).delete(fallback_key)
 
     async def save_candidate_info_and_questions(
             self,
@@ -34,36 +208,253 @@ class SharedContext:
             job_title: str,
             questions: list[str],
     ):
-        await self.delete_candidate_info(candidate_id)
-        await self._redis_connection.hset(
-            candidate_id,
-            mapping={
-                "first_name": first_name,
-                "second_name": second_name,
-                "job_title": job_title,
-                "questions": json.dumps(questions),
-            }
+        # A new session, it replaces whatever was stored for the candidate.
+        await self._save_candidates_info(
+            [
+                SharedContextCandidateFullInfo(
+                    candidate_id=candidate_id,
+                    first_name=first_name,
+                    second_name=second_name,
+                    job_title=job_title,
+                    questions=questions,
+                    candidate_response="",
+                    scores=[],
+                    response_comments=[],
+                    feedback="",
+                )
+            ],
+            check_revision=False,
         )
 
     async def save_response_scores_and_comments(
             self,
-            candidate_id: str,
+            candidate_info: SharedContextCandidateFullInfo,
             response: str,
             scores_and_comments: list[ResponseEvaluationAgentResult],
-    ):
+    ) -> SharedContextCandidateFullInfo:
+        candidate_info = self._merge_scores_and_comments(candidate_info, response, scores_and_comments)
+        return await self._save_candidate_info(candidate_info)
+
+    async def save_many_responses_scores_and_comments(
+            self,
+            candidates_scores_and_comments: list[
+                tuple[SharedContextCandidateFullInfo, list[ResponseEvaluationAgentResult]]
+            ],
+    ) -> list[str]:
+        """Saves the scores of the candidates whose sessions haven't changed, returns the IDs of the other ones."""
+        _, conflicted_candidate_ids = await self._save_candidates_info(
+            [
+                self._merge_scores_and_comments(candidate_info, candidate_info.candidate_response, scores_and_comments)
+                for candidate_info, scores_and_comments in candidates_scores_and_comments
+            ]
+        )
+        return conflicted_candidate_ids
+
+    async def save_validation_result(
+            self,
+            candidate_info: SharedContextCandidateFullInfo,
+            result: ValidationAgentResult,
+    ) -> SharedContextCandidateFullInfo:
+        """Saves validated scores, comments and feedback in one round trip and returns the merged candidate info."""
+        candidate_info = replace(
+            self._merge_scores_and_comments(candidate_info, candidate_info.candidate_response, result["scores"]),
+            feedback=result["feedback"],
+        )
+        return await self._save_candidate_info(candidate_info)
+
+    async def iter_candidate_ids(self, batch_size: int) -> AsyncIterator[str]:
+        async for candidate_id in iter_candidate_ids(self._redis_shards, self._keys, batch_size):
+            yield candidate_id
+
+    async def get_expiring_candidate_ids(self, candidate_ids: list[str], expiry_threshold: int) -> list[str]:
+        ttls = await execute_by_connection(
+            self._redis_shards, self._keys, candidate_ids, lambda pipe, key: pipe.ttl(key),
+        )
+        return [candidate_id for candidate_id in candidate_ids if 0 <= ttls[candidate_id] <= expiry_threshold]
+
+    async def delete_expiring_candidates_info(self, candidate_ids: list[str], expiry_threshold: int) -> list[str]:
+        """Deletes only the candidates which still expire soon, so sessions refreshed in the meantime are kept."""
+        keys = [self._keys.get_key(candidate_id) for candidate_id in candidate_ids]
+        deleted_groups = await asyncio.gather(
+            *(
+                self._delete_if_expiring(keys=slot_keys, args=[expiry_threshold], client=connection)
+                for connection, slot_keys in self._redis_shards.group_keys_by_slot(keys)
+            )
+        )
+        return [self._keys.get_candidate_id(key.decode()) for deleted in deleted_groups for key in deleted]
+
+    async def migrate_candidates_info(self, candidate_ids: list[str]) -> int:
+        """
+        Re-encodes records of the given candidates with the configured codec and their remaining TTLs, returns the
+        number of rewritten ones. Sessions written in the meantime are newer and left as they are.
+        """
+        infos = await execute_by_connection(
+            self._redis_shards, self._keys, candidate_ids, lambda pipe, key: pipe.hgetall(key),
+        )
+        candidates_info = []
+        for candidate_id, info in infos.items():
+            record = info.get(self._record_field.encode())
+            if not info or (record is not None and get_record_codec_id(record) == self._codec.codec_id):
+                continue
+            candidates_info.append(self._get_candidate_full_info(candidate_id, info))
+        saved_candidates_info, _ = await self._save_candidates_info(candidates_info, keep_ttl=True)
+        return len(saved_candidates_info)
+
+    async def iter_fallback_candidate_ids(self, batch_size: int) -> AsyncIterator[str]:
+        async for candidate_id in iter_candidate_ids(self._fallback_redis_shards, self._fallback_keys, batch_size):
+            yield candidate_id
+
+    async def move_candidates_info_from_fallback(self, candidate_ids: list[str], delete_source: bool = True) -> int:
+        """
+        Copies sessions of the given candidates from the fallback shards to their keys and shards, with their TTLs,
+        and returns the number of the moved ones. Sessions written since the move started are kept as they are newer.
+        """
+        dumps = await execute_by_connection(
+            self._fallback_redis_shards, self._fallback_keys, candidate_ids, lambda pipe, key: pipe.dump(key),
+        )
+        ttls = await execute_by_connection(
+            self._fallback_redis_shards, self._fallback_keys, candidate_ids, lambda pipe, key: pipe.pttl(key),
+        )
+        moved_candidate_ids = [
+            candidate_id for candidate_id in candidate_ids
+            if dumps[candidate_id] is not None and ttls[candidate_id] != -2 and not self._is_in_place(candidate_id)
+        ]
+        candidate_ids_by_key = {self._keys.get_key(candidate_id): candidate_id for candidate_id in moved_candidate_ids}
+
+        async def restore(connection: RedisClient, connection_keys: list[str]):
+            async with connection.pipeline(transaction=False) as pipe:
+                for key in connection_keys:
+                    candidate_id = candidate_ids_by_key[key]
+                    pipe.restore(key, max(ttls[candidate_id], 0), dumps[candidate_id])
+                results = await pipe.execute(raise_on_error=False)
+            for result in results:
+                if isinstance(result, ResponseError) and not str(result).startswith("BUSYKEY"):
+                    raise result
+
+        await asyncio.gather(
+            *(
+                restore(connection, connection_keys)
+                for connection, connection_keys in self._redis_shards.group_keys_by_connection(
+                    list(candidate_ids_by_key),
+                )
+            )
+        )
+        if delete_source and moved_candidate_ids:
+            await execute_by_connection(
+                self._fallback_redis_shards,
+                self._fallback_keys,
+                moved_candidate_ids,
+                lambda pipe, key: pipe.delete(key),
+            )
+        return len(moved_candidate_ids)
+
+    def _is_in_place(self, candidate_id: str) -> bool:
+        key = self._keys.get_key(candidate_id)
+        fallback_key = self._fallback_keys.get_key(candidate_id)
+        return key == fallback_key and (
+            self._redis_shards.get_node_name(key) == self._fallback_redis_shards.get_node_name(fallback_key)
+        )
+
+    async def _save_candidate_info(
+            self,
+            candidate_info: SharedContextCandidateFullInfo,
+    ) -> SharedContextCandidateFullInfo:
+        saved_candidates_info, conflicted_candidate_ids = await self._save_candidates_info([candidate_info])
+        if conflicted_candidate_ids:
+            raise SharedContextConflictError(candidate_info.candidate_id)
+        return saved_candidates_info[0]
+
+    async def _save_candidates_info(
+            self,
+            candidates_info: list[SharedContextCandidateFullInfo],
+            check_revision: bool = True,
+            keep_ttl: bool = False,
+    ) -> tuple[list[SharedContextCandidateFullInfo], list[str]]:
+        """
+        Saves the candidates with new revisions, unless their sessions have changed since they were read. Returns the
+        saved ones, with their new revisions, and the IDs of the conflicted ones.
+        """
+        if not candidates_info:
+            return [], []
+        expected_revisions = {
+            candidate_info.candidate_id: candidate_info.revision if check_revision else ANY_REVISION
+            for candidate_info in candidates_info
+        }
+        candidates_info_by_key = {
+            self._keys.get_key(candidate_info.candidate_id): replace(candidate_info, revision=uuid.uuid4().hex)
+            for candidate_info in candidates_info
+        }
+
+        async def save(connection: RedisClient, slot_keys: list[str]) -> list[bytes]:
+            args = [self._record_field, self._revision_field]
+            for key in slot_keys:
+                candidate_info = candidates_info_by_key[key]
+                args.extend(
+                    [
+                        expected_revisions[candidate_info.candidate_id],
+                        candidate_info.revision,
+                        encode_candidate_info(candidate_info, self._codec),
+                        -1 if keep_ttl else self._get_ttl(candidate_info),
+                    ]
+                )
+            return await self._save_if_unchanged(keys=slot_keys, args=args, client=connection)
+
+        conflicted_groups = await asyncio.gather(
+            *(
+                save(connection, slot_keys)
+                for connection, slot_keys in self._redis_shards.group_keys_by_slot(list(candidates_info_by_key))
+            )
+        )
+        conflicted_keys = {key.decode() for conflicted in conflicted_groups for key in conflicted}
+        return (
+            [candidate_info for key, candidate_info in candidates_info_by_key.items() if key not in conflicted_keys],
+            [candidates_info_by_key[key].candidate_id for key in conflicted_keys],
+        )
+
+    def _get_ttl(self, candidate_info: SharedContextCandidateFullInfo) -> int:
+        return self._evaluated_ttl if candidate_info.scores else self._questions_ttl
+
+    def _merge_scores_and_comments(
+            self,
+            candidate_info: SharedContextCandidateFullInfo,
+            response: str,
+            scores_and_comments: list[ResponseEvaluationAgentResult],
+    ) -> SharedContextCandidateFullInfo:
         scores = []
         comments = []
         for result in scores_and_comments:
             scores.append(result["score"])
             comments.append(result["comment"])
-        await self._redis_connection.hset(
-            candidate_id,
-            mapping={
-                "candidate_response": response,
-                "scores": json.dumps(scores),
-                "response_comments": json.dumps(comments),
-            }
+        return replace(candidate_info, candidate_response=response, scores=scores, response_comments=comments)
+
+
+async def execute_by_connection(
+        redis_shards: RedisShards,
+        keys: CandidateKeys,
+        candidate_ids: list[str],
+        command: Callable[[Pipeline, str], None],
+) -> dict:
+    """Runs the command for the key of every candidate, in one pipeline per connection, and returns the results."""
+    candidate_ids_by_key = {keys.get_key(candidate_id): candidate_id for candidate_id in candidate_ids}
+
+    async def execute(connection: RedisClient, connection_keys: list[str]) -> list:
+        async with connection.pipeline(transaction=False) as pipe:
+            for key in connection_keys:
+                command(pipe, key)
+            return list(zip(connection_keys, await pipe.execute()))
+
+    results = await asyncio.gather(
+        *(
+            execute(connection, connection_keys)
+            for connection, connection_keys in redis_shards.group_keys_by_connection(list(candidate_ids_by_key))
         )
+    )
+    return {candidate_ids_by_key[key]: result for connection_results in results for key, result in connection_results}
+
 
-    async def save_feedback(self, candidate_id: str, feedback: str):
-        await self._redis_connection.hset(candidate_id, "feedback", feedback)
+async def iter_candidate_ids(redis_shards: RedisShards, keys: CandidateKeys, batch_size: int) -> AsyncIterator[str]:
+    for connection in redis_shards.get_scan_connections():
+        async for key in connection.scan_iter(match=keys.scan_match, count=batch_size, _type="hash"):
+            candidate_id = keys.get_candidate_id(key.decode())
+            if candidate_id is not None:
+                yield candidate_id
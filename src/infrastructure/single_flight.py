@@ -0,0 +1,149 @@
+import asyncio
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import redis.asyncio as redis
+from redis.exceptions import LockError
+
+from config import Config
+from infrastructure.llm_scheduler import LLMSchedulerOverloadedError
+from infrastructure.prompts import PromptTooLongError
+from infrastructure.structured_output import StructuredOutputError
+
+
+class SingleFlightLeaderError(Exception):
+    """Error of the leader from another worker which has no matching type in this one."""
+
+
+def dump_error(error: Exception) -> dict:
+    if isinstance(error, LLMSchedulerOverloadedError):
+        return {"type": "LLMSchedulerOverloadedError", "retry_after": error.retry_after}
+    if isinstance(error, StructuredOutputError):
+        return {"type": "StructuredOutputError", "message": str(error)}
+    if isinstance(error, PromptTooLongError):
+        return {"type": "PromptTooLongError", "message": str(error)}
+    return {"type": type(error).__name__, "message": f"{type(error).__name__}: {error}"}
+
+
+def load_error(error: dict) -> Exception:
+    """Rebuilds the error of the leader, so followers fail the same way as its own callers."""
+    if error["type"] == "LLMSchedulerOverloadedError":
+        return LLMSchedulerOverloadedError(error["retry_after"])
+    if error["type"] == "StructuredOutputError":
+        return StructuredOutputError(error["message"])
+    if error["type"] == "PromptTooLongError":
+        return PromptTooLongError(error["message"])
+    return SingleFlightLeaderError(error["message"])
+
+
+@dataclass
+class Flight:
+    future: asyncio.Future
+    speculative: bool
+    waiters: int = 0
+
+
+class SingleFlight:
+    _key_prefix = "single_flight"
+
+    def __init__(self, config: Config, redis_connection: redis.Redis):
+        self._redis_connection = redis_connection
+        self._lock_timeout = int(config.SINGLE_FLIGHT_LOCK_TIMEOUT)
+        self._result_ttl = int(config.SINGLE_FLIGHT_RESULT_TTL)
+        self._in_flight: dict[str, Flight] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], speculative: bool = False) -> Any:
+        """
+        Runs `func` once for all concurrent callers with the same key, across all workers sharing the Redis.
+        The result has to be JSON serializable, so it can be handed over to callers from other workers.
+
+        The call outlives its callers, unless all of them are `speculative`: then it's cancelled once the last one
+        stops waiting, and callers from other workers run `func` themselves instead of waiting for the result.
+        """
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(self._do_distributed(key, func)), speculative)
+            self._in_flight[key] = flight
+            flight.future.add_done_callback(lambda _: self._forget(key, flight))
+        # A request joining a speculative call needs the result, so the call isn't cancelled with the speculation.
+        flight.speculative = flight.speculative and speculative
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.future)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and flight.speculative:
+                flight.future.cancel()
+                # The call ends only once the cancellation is through, callers coming until then start a new one.
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: Flight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    async def _do_distributed(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        lock_key = f"{self._key_prefix}:lock:{key}"
+        lock = self._redis_connection.lock(lock_key, timeout=self._lock_timeout)
+        while True:
+            # Every flight publishes its result under its own token, kept in the lock while the flight runs, so
+            # followers never take the result of an earlier flight of the key.
+            flight_token = uuid.uuid4().hex
+            if await lock.acquire(blocking=False, token=flight_token):
+                try:
+                    return await self._lead(self._get_result_key(key, flight_token), func)
+                finally:
+                    try:
+                        await lock.release()
+                    except LockError:
+                        pass
+            flight_token = await self._redis_connection.get(lock_key)
+            if flight_token is not None:
+                return await self._follow(self._get_result_key(key, flight_token.decode()), func)
+            # The flight ended between the two calls, the next one is led by this caller or joined.
+
+    def _get_result_key(self, key: str, flight_token: str) -> str:
+        return f"{self._key_prefix}:result:{key}:{flight_token}"
+
+    async def _lead(self, result_key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            await self._publish_result(result_key, {"cancelled": True})
+            raise
+        except Exception as e:
+            await self._publish_result(result_key, {"error": dump_error(e)})
+            raise
+        await self._publish_result(result_key, {"result": result})
+        return result
+
+    async def _publish_result(self, result_key: str, payload: dict):
+        data = json.dumps(payload)
+        async with self._redis_connection.pipeline(transaction=True) as pipe:
+            pipe.set(result_key, data, ex=self._result_ttl)
+            pipe.publish(result_key, data)
+            await pipe.execute()
+
+    async def _follow(self, result_key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        pubsub = self._redis_connection.pubsub()
+        await pubsub.subscribe(result_key)
+        try:
+            data = await self._redis_connection.get(result_key)
+            deadline = time.monotonic() + self._lock_timeout
+            while data is None and (timeout := deadline - time.monotonic()) > 0:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+                if message is not None and message["type"] == "message":
+                    data = message["data"]
+        finally:
+            await pubsub.reset()
+        if data is None:
+            return await func()
+        payload = json.loads(data)
+        if payload.get("cancelled"):
+            # Callers of the leader don't need the result anymore, but these ones still do.
+            return await func()
+        if "error" in payload:
+            raise load_error(payload["error"])
+        return payload["result"]
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from config import Config
+from infrastructure.metrics import SPECULATIONS
+from infrastructure.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation:
+    """
+    Starts single flight calls in the background ahead of the requests likely to need their results, which then
+    join the call by its key instead of starting their own. A subject, like a candidate, has at most one speculative
+    call: starting one with a new key cancels the call of the old one, unless a request has joined it. No more than
+    `SPECULATION_CONCURRENCY` speculative calls run in a worker, the rest aren't started at all, so speculation can't
+    crowd out the requests.
+    """
+
+    def __init__(self, config: Config, single_flight: SingleFlight):
+        self._concurrency = int(config.SPECULATION_CONCURRENCY)
+        self._single_flight = single_flight
+        self._tasks: dict[str, tuple[str, asyncio.Task]] = {}
+
+    def start(self, subject: str, key: str, func: Callable[[], Awaitable[Any]]):
+        speculation = self._tasks.get(subject)
+        if speculation is not None:
+            if speculation[0] == key:
+                return
+            self._cancel(subject)
+        if len(self._tasks) >= self._concurrency:
+            SPECULATIONS.labels("skipped").inc()
+            return
+        task = asyncio.create_task(self._single_flight.do(key, func, speculative=True))
+        self._tasks[subject] = (key, task)
+        task.add_done_callback(lambda _: self._forget(subject, task))
+        SPECULATIONS.labels("started").inc()
+
+    def is_running(self, key: str) -> bool:
+        return any(running_key == key for running_key, _ in self._tasks.values())
+
+    async def close(self):
+        tasks = [task for _, task in self._tasks.values()]
+        for subject in list(self._tasks):
+            self._cancel(subject)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _cancel(self, subject: str):
+        key, task = self._tasks.pop(subject)
+        # The single flight call is cancelled with its last speculative caller, a request waiting for it keeps it.
+        task.cancel()
+        SPECULATIONS.labels("cancelled").inc()
+
+    def _forget(self, subject: str, task: asyncio.Task):
+        speculation = self._tasks.get(subject)
+        if speculation is not None and speculation[1] is task:
+            del self._tasks[subject]
+        if not task.cancelled() and task.exception() is not None:
+            SPECULATIONS.labels("failed").inc()
+            logger.warning("Speculative call failed: %r", task.exception())
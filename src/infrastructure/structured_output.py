@@ -0,0 +1,98 @@
+from typing import Any
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+
+class StructuredOutputError(Exception):
+    """Output of an LLM is not JSON of the expected shape, even after the repair."""
+
+
+def strip_code_fences(content: str) -> str:
+    content = content.strip()
+    if content.startswith("```"):
+        # The opening fence may carry a language, like "```json".
+        _, _, content = content.partition("\n")
+        content = content.rstrip()
+        if content.endswith("```"):
+            content = content[:-3]
+    return content.strip()
+
+
+def repair_json(content: str) -> str:
+    """
+    Cheap fixes of the usual breakages of LLM JSON output: code fences and prose around the value are dropped,
+    and a value cut off by the tokens limit is closed, as is or after its last complete item.
+    """
+    content = strip_code_fences(content)
+    starts = [start for start in (content.find("{"), content.find("[")) if start != -1]
+    if not starts:
+        return content
+    content = content[min(starts):]
+    containers = []
+    in_string = False
+    escaped = False
+    last_safe_end = None
+    last_safe_containers = ()
+    for position, char in enumerate(content):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "[{":
+            containers.append(char)
+        elif char in "]}" and containers:
+            containers.pop()
+            if not containers:
+                return content[:position + 1]
+            last_safe_end, last_safe_containers = position + 1, tuple(containers)
+        elif char == ",":
+            last_safe_end, last_safe_containers = position, tuple(containers)
+    closed = content + '"' if in_string else content
+    closed = closed.rstrip().removesuffix(",") + _get_closing_brackets(containers)
+    if last_safe_end is None or _is_json(closed):
+        return closed
+    return content[:last_safe_end] + _get_closing_brackets(last_safe_containers)
+
+
+def parse_structured_output(content: str, adapter: TypeAdapter) -> tuple[Any, bool]:
+    """Returns the output validated by the adapter and whether it had to be repaired for that."""
+    try:
+        return adapter.validate_python(orjson.loads(content)), False
+    except (orjson.JSONDecodeError, ValidationError) as e:
+        error = e
+    repaired = repair_json(content)
+    if repaired != content:
+        try:
+            return adapter.validate_python(orjson.loads(repaired)), True
+        except (orjson.JSONDecodeError, ValidationError) as e:
+            error = e
+    raise StructuredOutputError(_format_error(error))
+
+
+def _get_closing_brackets(containers: list[str] | tuple[str, ...]) -> str:
+    return "".join("]" if container == "[" else "}" for container in reversed(containers))
+
+
+def _is_json(content: str) -> bool:
+    try:
+        orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return False
+    return True
+
+
+def _format_error(error: orjson.JSONDecodeError | ValidationError) -> str:
+    if isinstance(error, orjson.JSONDecodeError):
+        return f"Invalid JSON: {error}"
+    # Only the first errors, they go into the re-ask prompt and a broken output may have one per item.
+    return "; ".join(
+        f"{'.'.join(str(location) for location in error['loc']) or 'output'}: {error['msg']}"
+        for error in error.errors()[:3]
+    )
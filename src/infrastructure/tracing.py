@@ -0,0 +1,215 @@
+import asyncio
+import collections
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_PATTERN = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """Span with the fields of the OTLP JSON encoding, exported once it ends if its trace is sampled."""
+
+    __slots__ = (
+        "tracer", "trace_id", "span_id", "parent_span_id", "name", "sampled", "attributes", "events", "status",
+        "start_time_ns", "end_time_ns", "_token",
+    )
+
+    def __init__(
+            self,
+            tracer: "Tracer",
+            name: str,
+            parent: "Span | None",
+            attributes: dict,
+            trace_id: str | None = None,
+    ):
+        self.tracer = tracer
+        self.trace_id = trace_id or (parent.trace_id if parent is not None else os.urandom(16).hex())
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.sampled = parent.sampled if parent is not None else random.random() < tracer.sample_rate
+        self.attributes = attributes
+        self.events = []
+        self.status = "OK"
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: dict | None = None):
+        self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes or {}})
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, (GeneratorExit, asyncio.CancelledError)):
+            self.status = "ERROR"
+            self.add_event("exception", {"exception.type": exc_type.__name__, "exception.message": str(exc)})
+        self.end_time_ns = time.time_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Async generators may be finished from another context than the one they were started in.
+            pass
+        if self.sampled:
+            self.tracer.exporter.export(self)
+
+    def to_otlp(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_time_ns,
+            "endTimeUnixNano": self.end_time_ns,
+            "attributes": [{"key": key, "value": value} for key, value in self.attributes.items()],
+            "events": self.events,
+            "status": {"code": self.status},
+        }
+
+
+class BatchSpanExporter:
+    """
+    Keeps ended spans in a bounded in-memory queue and writes them as OTLP JSON lines from a background task,
+    so ending a span never waits for I/O. Spans are dropped when the queue is full.
+    """
+
+    def __init__(self, path: str, max_queue_size: int, batch_size: int, interval: float):
+        self._path = path
+        self._max_queue_size = max_queue_size
+        self._batch_size = batch_size
+        self._interval = interval
+        self._queue: collections.deque[Span] = collections.deque()
+        self._batch_ready = asyncio.Event()
+        self.dropped = 0
+
+    def export(self, span: Span):
+        if len(self._queue) >= self._max_queue_size:
+            self.dropped += 1
+            return
+        self._queue.append(span)
+        if len(self._queue) >= self._batch_size:
+            self._batch_ready.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to export spans")
+
+    async def flush(self):
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self._batch_size, len(self._queue)))]
+            lines = "".join(json.dumps(span.to_otlp()) + "\n" for span in batch)
+            await asyncio.to_thread(self._write, lines)
+
+    def _write(self, lines: str):
+        with open(self._path, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+
+class NoopSpanExporter:
+    def export(self, span: Span):
+        pass
+
+
+class Tracer:
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.exporter: BatchSpanExporter | NoopSpanExporter = NoopSpanExporter()
+
+    def configure(self, sample_rate: float, exporter: BatchSpanExporter):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def start_span(self, name: str, traceparent: str | None = None, **attributes) -> Span:
+        """Starts a child of the current span, or a root span continuing the W3C `traceparent` when it is given."""
+        parent = _current_span.get()
+        if parent is None and traceparent and (match := TRACEPARENT_PATTERN.fullmatch(traceparent)):
+            span = Span(self, name, None, attributes, trace_id=match.group(1))
+            span.parent_span_id = match.group(2)
+            span.sampled = match.group(3) == "01"
+            return span
+        return Span(self, name, parent, attributes)
+
+
+tracer = Tracer()
+
+
+def get_current_span() -> Span | None:
+    return _current_span.get()
+
+
+def get_current_trace_id() -> str | None:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def trace_async_methods(instance: Any, component: str) -> Any:
+    """Wraps public coroutine methods of the instance into child spans named `<component>.<method>`."""
+    for name, method in inspect.getmembers(instance, inspect.iscoroutinefunction):
+        if not name.startswith("_"):
+            setattr(instance, name, _get_traced_method(method, f"{component}.{name}"))
+    return instance
+
+
+def _get_traced_method(method, span_name: str):
+    @functools.wraps(method)
+    async def traced_method(*args, **kwargs):
+        # Calls outside of a traced request, like background workers, don't start traces of their own.
+        if _current_span.get() is None:
+            return await method(*args, **kwargs)
+        with tracer.start_span(span_name):
+            return await method(*args, **kwargs)
+
+    return traced_method
+
+
+class TracingMiddleware:
+    """Plain ASGI middleware starting the root span of every request, named after the matched route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        traceparent = next((value.decode() for key, value in scope["headers"] if key == b"traceparent"), None)
+        with tracer.start_span(scope["method"], traceparent, **{"http.method": scope["method"]}) as span:
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "ERROR"
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set_attribute("http.route", route.path)
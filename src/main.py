@@ -1,18 +1,133 @@
+import asyncio
+import contextlib
+import logging
 from typing import Callable
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
-from api.handlers import router as handlers_router
+from api.handlers import metrics_router, router as handlers_router
 from config import Config
-from dependencies import DependenciesOverrides
+from dependencies import Container, DependenciesOverrides
+from infrastructure.connection_pools import ConnectionPools
+from infrastructure.files_storage import FilesStorage
+from infrastructure.jobs import CallbackURLNotAllowedError
+from infrastructure.llm_scheduler import LLMSchedulerOverloadedError
+from infrastructure.metrics import MetricsMiddleware
+from infrastructure.persistence_queue import PersistenceQueue
+from infrastructure.prompts import PromptTooLongError
+from infrastructure.questions_cache import QuestionsCache
+from infrastructure.session_archive import SessionArchive
+from infrastructure.session_reaper import SessionReaper
+from infrastructure.shared_context import SharedContextConflictError
+from infrastructure.speculation import Speculation
+from infrastructure.structured_output import StructuredOutputError
+from infrastructure.tracing import BatchSpanExporter, TracingMiddleware, tracer
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(application: FastAPI):
+    # Overrides installed before the startup, like test fakes, take part in the resolved graph.
+    providers = dict(application.dependency_overrides)
+    container = Container(providers)
+    container.resolve_all()
+    application.dependency_overrides.update(container.get_dependency_overrides())
+    config = container.resolve(Config)
+    files_storage = container.resolve(FilesStorage)
+    try:
+        await files_storage.ensure_buckets(
+            [
+                config.PERSISTENT_DATA_BUCKET_NAME,
+                config.LOGS_BUCKET_NAME,
+                config.BATCH_JOBS_BUCKET_NAME,
+                config.SESSION_ARCHIVE_BUCKET_NAME,
+            ],
+        )
+    except Exception:
+        # Buckets are ensured again on the first upload, so an unavailable storage doesn't block the startup.
+        logger.exception("Failed to ensure files storage buckets")
+    connection_pools = container.resolve(ConnectionPools)
+    warm_up_task = asyncio.create_task(connection_pools.warm_up())
+    background_tasks = [warm_up_task]
+    done, _ = await asyncio.wait([warm_up_task], timeout=float(config.CONNECTION_POOLS_WARM_UP_TIMEOUT))
+    if not done:
+        # The worker starts anyway, readiness stays red while the warm up keeps retrying in the background.
+        logger.warning("Connection pools aren't warm yet: %s", connection_pools.get_status())
+    questions_cache = container.resolve(QuestionsCache)
+    background_tasks.append(asyncio.create_task(questions_cache.run()))
+    if config.TRACING_ENABLED:
+        span_exporter = BatchSpanExporter(
+            config.TRACING_EXPORT_PATH,
+            int(config.TRACING_EXPORT_MAX_QUEUE_SIZE),
+            int(config.TRACING_EXPORT_BATCH_SIZE),
+            float(config.TRACING_EXPORT_INTERVAL),
+        )
+        tracer.configure(float(config.TRACING_SAMPLE_RATE), span_exporter)
+        background_tasks.append(asyncio.create_task(span_exporter.run()))
+    if config.SESSION_REAPER_ENABLED:
+        session_reaper = container.resolve(SessionReaper)
+        background_tasks.append(asyncio.create_task(session_reaper.run()))
+    if config.SESSION_ARCHIVE_ENABLED:
+        session_archive = container.resolve(SessionArchive)
+        background_tasks.append(asyncio.create_task(session_archive.run()))
+    if config.PERSISTENCE_WRITE_BEHIND:
+        persistence_queue = container.resolve(PersistenceQueue)
+        background_tasks.append(asyncio.create_task(persistence_queue.run_worker()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await container.resolve(Speculation).close()
+    await questions_cache.flush()
+    if config.PERSISTENCE_WRITE_BEHIND:
+        await persistence_queue.flush()
+    if config.TRACING_ENABLED:
+        await span_exporter.flush()
+    await connection_pools.close()
+    application.dependency_overrides.update(providers)
+
+
+async def llm_scheduler_overloaded_handler(request: Request, exc: LLMSchedulerOverloadedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(int(exc.retry_after), 1))},
+    )
+
+
+async def structured_output_error_handler(request: Request, exc: StructuredOutputError) -> JSONResponse:
+    # The upstream LLM replied with an unusable output even after the repair and the re-ask.
+    return JSONResponse(status_code=502, content={"detail": f"Invalid LLM output: {exc}"})
+
+
+async def prompt_too_long_handler(request: Request, exc: PromptTooLongError) -> JSONResponse:
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+async def callback_url_not_allowed_handler(request: Request, exc: CallbackURLNotAllowedError) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+async def shared_context_conflict_handler(request: Request, exc: SharedContextConflictError) -> JSONResponse:
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 
 def create_application(dependency_overrides_factory: Callable, config: Config) -> FastAPI:
-    application = FastAPI()
+    application = FastAPI(lifespan=lifespan)
 
     application.dependency_overrides = dependency_overrides_factory(config)
 
     application.include_router(handlers_router, prefix="/api/v1")
+    application.include_router(metrics_router)
+    application.add_middleware(MetricsMiddleware)
+    application.add_middleware(TracingMiddleware)
+    application.add_exception_handler(LLMSchedulerOverloadedError, llm_scheduler_overloaded_handler)
+    application.add_exception_handler(StructuredOutputError, structured_output_error_handler)
+    application.add_exception_handler(SharedContextConflictError, shared_context_conflict_handler)
+    application.add_exception_handler(PromptTooLongError, prompt_too_long_handler)
+    application.add_exception_handler(CallbackURLNotAllowedError, callback_url_not_allowed_handler)
 
     return application
 
@@ -1,30 +1,93 @@
+import asyncio
 import hashlib
 import io
 import json
+import time
+import uuid
 import zoneinfo
 from dataclasses import asdict
 from datetime import datetime
+from typing import AsyncIterator
 
-from infrastructure.agents import GenerateQuestionsAgent, ResponseEvaluationAgent, ValidationAgent
+from infrastructure.agents import GenerateQuestionsAgent, ResponseEvaluationAgent, ValidationAgent, check_scores
 from config import Config
-from dto import GeneratedQuestionsResult, ResponseEvaluationAgentResult, SharedContextCandidateFullInfo
+from dto import (
+    BatchEvaluationResult, BatchJob, GeneratedQuestionsResult, Job, ResponseEvaluationAgentResult,
+    SharedContextCandidateFullInfo, StorageObject, StreamEvent, ValidationAgentResult,
+)
+from infrastructure.batch_jobs import BATCH_FINAL_STATUSES, BatchClient, BatchJobsRegistry
+from infrastructure.evaluation_cache import EvaluationCache
 from infrastructure.files_storage import FilesStorage
+from infrastructure.jobs import JobQueue
+from infrastructure.json_stream import JSONArrayItemsParser
+from infrastructure.persistence_queue import PersistenceQueue
+from infrastructure.prompts import PromptTooLongError
+from infrastructure.questions_cache import QuestionsCache, normalize_job_title
+from infrastructure.session_archive import SessionArchive
 from infrastructure.shared_context import SharedContext
+from infrastructure.single_flight import SingleFlight
+from infrastructure.speculation import Speculation
+from infrastructure.structured_output import StructuredOutputError
+from infrastructure.tracing import get_current_trace_id
 
 
 class GenerateQuestionsService:
-    def __init__(self, shared_context: SharedContext, generate_questions_agent: GenerateQuestionsAgent):
+    def __init__(
+            self,
+            shared_context: SharedContext,
+            generate_questions_agent: GenerateQuestionsAgent,
+            questions_cache: QuestionsCache,
+            single_flight: SingleFlight,
+    ):
         self._agent = generate_questions_agent
         self._shared_context = shared_context
+        self._questions_cache = questions_cache
+        self._single_flight = single_flight
 
     async def generate_questions(self, first_name: str, second_name: str, job_title: str) -> GeneratedQuestionsResult:
         candidate_id = self._get_candidate_id(first_name, second_name, job_title)
-        generated_questions = await self._agent.generate_questions(job_title)
+        generated_questions = await self._questions_cache.get(job_title)
+        if generated_questions is None:
+            generated_questions = await self._generate_questions(job_title)
         await self._shared_context.save_candidate_info_and_questions(
             candidate_id, first_name, second_name, job_title, generated_questions,
         )
         return GeneratedQuestionsResult(candidate_id=candidate_id, questions=generated_questions)
 
+    async def stream_questions(self, first_name: str, second_name: str, job_title: str) -> AsyncIterator[StreamEvent]:
+        # Not coalesced by the single flight, every caller streams its own completion, which adds its own question set.
+        candidate_id = self._get_candidate_id(first_name, second_name, job_title)
+        generated_questions = await self._questions_cache.get(job_title)
+        if generated_questions is None:
+            parser = JSONArrayItemsParser(items_depth=2)
+            async for chunk in self._agent.stream_questions(job_title):
+                for question in parser.feed(chunk):
+                    yield StreamEvent(event="question", data=question)
+            generated_questions = self._agent.parse_questions(parser.text)
+            await self._questions_cache.save(job_title, generated_questions)
+        else:
+            for question in generated_questions:
+                yield StreamEvent(event="question", data=question)
+        await self._shared_context.save_candidate_info_and_questions(
+            candidate_id, first_name, second_name, job_title, generated_questions,
+        )
+        yield StreamEvent(
+            event="result",
+            data=GeneratedQuestionsResult(candidate_id=candidate_id, questions=generated_questions),
+        )
+
+    async def _generate_questions(self, job_title: str) -> list[str]:
+        # Only the leader of the flight saves the set and counts the miss, the callers joining it share that one set.
+        return await self._single_flight.do(
+            f"generate_questions:{normalize_job_title(job_title)}",
+            lambda: self._generate_and_cache_questions(job_title),
+        )
+
+    async def _generate_and_cache_questions(self, job_title: str) -> list[str]:
+        questions = await self._agent.generate_questions(job_title)
+        await self._questions_cache.save(job_title, questions)
+        return questions
+
     def _get_candidate_id(self, first_name: str, second_name: str, job_title: str) -> str:
         encoded_str = f"{first_name}_{second_name}_{job_title}".encode("utf-8")
         hash_obj = hashlib.sha256(encoded_str)
@@ -32,16 +95,151 @@ class GenerateQuestionsService:
 
 
 class EvaluateResponsesService:
-    def __init__(self, shared_context: SharedContext, evaluate_responses_agent: ResponseEvaluationAgent):
+    def __init__(
+            self,
+            config: Config,
+            shared_context: SharedContext,
+            evaluate_responses_agent: ResponseEvaluationAgent,
+            single_flight: SingleFlight,
+            evaluation_cache: EvaluationCache,
+            validation_service: "ValidationService",
+    ):
+        self._config = config
         self._agent = evaluate_responses_agent
         self._shared_context = shared_context
+        self._single_flight = single_flight
+        self._evaluation_cache = evaluation_cache
+        self._validation_service = validation_service
 
     async def evaluate_response(self, candidate_id: str, response: str) -> list[ResponseEvaluationAgentResult]:
         candidate_info = await self._shared_context.get_full_candidate_info(candidate_id)
-        result = await self._agent.evaluate_response(candidate_info.job_title, candidate_info.questions, response)
-        await self._shared_context.save_response_scores_and_comments(candidate_id, response, result)
+        cache_key = self._agent.get_cache_key(candidate_info.job_title, candidate_info.questions, response)
+        result = await self._evaluation_cache.get_or_evaluate(
+            self._agent.name,
+            cache_key,
+            lambda: self._single_flight.do(
+                self._shared_context.get_candidate_key(candidate_id, f"evaluate_response:{cache_key}"),
+                lambda: self._agent.evaluate_response(candidate_info.job_title, candidate_info.questions, response),
+            ),
+        )
+        candidate_info = await self._shared_context.save_response_scores_and_comments(
+            candidate_info, response, result,
+        )
+        self._validation_service.speculate(candidate_info)
         return result
 
+    async def stream_evaluation(self, candidate_id: str, response: str) -> AsyncIterator[StreamEvent]:
+        candidate_info = await self._shared_context.get_full_candidate_info(candidate_id)
+        cache_key = self._agent.get_cache_key(candidate_info.job_title, candidate_info.questions, response)
+        result = await self._evaluation_cache.get(self._agent.name, cache_key)
+        if result is None:
+            parser = JSONArrayItemsParser(items_depth=2)
+            chunks = self._agent.stream_evaluation(candidate_info.job_title, candidate_info.questions, response)
+            async for chunk in chunks:
+                for score_and_comment in parser.feed(chunk):
+                    yield StreamEvent(event="score", data=score_and_comment)
+            result = self._agent.parse_evaluation(parser.text, len(candidate_info.questions))
+            await self._evaluation_cache.save(cache_key, result)
+        else:
+            for score_and_comment in result:
+                yield StreamEvent(event="score", data=score_and_comment)
+        candidate_info = await self._shared_context.save_response_scores_and_comments(
+            candidate_info, response, result,
+        )
+        self._validation_service.speculate(candidate_info)
+        yield StreamEvent(event="result", data=result)
+
+    async def evaluate_responses_batch(self, candidate_ids: list[str]) -> list[BatchEvaluationResult]:
+        candidate_ids = list(dict.fromkeys(candidate_ids))
+        results = {}
+        candidates_to_evaluate = []
+        token_budget = int(self._config.BATCH_EVALUATION_TOKEN_BUDGET)
+        for candidate_info in await self._shared_context.get_full_candidates_info(candidate_ids):
+            if not candidate_info.questions:
+                results[candidate_info.candidate_id] = BatchEvaluationResult(
+                    candidate_id=candidate_info.candidate_id, error="Candidate not found",
+                )
+            elif not candidate_info.candidate_response:
+                results[candidate_info.candidate_id] = BatchEvaluationResult(
+                    candidate_id=candidate_info.candidate_id, error="Candidate has no response to evaluate",
+                )
+            else:
+                try:
+                    prompt = self._agent.get_batch_item_prompt(candidate_info, token_budget)
+                except PromptTooLongError:
+                    results[candidate_info.candidate_id] = BatchEvaluationResult(
+                        candidate_id=candidate_info.candidate_id, error="Candidate prompt is over the token budget",
+                    )
+                else:
+                    candidates_to_evaluate.append((candidate_info, prompt, self._agent.count_tokens(prompt)))
+        semaphore = asyncio.Semaphore(int(self._config.BATCH_EVALUATION_CONCURRENCY))
+        chunks_results = await asyncio.gather(
+            *(self._evaluate_chunk(chunk, semaphore) for chunk in self._pack_into_chunks(candidates_to_evaluate)),
+        )
+        candidates_scores_and_comments = []
+        for chunk, chunk_results in chunks_results:
+            for candidate_info, result in zip(chunk, chunk_results):
+                results[candidate_info.candidate_id] = result
+                if result.error is None:
+                    candidates_scores_and_comments.append((candidate_info, result.scores))
+        conflicted_candidate_ids = await self._shared_context.save_many_responses_scores_and_comments(
+            candidates_scores_and_comments,
+        )
+        for candidate_id in conflicted_candidate_ids:
+            results[candidate_id] = BatchEvaluationResult(
+                candidate_id=candidate_id, error="Candidate session changed during the evaluation",
+            )
+        return [results[candidate_id] for candidate_id in candidate_ids]
+
+    def _pack_into_chunks(
+            self,
+            candidates_info: list[tuple[SharedContextCandidateFullInfo, str, int]],
+    ) -> list[list[tuple[SharedContextCandidateFullInfo, str]]]:
+        """Packs the candidates with their prompts and prompt tokens into chunks under the batch token budget."""
+        # Every prompt fits a chunk alone, it's truncated to the budget left by the system prompt of the batch.
+        token_budget = int(self._config.BATCH_EVALUATION_TOKEN_BUDGET) - self._agent.count_batch_fixed_tokens()
+        chunks = []
+        chunk = []
+        chunk_tokens = 0
+        for candidate_info, prompt, tokens in candidates_info:
+            if chunk and chunk_tokens + tokens > token_budget:
+                chunks.append(chunk)
+                chunk = []
+                chunk_tokens = 0
+            chunk.append((candidate_info, prompt))
+            chunk_tokens += tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def _evaluate_chunk(
+            self,
+            chunk: list[tuple[SharedContextCandidateFullInfo, str]],
+            semaphore: asyncio.Semaphore,
+    ) -> tuple[list[SharedContextCandidateFullInfo], list[BatchEvaluationResult]]:
+        candidates_info = [candidate_info for candidate_info, _ in chunk]
+        async with semaphore:
+            try:
+                chunk_result = await self._agent.evaluate_responses_batch([prompt for _, prompt in chunk])
+            except Exception as e:
+                error = f"Evaluation failed: {type(e).__name__}"
+                return candidates_info, [
+                    BatchEvaluationResult(candidate_id=info.candidate_id, error=error) for info in candidates_info
+                ]
+        results = []
+        for candidate_info in candidates_info:
+            scores = chunk_result.get(candidate_info.candidate_id)
+            try:
+                # Checked per candidate like the output of a single evaluation, a missing candidate has no scores.
+                check_scores(scores or [], len(candidate_info.questions))
+            except StructuredOutputError:
+                results.append(
+                    BatchEvaluationResult(candidate_id=candidate_info.candidate_id, error="Invalid evaluation result"),
+                )
+            else:
+                results.append(BatchEvaluationResult(candidate_id=candidate_info.candidate_id, scores=scores))
+        return candidates_info, results
+
 
 class ValidationService:
     def __init__(
@@ -50,68 +248,355 @@ class ValidationService:
             shared_context: SharedContext,
             validation_agent: ValidationAgent,
             files_storage_client: FilesStorage,
+            single_flight: SingleFlight,
+            persistence_queue: PersistenceQueue,
+            session_archive: SessionArchive,
+            evaluation_cache: EvaluationCache,
+            speculation: Speculation,
     ):
         self._config = config
         self._agent = validation_agent
         self._shared_context = shared_context
         self._files_storage = files_storage_client
+        self._single_flight = single_flight
+        self._persistence_queue = persistence_queue
+        self._session_archive = session_archive
+        self._evaluation_cache = evaluation_cache
+        self._speculation = speculation
 
     async def validate(self, candidate_id: str) -> SharedContextCandidateFullInfo:
         candidate_info = await self._shared_context.get_full_candidate_info(candidate_id)
-        result = await self._agent.validate_scores(
-            candidate_info.job_title, candidate_info.questions, candidate_info.candidate_response,
-            candidate_info.scores, candidate_info.response_comments,
-        )
-        await self._shared_context.save_response_scores_and_comments(
-            candidate_id, candidate_info.candidate_response, result["scores"],
+        cache_key = self._get_cache_key(candidate_info)
+        result = await self._evaluation_cache.get(self._agent.name, cache_key)
+        if result is None:
+            # Joins the speculative validation of the same scores if it's still running.
+            result = await self._single_flight.do(
+                self._get_flight_key(candidate_info, cache_key),
+                lambda: self._validate_scores(candidate_info, cache_key),
+            )
+        return await self.complete_validation(candidate_id, candidate_info, result)
+
+    def speculate(self, candidate_info: SharedContextCandidateFullInfo):
+        """
+        Validates freshly evaluated scores in the background and stages the result in the evaluation cache, so the
+        validation request finds it ready. Scores of a resubmitted response cancel the validation of the old ones.
+        """
+        if not self._config.SPECULATIVE_VALIDATION_ENABLED:
+            return
+        cache_key = self._get_cache_key(candidate_info)
+        self._speculation.start(
+            candidate_info.candidate_id,
+            self._get_flight_key(candidate_info, cache_key),
+            lambda: self._speculate_validation(candidate_info, cache_key),
         )
-        await self._shared_context.save_feedback(candidate_id, result["feedback"])
+
+    async def stream_validation(self, candidate_id: str) -> AsyncIterator[StreamEvent]:
         candidate_info = await self._shared_context.get_full_candidate_info(candidate_id)
+        cache_key = self._get_cache_key(candidate_info)
+        result = await self._evaluation_cache.get(self._agent.name, cache_key)
+        flight_key = self._get_flight_key(candidate_info, cache_key)
+        if result is None and self._speculation.is_running(flight_key):
+            # Waiting for the speculative validation is cheaper than streaming another one.
+            result = await self._single_flight.do(flight_key, lambda: self._validate_scores(candidate_info, cache_key))
+        if result is None:
+            parser = JSONArrayItemsParser(items_depth=2)
+            chunks = self._agent.stream_validation(
+                candidate_info.job_title, candidate_info.questions, candidate_info.candidate_response,
+                candidate_info.scores, candidate_info.response_comments,
+            )
+            async for chunk in chunks:
+                for score_and_comment in parser.feed(chunk):
+                    yield StreamEvent(event="score", data=score_and_comment)
+            result = self._agent.parse_validation(parser.text, len(candidate_info.questions))
+            await self._evaluation_cache.save(cache_key, result)
+        else:
+            for score_and_comment in result["scores"]:
+                yield StreamEvent(event="score", data=score_and_comment)
+        candidate_info = await self.complete_validation(candidate_id, candidate_info, result)
+        yield StreamEvent(event="result", data=candidate_info)
+
+    async def complete_validation(
+            self,
+            candidate_id: str,
+            candidate_info: SharedContextCandidateFullInfo,
+            result: ValidationAgentResult,
+    ) -> SharedContextCandidateFullInfo:
+        candidate_info = await self._shared_context.save_validation_result(candidate_info, result)
         current_datetime = datetime.now().astimezone(zoneinfo.ZoneInfo("UTC"))
-        persistent_storage_candidate_info_url = await self._save_candidate_info_to_persistent_storage(
-            candidate_info, current_datetime,
+        candidate_info_object = self._get_candidate_info_object(candidate_info, current_datetime)
+        # The URL is presigned locally, so the session log doesn't have to wait for the candidate info upload.
+        session_log_object = self._get_session_log_object(
+            candidate_info,
+            current_datetime,
+            self._files_storage.get_object_url(candidate_info_object.bucket_name, candidate_info_object.object_name),
         )
-        await self._save_session_log(candidate_info, current_datetime, persistent_storage_candidate_info_url)
+        if self._config.PERSISTENCE_WRITE_BEHIND:
+            await self._persistence_queue.enqueue([candidate_info_object, session_log_object])
+        else:
+            await self._files_storage.put_objects([candidate_info_object, session_log_object])
+        if self._config.SESSION_ARCHIVE_ENABLED:
+            await self._session_archive.append(candidate_info, current_datetime)
         await self._shared_context.delete_candidate_info(candidate_id)
         return candidate_info
 
-    async def _save_candidate_info_to_persistent_storage(
+    async def _validate_scores(
+            self,
+            candidate_info: SharedContextCandidateFullInfo,
+            cache_key: str,
+    ) -> ValidationAgentResult:
+        result = await self._agent.validate_scores(
+            candidate_info.job_title, candidate_info.questions, candidate_info.candidate_response,
+            candidate_info.scores, candidate_info.response_comments,
+        )
+        await self._evaluation_cache.save(cache_key, result)
+        return result
+
+    async def _speculate_validation(
+            self,
+            candidate_info: SharedContextCandidateFullInfo,
+            cache_key: str,
+    ) -> ValidationAgentResult:
+        result = await self._evaluation_cache.get(self._agent.name, cache_key)
+        if result is None:
+            result = await self._validate_scores(candidate_info, cache_key)
+        return result
+
+    def _get_flight_key(self, candidate_info: SharedContextCandidateFullInfo, cache_key: str) -> str:
+        # Next to the session, so the flight of a speculative validation lands on the slot of the candidate.
+        return self._shared_context.get_candidate_key(candidate_info.candidate_id, f"validate_scores:{cache_key}")
+
+    def _get_cache_key(self, candidate_info: SharedContextCandidateFullInfo) -> str:
+        return self._agent.get_cache_key(
+            candidate_info.job_title, candidate_info.questions, candidate_info.candidate_response,
+            candidate_info.scores, candidate_info.response_comments,
+        )
+
+    def _get_candidate_info_object(
             self,
             candidate_info: SharedContextCandidateFullInfo,
             current_datetime: datetime,
-    ) -> str:
-        filename = f"{candidate_info.candidate_id}_{current_datetime.timestamp()}.json"
-        json_data = json.dumps(asdict(candidate_info), indent=4).encode("utf-8")
-        json_length = len(json_data)
-        json_file = io.BytesIO(json_data)
-        return await self._files_storage.put_object(
+    ) -> StorageObject:
+        return StorageObject(
             bucket_name=self._config.PERSISTENT_DATA_BUCKET_NAME,
-            object_name=filename,
-            data=json_file,
-            length=json_length,
+            object_name=f"{candidate_info.candidate_id}_{current_datetime.timestamp()}.json",
+            data=json.dumps(candidate_info.to_record(), indent=4).encode("utf-8"),
             content_type="application/json",
         )
 
-    async def _save_session_log(
+    def _get_session_log_object(
             self,
             candidate_info: SharedContextCandidateFullInfo,
             current_datetime: datetime,
             persistent_storage_candidate_info_url: str,
-    ):
-        filename = f"{candidate_info.candidate_id}_{current_datetime.timestamp()}.json"
+    ) -> StorageObject:
         data = {
             "candidate_id": candidate_info.candidate_id,
             "job_title": candidate_info.job_title,
             "timestamp": current_datetime.timestamp(),
             "url": persistent_storage_candidate_info_url,
+            "trace_id": get_current_trace_id(),
         }
-        json_data = json.dumps(data, indent=4).encode("utf-8")
-        json_length = len(json_data)
-        json_file = io.BytesIO(json_data)
-        await self._files_storage.put_object(
+        return StorageObject(
             bucket_name=self._config.LOGS_BUCKET_NAME,
-            object_name=filename,
-            data=json_file,
-            length=json_length,
+            object_name=f"{candidate_info.candidate_id}_{current_datetime.timestamp()}.json",
+            data=json.dumps(data, indent=4).encode("utf-8"),
             content_type="application/json",
         )
+
+
+class BatchJobsService:
+    EVALUATION = "evaluation"
+    VALIDATION = "validation"
+
+    def __init__(
+            self,
+            config: Config,
+            shared_context: SharedContext,
+            files_storage_client: FilesStorage,
+            batch_client: BatchClient,
+            batch_jobs_registry: BatchJobsRegistry,
+            evaluate_responses_agent: ResponseEvaluationAgent,
+            validation_agent: ValidationAgent,
+            validation_service: ValidationService,
+    ):
+        self._config = config
+        self._shared_context = shared_context
+        self._files_storage = files_storage_client
+        self._batch_client = batch_client
+        self._registry = batch_jobs_registry
+        self._evaluation_agent = evaluate_responses_agent
+        self._validation_agent = validation_agent
+        self._validation_service = validation_service
+
+    async def create_job(self, kind: str, candidate_ids: list[str]) -> BatchJob:
+        candidate_ids = list(dict.fromkeys(candidate_ids))
+        job_id = uuid.uuid4().hex
+        requests = []
+        failed_candidate_ids = []
+        for candidate_info in await self._shared_context.get_full_candidates_info(candidate_ids):
+            if not self._is_ready_for_job(kind, candidate_info):
+                failed_candidate_ids.append(candidate_info.candidate_id)
+                continue
+            agent = self._evaluation_agent if kind == self.EVALUATION else self._validation_agent
+            try:
+                body = agent.get_batch_request_body(candidate_info)
+            except PromptTooLongError:
+                failed_candidate_ids.append(candidate_info.candidate_id)
+                continue
+            requests.append(
+                {
+                    "custom_id": candidate_info.candidate_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                }
+            )
+        job = BatchJob(
+            job_id=job_id,
+            kind=kind,
+            batch_id="",
+            status="completed",
+            candidate_ids=candidate_ids,
+            failed_candidate_ids=failed_candidate_ids,
+            created_at=time.time(),
+        )
+        if requests:
+            input_object_name = f"{job_id}/input.jsonl"
+            data = "\n".join(json.dumps(request) for request in requests).encode("utf-8")
+            await self._files_storage.put_object(
+                bucket_name=self._config.BATCH_JOBS_BUCKET_NAME,
+                object_name=input_object_name,
+                data=io.BytesIO(data),
+                length=len(data),
+                content_type="application/jsonl",
+            )
+            job.batch_id = await self._batch_client.submit(input_object_name, data)
+            job.status = "submitted"
+        await self._registry.save(job)
+        return job
+
+    async def poll_job(self, job_id: str) -> BatchJob | None:
+        job = await self._registry.get(job_id)
+        if job is None or job.status in BATCH_FINAL_STATUSES:
+            return job
+        # Results are applied once: concurrent polls of the API and the command get the job as it was before.
+        async with self._registry.lock(job_id) as locked:
+            if not locked:
+                return job
+            job = await self._registry.get(job_id)
+            if job is None or job.status in BATCH_FINAL_STATUSES:
+                return job
+            status = await self._batch_client.get_status(job.batch_id)
+            if status == "completed":
+                await self._apply_results(job, await self._batch_client.get_results(job.batch_id))
+            elif status in BATCH_FINAL_STATUSES:
+                job.failed_candidate_ids = job.candidate_ids
+            job.status = status
+            await self._registry.save(job)
+        return job
+
+    async def wait_for_job(self, job_id: str) -> BatchJob | None:
+        job = await self.poll_job(job_id)
+        while job is not None and job.status not in BATCH_FINAL_STATUSES:
+            await asyncio.sleep(float(self._config.BATCH_JOBS_POLL_INTERVAL))
+            job = await self.poll_job(job_id)
+        return job
+
+    def _is_ready_for_job(self, kind: str, candidate_info: SharedContextCandidateFullInfo) -> bool:
+        if kind == self.EVALUATION:
+            return bool(candidate_info.questions and candidate_info.candidate_response)
+        return bool(candidate_info.scores)
+
+    async def _apply_results(self, job: BatchJob, results: list[dict]):
+        contents = {}
+        for result in results:
+            response = result.get("response") or {}
+            if result.get("error") is None and response.get("status_code") == 200:
+                contents[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        submitted_candidate_ids = [
+            candidate_id for candidate_id in job.candidate_ids if candidate_id not in job.failed_candidate_ids
+        ]
+        candidates_scores_and_comments = []
+        for candidate_info in await self._shared_context.get_full_candidates_info(submitted_candidate_ids):
+            questions_count = len(candidate_info.questions)
+            try:
+                content = contents[candidate_info.candidate_id]
+                if job.kind == self.EVALUATION:
+                    result = self._evaluation_agent.parse_evaluation(content, questions_count)
+                    candidates_scores_and_comments.append((candidate_info, result))
+                else:
+                    result = self._validation_agent.parse_validation(content, questions_count)
+                    await self._validation_service.complete_validation(
+                        candidate_info.candidate_id, candidate_info, result,
+                    )
+            except Exception:
+                job.failed_candidate_ids.append(candidate_info.candidate_id)
+        job.failed_candidate_ids.extend(
+            await self._shared_context.save_many_responses_scores_and_comments(candidates_scores_and_comments),
+        )
+
+
+class JobsService:
+    """
+    Runs the work of the interview endpoints as asynchronous jobs, so slow LLM calls don't hold API connections.
+    Results of the jobs have the shape of the responses of the synchronous endpoints.
+    """
+
+    QUESTIONS = "questions"
+    EVALUATION = "evaluation"
+    VALIDATION = "validation"
+
+    def __init__(
+            self,
+            config: Config,
+            job_queue: JobQueue,
+            generate_questions_service: GenerateQuestionsService,
+            evaluate_responses_service: EvaluateResponsesService,
+            validation_service: ValidationService,
+    ):
+        self._config = config
+        self._job_queue = job_queue
+        self._generate_questions_service = generate_questions_service
+        self._evaluate_responses_service = evaluate_responses_service
+        self._validation_service = validation_service
+        self._handlers = {
+            self.QUESTIONS: self._generate_questions,
+            self.EVALUATION: self._evaluate_response,
+            self.VALIDATION: self._validate,
+        }
+
+    async def submit(self, queue: str, callback_url: str | None, **payload) -> Job:
+        return await self._job_queue.enqueue(queue, payload, callback_url)
+
+    async def get_job(self, job_id: str) -> Job | None:
+        return await self._job_queue.get(job_id)
+
+    async def run_workers(self, queues: list[str]):
+        """Runs the jobs of the queues with `JOBS_<QUEUE>_CONCURRENCY` workers per queue."""
+        await asyncio.gather(
+            *(
+                self._job_queue.run_worker(
+                    queue,
+                    lambda payload, queue=queue: self._handlers[queue](**payload),
+                    int(getattr(self._config, f"JOBS_{queue.upper()}_CONCURRENCY")),
+                )
+                for queue in queues
+            )
+        )
+
+    async def _generate_questions(self, first_name: str, second_name: str, job_title: str) -> dict:
+        result = await self._generate_questions_service.generate_questions(first_name, second_name, job_title)
+        return asdict(result)
+
+    async def _evaluate_response(self, candidate_id: str, response: str) -> dict:
+        return {"scores": await self._evaluate_responses_service.evaluate_response(candidate_id, response)}
+
+    async def _validate(self, candidate_id: str) -> dict:
+        result = await self._validation_service.validate(candidate_id)
+        return {
+            "questions": result.questions,
+            "response": result.candidate_response,
+            "scores": result.scores,
+            "comments": result.response_comments,
+            "feedback": result.feedback,
+        }
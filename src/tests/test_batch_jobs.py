@@ -0,0 +1,136 @@
+"""
+Offline batch flow: jobs submitted to the fake Batch API, polled from other workers and applied once.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import asyncio
+import io
+
+import fakeredis
+from miniopy_async.error import S3Error
+
+from config import Config
+from infrastructure.agents import ResponseEvaluationAgent, ValidationAgent
+from infrastructure.batch_jobs import BatchJobsRegistry, FakeBatchClient
+from infrastructure.evaluation_cache import EvaluationCache
+from infrastructure.files_storage import FilesStorage
+from infrastructure.llm_backends import FakeLLMBackend
+from infrastructure.llm_scheduler import LLMScheduler
+from infrastructure.persistence_queue import PersistenceQueue
+from infrastructure.prompts import Tokenizer
+from infrastructure.redis_shards import SingleRedisShards
+from infrastructure.session_archive import SessionArchive
+from infrastructure.shared_context import SharedContext
+from infrastructure.single_flight import SingleFlight
+from infrastructure.speculation import Speculation
+from services import BatchJobsService, ValidationService
+
+CONFIG = Config(
+    OPENAI_API_KEY="test",
+    REDIS_HOST_URL="redis://localhost:6379/0",
+    MINIO_URL="localhost:9000",
+    MINIO_ACCESS_KEY="test",
+    MINIO_SECRET_KEY="test",
+    BATCH_JOBS_BACKEND="fake",
+    BATCH_JOBS_FAKE_LATENCY=0,
+)
+
+
+class InMemoryFilesStorage(FilesStorage):
+    def __init__(self):
+        self.objects: dict[tuple[str, str], bytes] = {}
+
+    async def ensure_buckets(self, bucket_names: list[str]):
+        pass
+
+    async def put_object(self, bucket_name: str, object_name: str, data: io.BytesIO, length: int, content_type: str):
+        self.objects[(bucket_name, object_name)] = data.read()
+        return self.get_object_url(bucket_name, object_name)
+
+    def get_object_url(self, bucket_name: str, object_name: str) -> str:
+        return f"memory://{bucket_name}/{object_name}"
+
+    async def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0) -> bytes:
+        if (bucket_name, object_name) not in self.objects:
+            raise S3Error("NoSuchKey", "Object does not exist", object_name, "", "", None, bucket_name, object_name)
+        return self.objects[(bucket_name, object_name)]
+
+
+def create_batch_jobs_service(redis_server: fakeredis.FakeServer, files_storage: FilesStorage) -> BatchJobsService:
+    """Services of one worker, all workers share the Redis server and the files storage."""
+    redis_connection = fakeredis.FakeAsyncRedis(server=redis_server)
+    shared_context = SharedContext(CONFIG, SingleRedisShards(redis_connection))
+    backend = FakeLLMBackend(CONFIG, LLMScheduler(CONFIG))
+    evaluation_agent = ResponseEvaluationAgent(backend, CONFIG.LLM_RESPONSE_EVALUATION_MODEL, Tokenizer(None), 12000)
+    validation_agent = ValidationAgent(backend, CONFIG.LLM_VALIDATION_MODEL, Tokenizer(None), 12000)
+    single_flight = SingleFlight(CONFIG, redis_connection)
+    validation_service = ValidationService(
+        CONFIG,
+        shared_context,
+        validation_agent,
+        files_storage,
+        single_flight,
+        PersistenceQueue(CONFIG, redis_connection, files_storage),
+        SessionArchive(CONFIG, redis_connection, files_storage),
+        EvaluationCache(CONFIG, redis_connection),
+        Speculation(CONFIG, single_flight),
+    )
+    return BatchJobsService(
+        CONFIG,
+        shared_context,
+        files_storage,
+        FakeBatchClient(CONFIG, files_storage),
+        BatchJobsRegistry(CONFIG, redis_connection),
+        evaluation_agent,
+        validation_agent,
+        validation_service,
+    )
+
+
+async def save_candidates(redis_server: fakeredis.FakeServer, candidate_ids: list[str]) -> SharedContext:
+    shared_context = SharedContext(CONFIG, SingleRedisShards(fakeredis.FakeAsyncRedis(server=redis_server)))
+    for candidate_id in candidate_ids:
+        await shared_context.save_candidate_info_and_questions(
+            candidate_id, "Jane", "Doe", "Backend developer", ["What is a deadlock?", "What is an index?"],
+        )
+        candidate_info = await shared_context.get_full_candidate_info(candidate_id)
+        await shared_context.save_response_scores_and_comments(
+            candidate_info, "Threads waiting on each other. A lookup tree.", [],
+        )
+    return shared_context
+
+
+def test_fake_batch_jobs_are_polled_from_other_workers_and_applied_once():
+    async def run():
+        redis_server = fakeredis.FakeServer()
+        files_storage = InMemoryFilesStorage()
+        shared_context = await save_candidates(redis_server, ["first", "second"])
+        submitting_worker = create_batch_jobs_service(redis_server, files_storage)
+        polling_workers = [create_batch_jobs_service(redis_server, files_storage) for _ in range(3)]
+
+        job = await submitting_worker.create_job(BatchJobsService.EVALUATION, ["first", "second", "missing"])
+        assert job.status == "submitted"
+        assert job.failed_candidate_ids == ["missing"]
+        job = await polling_workers[0].wait_for_job(job.job_id)
+        assert job.status == "completed"
+        assert job.failed_candidate_ids == ["missing"]
+        for candidate_info in await shared_context.get_full_candidates_info(["first", "second"]):
+            assert len(candidate_info.scores) == 2
+            assert all(1 <= score <= 5 for score in candidate_info.scores)
+
+        job = await submitting_worker.create_job(BatchJobsService.VALIDATION, ["first", "second"])
+        jobs = await asyncio.gather(*(worker.poll_job(job.job_id) for worker in polling_workers))
+        assert [job.status for job in jobs].count("completed") == 1
+        job = await submitting_worker.wait_for_job(job.job_id)
+        assert job.status == "completed"
+        assert job.failed_candidate_ids == []
+        # Candidates are persisted once each, by the only poll which applied the results.
+        persisted = [
+            object_name for bucket_name, object_name in files_storage.objects
+            if bucket_name == CONFIG.PERSISTENT_DATA_BUCKET_NAME
+        ]
+        assert len(persisted) == 2
+        for candidate_info in await shared_context.get_full_candidates_info(["first", "second"]):
+            assert candidate_info.questions == []
+        assert 0 < await fakeredis.FakeAsyncRedis(server=redis_server).ttl(f"batch_job:{job.job_id}")
+
+    asyncio.run(run())
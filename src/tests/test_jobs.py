@@ -0,0 +1,108 @@
+"""
+Job callbacks: URLs of internal hosts or outside the allowlist are rejected, the call goes to the checked address.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import asyncio
+import ipaddress
+import socket
+
+import fakeredis
+import httpx
+import pytest
+
+from config import Config
+from infrastructure.jobs import CallbackURLNotAllowedError, JobQueue, check_callback_url
+
+CONFIG = Config(
+    OPENAI_API_KEY="test",
+    REDIS_HOST_URL="redis://localhost:6379/0",
+    MINIO_URL="localhost:9000",
+    MINIO_ACCESS_KEY="test",
+    MINIO_SECRET_KEY="test",
+    JOBS_BLOCK=0.01,
+)
+PUBLIC_ADDRESS = "93.184.216.34"
+
+
+def resolve_to(*addresses: str):
+    async def getaddrinfo(host, port, type=0, **kwargs):
+        return [
+            (socket.AF_INET6 if ":" in address else socket.AF_INET, type, 0, "", (address, port))
+            for address in addresses
+        ]
+
+    return getaddrinfo
+
+
+@pytest.mark.parametrize(
+    "callback_url",
+    [
+        "https://10.0.0.1/hooks",
+        "https://192.168.1.10/hooks",
+        "https://127.0.0.1/hooks",
+        "https://[::1]/hooks",
+        "https://169.254.169.254/latest/meta-data",
+        "https://[fe80::1]/hooks",
+        "http://93.184.216.34/hooks",
+    ],
+)
+def test_callback_url_of_an_internal_address_is_rejected(callback_url: str):
+    with pytest.raises(CallbackURLNotAllowedError):
+        asyncio.run(check_callback_url(callback_url, []))
+
+
+def test_callback_host_resolving_to_any_internal_address_is_rejected(monkeypatch: pytest.MonkeyPatch):
+    async def run():
+        monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", resolve_to(PUBLIC_ADDRESS, "10.0.0.1"))
+        with pytest.raises(CallbackURLNotAllowedError):
+            await check_callback_url("https://hooks.example.com/jobs", [])
+
+    asyncio.run(run())
+
+
+def test_callback_url_outside_the_allowlist_is_rejected(monkeypatch: pytest.MonkeyPatch):
+    async def run():
+        monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", resolve_to(PUBLIC_ADDRESS))
+        allowed_urls = ["https://hooks.example.com/jobs", "callbacks.example.org"]
+        address = await check_callback_url("https://hooks.example.com/jobs/done", allowed_urls)
+        assert address == ipaddress.ip_address(PUBLIC_ADDRESS)
+        await check_callback_url("https://callbacks.example.org/any", allowed_urls)
+        for callback_url in (
+            "https://hooks.example.com/jobsevil",
+            "https://hooks.example.com.evil/jobs/done",
+            "https://other.example.org/jobs",
+        ):
+            with pytest.raises(CallbackURLNotAllowedError):
+                await check_callback_url(callback_url, allowed_urls)
+
+    asyncio.run(run())
+
+
+def test_webhook_is_sent_to_the_checked_address_under_the_callback_host(monkeypatch: pytest.MonkeyPatch):
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200)
+
+    client = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx, "AsyncClient", lambda **kwargs: client(transport=httpx.MockTransport(handle), **kwargs),
+    )
+
+    async def run():
+        monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", resolve_to(PUBLIC_ADDRESS))
+        job_queue = JobQueue(CONFIG, fakeredis.FakeAsyncRedis())
+        job = await job_queue.enqueue("questions", {}, "https://hooks.example.com/jobs")
+        worker = asyncio.create_task(job_queue.run_worker("questions", lambda payload: asyncio.sleep(0), 1))
+        while (await job_queue.get(job.job_id)).status != "succeeded" or not requests:
+            await asyncio.sleep(0.01)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        await job_queue.close()
+
+    asyncio.run(run())
+    assert len(requests) == 1
+    assert requests[0].url.host == PUBLIC_ADDRESS
+    assert requests[0].headers["Host"] == "hooks.example.com"
+    assert requests[0].extensions["sni_hostname"] == "hooks.example.com"
@@ -0,0 +1,40 @@
+"""
+Streamed JSON: items of the nested arrays are returned as soon as they're complete, whatever the chunk boundaries.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import orjson
+
+from infrastructure.json_stream import JSONArrayItemsParser
+
+SCORES = {"scores": [{"score": 4, "comment": "Uses [locks], {ok}, \"quoted\"."}, {"score": 2, "comment": "Vague\\"}]}
+
+
+def feed_in_chunks(parser: JSONArrayItemsParser, text: str, chunk_size: int) -> list[list]:
+    return [parser.feed(text[start:start + chunk_size]) for start in range(0, len(text), chunk_size)]
+
+
+def test_items_are_returned_once_complete_for_any_chunk_size():
+    text = orjson.dumps(SCORES).decode()
+    for chunk_size in (1, 2, 7, len(text)):
+        parser = JSONArrayItemsParser(items_depth=2)
+        items = [item for chunk_items in feed_in_chunks(parser, text, chunk_size) for item in chunk_items]
+        assert items == SCORES["scores"]
+        assert orjson.loads(parser.text) == SCORES
+
+
+def test_item_is_returned_with_the_chunk_completing_it():
+    parser = JSONArrayItemsParser(items_depth=2)
+    assert parser.feed('{"scores": [{"score": 4, "comment": "Good."}') == []
+    assert parser.feed(", ") == [{"score": 4, "comment": "Good."}]
+    assert parser.feed('{"score": 2, "comment": "Vague."}]}') == [{"score": 2, "comment": "Vague."}]
+
+
+def test_top_level_array_items_and_invalid_items():
+    parser = JSONArrayItemsParser()
+    assert parser.feed('[1, "two", [3], {"four": 4}, nope, 6]') == [1, "two", [3], {"four": 4}, 6]
+
+
+def test_arrays_at_other_depths_are_not_split():
+    parser = JSONArrayItemsParser(items_depth=2)
+    assert parser.feed('{"questions": [["a", "b"], ["c"]], "scores": [1, 2]}') == [["a", "b"], ["c"], 1, 2]
+    assert JSONArrayItemsParser(items_depth=2).feed('[{"scores": [1, 2]}]') == []
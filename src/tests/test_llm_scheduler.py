@@ -0,0 +1,126 @@
+"""
+LLM scheduler: AIMD concurrency limit, dispatch by priority and slots of requests cancelled while being granted.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from config import Config
+from infrastructure.llm_scheduler import LLMScheduler, Priority
+
+CONFIG = Config(
+    OPENAI_API_KEY="test",
+    REDIS_HOST_URL="redis://localhost:6379/0",
+    MINIO_URL="localhost:9000",
+    MINIO_ACCESS_KEY="test",
+    MINIO_SECRET_KEY="test",
+    LLM_SCHEDULER_INITIAL_CONCURRENCY=4,
+    LLM_SCHEDULER_MIN_CONCURRENCY=1,
+    LLM_SCHEDULER_MAX_CONCURRENCY=5,
+    LLM_SCHEDULER_BACKOFF_RATIO=0.5,
+    LLM_SCHEDULER_MAX_RETRIES=0,
+)
+
+
+class RawResponse:
+    headers = {}
+
+    def __init__(self, result: str):
+        self._result = result
+
+    def parse(self) -> str:
+        return self._result
+
+
+def respond(result: str = "ok"):
+    async def request() -> RawResponse:
+        return RawResponse(result)
+
+    return request
+
+
+def throttle():
+    async def request():
+        response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+        raise openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+    return request
+
+
+def test_limit_grows_additively_and_is_cut_once_per_overload():
+    async def run():
+        scheduler = LLMScheduler(CONFIG)
+        for _ in range(4):
+            await scheduler.run(Priority.STANDARD, 1, respond())
+        assert scheduler.get_stats().concurrency_limit == pytest.approx(4.92, 0.001)
+        for _ in range(2):
+            with pytest.raises(openai.RateLimitError):
+                await scheduler.run(Priority.STANDARD, 1, throttle())
+        # The second throttling comes within the latency of the first one, it's the same overload.
+        assert scheduler.get_stats().concurrency_limit == pytest.approx(2.46, 0.001)
+        assert scheduler.get_stats().throttled == 2
+        for _ in range(100):
+            await scheduler.run(Priority.STANDARD, 1, respond())
+        assert scheduler.get_stats().concurrency_limit == CONFIG.LLM_SCHEDULER_MAX_CONCURRENCY
+
+    asyncio.run(run())
+
+
+def test_queued_requests_are_dispatched_by_priority():
+    async def run():
+        scheduler = LLMScheduler(Config(**{**CONFIG.model_dump(), "LLM_SCHEDULER_INITIAL_CONCURRENCY": 1}))
+        release = asyncio.Event()
+        dispatched = []
+
+        async def hold() -> RawResponse:
+            await release.wait()
+            return RawResponse("held")
+
+        def record(name: str):
+            async def request() -> RawResponse:
+                dispatched.append(name)
+                return RawResponse(name)
+
+            return request
+
+        held = asyncio.create_task(scheduler.run(Priority.STANDARD, 1, hold))
+        await asyncio.sleep(0)
+        queued = []
+        for priority in (Priority.BATCH, Priority.STANDARD, Priority.INTERACTIVE, Priority.BATCH):
+            queued.append(asyncio.create_task(scheduler.run(priority, 1, record(f"{priority.name}-{len(queued)}"))))
+            await asyncio.sleep(0)
+        assert scheduler.get_stats().queued == 4
+        release.set()
+        await asyncio.gather(held, *queued)
+        assert dispatched == ["INTERACTIVE-2", "STANDARD-1", "BATCH-0", "BATCH-3"]
+
+    asyncio.run(run())
+
+
+def test_request_cancelled_after_its_slot_was_granted_gives_the_slot_back():
+    async def run():
+        scheduler = LLMScheduler(Config(**{**CONFIG.model_dump(), "LLM_SCHEDULER_INITIAL_CONCURRENCY": 1}))
+        release = asyncio.Event()
+
+        async def hold() -> RawResponse:
+            await release.wait()
+            return RawResponse("held")
+
+        held = asyncio.create_task(scheduler.run(Priority.STANDARD, 1, hold))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(scheduler.run(Priority.STANDARD, 1, respond()))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.sleep(0)
+        # The held request has released its slot to the queued one, which is cancelled before it resumes.
+        assert scheduler.get_stats().queued == 0 and scheduler.get_stats().in_flight == 1
+        cancelled.cancel()
+        await asyncio.gather(held, cancelled, return_exceptions=True)
+        # Depending on the Python version the request either runs in the granted slot or gives it back.
+        assert scheduler.get_stats().in_flight == 0
+        assert await asyncio.wait_for(scheduler.run(Priority.STANDARD, 1, respond("next")), 1) == "next"
+
+    asyncio.run(run())
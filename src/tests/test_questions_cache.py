@@ -0,0 +1,86 @@
+"""
+Questions cache: concurrent requests for one job title share one generated set, saved once by the flight leader.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import asyncio
+
+import fakeredis
+
+from config import Config
+from infrastructure.questions_cache import QuestionsCache, normalize_job_title
+from infrastructure.redis_shards import SingleRedisShards
+from infrastructure.shared_context import SharedContext
+from infrastructure.single_flight import SingleFlight
+from services import GenerateQuestionsService
+
+CONFIG = Config(
+    OPENAI_API_KEY="test",
+    REDIS_HOST_URL="redis://localhost:6379/0",
+    MINIO_URL="localhost:9000",
+    MINIO_ACCESS_KEY="test",
+    MINIO_SECRET_KEY="test",
+    QUESTIONS_CACHE_POOL_SIZE=5,
+)
+
+
+class CountingAgent:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_questions(self, job_title: str) -> list[str]:
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return [f"Question {self.calls} for a {job_title}?"]
+
+
+def create_service(redis_server: fakeredis.FakeServer, agent: CountingAgent) -> GenerateQuestionsService:
+    redis_connection = fakeredis.FakeAsyncRedis(server=redis_server)
+    return GenerateQuestionsService(
+        SharedContext(CONFIG, SingleRedisShards(redis_connection)),
+        agent,
+        QuestionsCache(CONFIG, redis_connection),
+        SingleFlight(CONFIG, redis_connection),
+    )
+
+
+def test_concurrent_callers_save_one_question_set_and_count_one_miss():
+    async def run():
+        redis_server = fakeredis.FakeServer()
+        agent = CountingAgent()
+        services = [create_service(redis_server, agent) for _ in range(4)]
+        results = await asyncio.gather(
+            *(
+                services[i % len(services)].generate_questions("Jane", f"Doe {i}", "Backend developer")
+                for i in range(20)
+            )
+        )
+        assert agent.calls == 1
+        assert len({tuple(result.questions) for result in results}) == 1
+        redis_connection = fakeredis.FakeAsyncRedis(server=redis_server)
+        assert await redis_connection.llen(f"questions_cache:{normalize_job_title('Backend developer')}") == 1
+        stats = await QuestionsCache(CONFIG, redis_connection).get_stats()
+        assert stats.misses == 1
+
+    asyncio.run(run())
+
+
+def test_sequential_callers_fill_the_pool_with_distinct_sets():
+    async def run():
+        redis_server = fakeredis.FakeServer()
+        agent = CountingAgent()
+        service = create_service(redis_server, agent)
+        for i in range(5):
+            await service.generate_questions("Jane", f"Doe {i}", "Backend developer")
+        pool = await fakeredis.FakeAsyncRedis(server=redis_server).lrange("questions_cache:backend developer", 0, -1)
+        assert len(set(pool)) == 5
+        await service.generate_questions("Jane", "Doe 5", "backend dev")
+        assert agent.calls == 5
+
+    asyncio.run(run())
+
+
+def test_normalize_job_title_keeps_different_roles_apart():
+    assert normalize_job_title("Sr. Back-End Dev") == "senior backend developer"
+    assert normalize_job_title("BE engineer") == "backend engineer"
+    assert normalize_job_title("Software Engineer") != normalize_job_title("Software Developer")
+    assert normalize_job_title("developer to be hired") == "developer to be hired"
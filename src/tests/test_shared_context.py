@@ -0,0 +1,146 @@
+"""
+Shared context writes: sessions changed or deleted since they were read are rejected, revisions stay out of records.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import asyncio
+import hashlib
+import json
+
+import fakeredis
+import pytest
+
+from config import Config
+from dto import ResponseEvaluationAgentResult
+from infrastructure.redis_shards import SingleRedisShards
+from infrastructure.shared_context import CandidateKeys, SharedContext, SharedContextConflictError
+
+CONFIG = Config(
+    OPENAI_API_KEY="test",
+    REDIS_HOST_URL="redis://localhost:6379/0",
+    MINIO_URL="localhost:9000",
+    MINIO_ACCESS_KEY="test",
+    MINIO_SECRET_KEY="test",
+)
+CANDIDATE_ID = hashlib.sha256(b"Jane_Doe_Backend developer").hexdigest()
+SCORES_AND_COMMENTS = [ResponseEvaluationAgentResult(score=4, comment="Good answer.")]
+
+
+async def save_candidate(shared_context: SharedContext):
+    await shared_context.save_candidate_info_and_questions(
+        CANDIDATE_ID, "Jane", "Doe", "Backend developer", ["What is a deadlock?"],
+    )
+
+
+def test_write_of_a_session_changed_since_it_was_read_is_rejected():
+    async def run():
+        shared_context = SharedContext(CONFIG, SingleRedisShards(fakeredis.FakeAsyncRedis()))
+        await save_candidate(shared_context)
+        candidate_info = await shared_context.get_full_candidate_info(CANDIDATE_ID)
+        saved = await shared_context.save_response_scores_and_comments(candidate_info, "Answer.", SCORES_AND_COMMENTS)
+        assert saved.revision != candidate_info.revision
+        with pytest.raises(SharedContextConflictError):
+            await shared_context.save_response_scores_and_comments(candidate_info, "Other.", SCORES_AND_COMMENTS)
+        assert (await shared_context.get_full_candidate_info(CANDIDATE_ID)).candidate_response == "Answer."
+        # The saved info carries the new revision, so it can be written again.
+        await shared_context.save_response_scores_and_comments(saved, "Again.", SCORES_AND_COMMENTS)
+
+    asyncio.run(run())
+
+
+def test_write_of_a_session_deleted_since_it_was_read_is_rejected():
+    async def run():
+        shared_context = SharedContext(CONFIG, SingleRedisShards(fakeredis.FakeAsyncRedis()))
+        await save_candidate(shared_context)
+        candidate_info = await shared_context.get_full_candidate_info(CANDIDATE_ID)
+        await shared_context.delete_candidate_info(CANDIDATE_ID)
+        with pytest.raises(SharedContextConflictError):
+            await shared_context.save_response_scores_and_comments(candidate_info, "Answer.", SCORES_AND_COMMENTS)
+        assert (await shared_context.get_full_candidate_info(CANDIDATE_ID)).questions == []
+
+    asyncio.run(run())
+
+
+def test_batch_write_returns_only_the_conflicted_candidates():
+    async def run():
+        shared_context = SharedContext(CONFIG, SingleRedisShards(fakeredis.FakeAsyncRedis()))
+        await save_candidate(shared_context)
+        other_candidate_id = hashlib.sha256(b"other").hexdigest()
+        await shared_context.save_candidate_info_and_questions(
+            other_candidate_id, "John", "Doe", "Tester", ["What is a test?"],
+        )
+        candidates_info = await shared_context.get_full_candidates_info([CANDIDATE_ID, other_candidate_id])
+        await save_candidate(shared_context)
+        conflicted = await shared_context.save_many_responses_scores_and_comments(
+            [(candidate_info, SCORES_AND_COMMENTS) for candidate_info in candidates_info],
+        )
+        assert conflicted == [CANDIDATE_ID]
+        assert (await shared_context.get_full_candidate_info(other_candidate_id)).scores == [4]
+
+    asyncio.run(run())
+
+
+def test_session_read_from_the_fallback_is_saved_unless_moved_in_the_meantime():
+    async def run():
+        fallback_redis_shards = SingleRedisShards(fakeredis.FakeAsyncRedis())
+        await save_candidate(
+            SharedContext(Config(**{**CONFIG.model_dump(), "SHARED_CONTEXT_KEY_PREFIX": "old"}), fallback_redis_shards),
+        )
+        shared_context = SharedContext(
+            Config(**{**CONFIG.model_dump(), "SHARED_CONTEXT_FALLBACK_KEY_PREFIX": "old"}),
+            SingleRedisShards(fakeredis.FakeAsyncRedis()),
+            fallback_redis_shards,
+        )
+        candidate_info = await shared_context.get_full_candidate_info(CANDIDATE_ID)
+        assert candidate_info.questions == ["What is a deadlock?"]
+        await shared_context.save_response_scores_and_comments(candidate_info, "Answer.", SCORES_AND_COMMENTS)
+        assert (await shared_context.get_full_candidate_info(CANDIDATE_ID)).candidate_response == "Answer."
+        # The session is in its new place now, a write based on the fallback read would overwrite it.
+        with pytest.raises(SharedContextConflictError):
+            await shared_context.save_response_scores_and_comments(candidate_info, "Other.", SCORES_AND_COMMENTS)
+
+    asyncio.run(run())
+
+
+def test_revision_is_not_part_of_the_record():
+    async def run():
+        redis_connection = fakeredis.FakeAsyncRedis()
+        shared_context = SharedContext(CONFIG, SingleRedisShards(redis_connection))
+        await save_candidate(shared_context)
+        candidate_info = await shared_context.get_full_candidate_info(CANDIDATE_ID)
+        assert candidate_info.revision
+        assert "revision" not in candidate_info.to_record()
+        assert b"revision" not in await redis_connection.hget(f"{{{CANDIDATE_ID}}}", "record")
+        assert json.loads(json.dumps(candidate_info.to_record()))["candidate_id"] == CANDIDATE_ID
+
+    asyncio.run(run())
+
+
+def test_legacy_session_is_read_from_its_bare_key_and_saved_under_the_hash_tag():
+    async def run():
+        redis_connection = fakeredis.FakeAsyncRedis()
+        await redis_connection.hset(
+            CANDIDATE_ID,
+            mapping={"first_name": "Jane", "job_title": "Backend developer", "questions": '["What is a deadlock?"]'},
+        )
+        shared_context = SharedContext(CONFIG, SingleRedisShards(redis_connection))
+        candidate_info = await shared_context.get_full_candidate_info(CANDIDATE_ID)
+        assert candidate_info.questions == ["What is a deadlock?"]
+        await shared_context.save_response_scores_and_comments(candidate_info, "Answer.", SCORES_AND_COMMENTS)
+        assert await redis_connection.exists(f"{{{CANDIDATE_ID}}}")
+        with pytest.raises(SharedContextConflictError):
+            await shared_context.save_response_scores_and_comments(candidate_info, "Other.", SCORES_AND_COMMENTS)
+        await shared_context.delete_candidate_info(CANDIDATE_ID)
+        assert not await redis_connection.exists(CANDIDATE_ID, f"{{{CANDIDATE_ID}}}")
+
+    asyncio.run(run())
+
+
+def test_candidate_keys_share_the_hash_tag_of_the_session():
+    shared_context = SharedContext(CONFIG, SingleRedisShards(fakeredis.FakeAsyncRedis()))
+    key = shared_context.get_candidate_key(CANDIDATE_ID, "validate_scores:abc")
+    assert key == f"{{{CANDIDATE_ID}}}:validate_scores:abc"
+    keys = CandidateKeys("shared_context")
+    assert keys.get_key(CANDIDATE_ID) == f"shared_context:{{{CANDIDATE_ID}}}"
+    assert keys.get_candidate_id(keys.get_key(CANDIDATE_ID)) == CANDIDATE_ID
+    assert keys.get_candidate_id(keys.get_key(CANDIDATE_ID, "lock")) is None
+    assert CandidateKeys("", legacy=True).get_candidate_id(CANDIDATE_ID) == CANDIDATE_ID
@@ -0,0 +1,145 @@
+"""
+Single flight: concurrent callers from all workers share one call, its result or its error.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import asyncio
+
+import fakeredis
+import pytest
+
+from config import Config
+from infrastructure.single_flight import SingleFlight
+from infrastructure.structured_output import StructuredOutputError
+
+CONFIG = Config(
+    OPENAI_API_KEY="test",
+    REDIS_HOST_URL="redis://localhost:6379/0",
+    MINIO_URL="localhost:9000",
+    MINIO_ACCESS_KEY="test",
+    MINIO_SECRET_KEY="test",
+    SINGLE_FLIGHT_LOCK_TIMEOUT=1,
+)
+
+
+class CountingCall:
+    def __init__(self, result: str = "result", error: Exception | None = None, delay: float = 0.05):
+        self.calls = 0
+        self._result = result
+        self._error = error
+        self._delay = delay
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._delay)
+        if self._error is not None:
+            raise self._error
+        return f"{self._result} {self.calls}"
+
+
+def create_workers(count: int) -> list[SingleFlight]:
+    """Single flights of separate workers sharing one Redis server."""
+    redis_server = fakeredis.FakeServer()
+    return [SingleFlight(CONFIG, fakeredis.FakeAsyncRedis(server=redis_server)) for _ in range(count)]
+
+
+def test_concurrent_callers_of_all_workers_share_one_call():
+    async def run():
+        workers = create_workers(3)
+        call = CountingCall()
+        results = await asyncio.gather(*(workers[i % 3].do("key", call) for i in range(12)))
+        assert call.calls == 1
+        assert set(results) == {"result 1"}
+        # The next call of the key runs again, results of finished flights aren't taken.
+        assert await workers[1].do("key", call) == "result 2"
+
+    asyncio.run(run())
+
+
+def test_followers_of_other_workers_get_the_error_of_the_leader():
+    async def run():
+        leader, follower = create_workers(2)
+        call = CountingCall(error=StructuredOutputError("Invalid JSON"))
+        results = await asyncio.gather(
+            leader.do("key", call), follower.do("key", call), return_exceptions=True,
+        )
+        assert call.calls == 1
+        assert all(isinstance(result, StructuredOutputError) for result in results)
+        assert str(results[1]) == "Invalid JSON"
+
+    asyncio.run(run())
+
+
+def test_follower_runs_the_call_itself_when_the_leader_doesnt_publish_in_time():
+    async def run():
+        redis_server = fakeredis.FakeServer()
+        redis_connection = fakeredis.FakeAsyncRedis(server=redis_server)
+        # A leader which crashed holds the lock until it expires and never publishes a result.
+        await redis_connection.set("single_flight:lock:key", "crashed", ex=60)
+        call = CountingCall()
+        started_at = asyncio.get_running_loop().time()
+        assert await SingleFlight(CONFIG, redis_connection).do("key", call) == "result 1"
+        assert asyncio.get_running_loop().time() - started_at >= CONFIG.SINGLE_FLIGHT_LOCK_TIMEOUT
+        assert call.calls == 1
+
+    asyncio.run(run())
+
+
+def test_call_outlives_a_cancelled_caller():
+    async def run():
+        (worker,) = create_workers(1)
+        call = CountingCall(delay=0.1)
+        cancelled = asyncio.create_task(worker.do("key", call))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(worker.do("key", call))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        assert await waiting == "result 1"
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert call.calls == 1
+
+    asyncio.run(run())
+
+
+def test_speculative_call_is_cancelled_with_its_last_speculative_caller():
+    async def run():
+        (worker,) = create_workers(1)
+        call = CountingCall(delay=0.1)
+        speculation = asyncio.create_task(worker.do("key", call, speculative=True))
+        await asyncio.sleep(0.01)
+        speculation.cancel()
+        await asyncio.gather(speculation, return_exceptions=True)
+        # Nothing runs the key anymore, the next request starts a new call.
+        assert await worker.do("key", call) == "result 2"
+
+    asyncio.run(run())
+
+
+def test_request_joining_a_speculative_call_keeps_it_running():
+    async def run():
+        (worker,) = create_workers(1)
+        call = CountingCall(delay=0.1)
+        speculation = asyncio.create_task(worker.do("key", call, speculative=True))
+        await asyncio.sleep(0.01)
+        request = asyncio.create_task(worker.do("key", call))
+        await asyncio.sleep(0.01)
+        speculation.cancel()
+        assert await request == "result 1"
+        assert call.calls == 1
+
+    asyncio.run(run())
+
+
+def test_follower_of_a_cancelled_speculative_leader_runs_the_call_itself():
+    async def run():
+        leader, follower = create_workers(2)
+        call = CountingCall(delay=0.1)
+        speculation = asyncio.create_task(leader.do("key", call, speculative=True))
+        await asyncio.sleep(0.01)
+        request = asyncio.create_task(follower.do("key", call))
+        await asyncio.sleep(0.01)
+        speculation.cancel()
+        assert await request == "result 2"
+        assert call.calls == 2
+
+    asyncio.run(run())
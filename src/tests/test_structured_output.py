@@ -0,0 +1,45 @@
+"""
+Structured output: JSON of LLMs broken by code fences, prose or the tokens limit is repaired before validation.
+Run from the `src` directory: `python -m pytest tests`.
+"""
+import orjson
+import pytest
+
+from infrastructure.agents import RESPONSE_EVALUATION_OUTPUT
+from infrastructure.structured_output import StructuredOutputError, parse_structured_output, repair_json
+
+SCORES = {"scores": [{"score": 4, "comment": "Good."}, {"score": 2, "comment": "Vague."}]}
+
+
+@pytest.mark.parametrize(
+    ("content", "expected"),
+    [
+        ('```json\n{"a": 1}\n```', {"a": 1}),
+        ('```\n[1, 2]\n```', [1, 2]),
+        ('Here is the result: {"a": [1, 2]} Hope it helps!', {"a": [1, 2]}),
+        ('{"a": "b}"} trailing', {"a": "b}"}),
+        ('{"a": [1, 2', {"a": [1, 2]}),
+        ('{"a": [1, 2,', {"a": [1, 2]}),
+        ('{"a": "cut', {"a": "cut"}),
+        ('{"a": [{"b": 1}, {"b": 2, "c": "x\\"', {"a": [{"b": 1}, {"b": 2, "c": 'x"'}]}),
+        ('{"a": [{"b": 1}, {"b": ', {"a": [{"b": 1}]}),
+    ],
+)
+def test_broken_json_is_repaired(content: str, expected):
+    assert orjson.loads(repair_json(content)) == expected
+
+
+def test_valid_output_isnt_marked_as_repaired():
+    assert parse_structured_output(orjson.dumps(SCORES).decode(), RESPONSE_EVALUATION_OUTPUT) == (SCORES, False)
+
+
+def test_repaired_output_is_validated_and_marked():
+    content = f"```json\n{orjson.dumps(SCORES).decode()}\n```"
+    assert parse_structured_output(content, RESPONSE_EVALUATION_OUTPUT) == (SCORES, True)
+
+
+def test_output_of_another_shape_isnt_repaired_into_one():
+    with pytest.raises(StructuredOutputError, match="scores.0.score"):
+        parse_structured_output('{"scores": [{"score": "high", "comment": "Good."}]}', RESPONSE_EVALUATION_OUTPUT)
+    with pytest.raises(StructuredOutputError, match="Invalid JSON"):
+        parse_structured_output("I can't evaluate this response.", RESPONSE_EVALUATION_OUTPUT)